@@ -0,0 +1,88 @@
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from repository.util.function_bundle import ALWAYS_EXCLUDED, handler_closure
+from tests.lambda_loader import SHARED_LAYER_PATH, functions_path
+
+'''
+CODE BUNDLE BENCHMARK
+Zips the asset of every function twice, the whole functions directory (before)
+and the handler closure (after), and prints the package size and the cold
+start of each: a fresh interpreter unzips the package and imports the handler
+module, with the shared layer on the path. Median over --runs starts.
+
+    python -m benchmarks.bench_bundles --runs 5
+'''
+
+FUNCTIONS = [
+    ("reception_modeling_zone_stack", "lambda_checkin_function"),
+    ("reception_modeling_zone_stack", "lambda_ocr_function"),
+    ("reception_modeling_zone_stack", "lambda_ocr_pages"),
+    ("reception_modeling_zone_stack", "lambda_modeling_function"),
+    ("comformed_zone_stack", "compaction_function"),
+    ("neptune_stack", "digest_function")
+]
+
+COLD_START = '''
+import sys, time, zipfile
+start = time.perf_counter()
+zipfile.ZipFile(sys.argv[1]).extractall(sys.argv[2])
+sys.path[:0] = [sys.argv[2], sys.argv[3]]
+__import__(sys.argv[4])
+print(time.perf_counter() - start)
+'''
+
+
+def package(path, entries=None):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for directory, names, files in os.walk(path):
+            names[:] = [name for name in names if name not in ALWAYS_EXCLUDED]
+            for name in files:
+                file_path = os.path.join(directory, name)
+                relative = os.path.relpath(file_path, path)
+                if name.endswith('.pyc') or (entries is not None and relative.split(os.sep)[0] not in entries):
+                    continue
+                archive.write(file_path, relative)
+    return buffer.getvalue()
+
+
+def cold_start(archive, module_name, runs):
+    timings = []
+    with tempfile.TemporaryDirectory() as workdir:
+        zip_path = os.path.join(workdir, 'package.zip')
+        with open(zip_path, 'wb') as output:
+            output.write(archive)
+        for run in range(runs):
+            target = os.path.join(workdir, f"task-{run}")
+            result = subprocess.run(
+                [sys.executable, '-B', '-c', COLD_START, zip_path, target, SHARED_LAYER_PATH, module_name],
+                check=True, capture_output=True, text=True, env={**os.environ, 'CONFORMED_BUCKET_NAME': 'bench'}
+            )
+            timings.append(float(result.stdout))
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'function':<26} {'before KB':>10} {'after KB':>9} {'before ms':>10} {'after ms':>9}")
+    for stack_name, function_name in FUNCTIONS:
+        path = functions_path(stack_name)
+        before = package(path)
+        after = package(path, handler_closure(path, function_name))
+        print(f"{function_name:<26} {len(before) / 1024:>10.1f} {len(after) / 1024:>9.1f} "
+              f"{cold_start(before, function_name, args.runs) * 1000:>10.1f} "
+              f"{cold_start(after, function_name, args.runs) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
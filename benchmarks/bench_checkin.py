@@ -0,0 +1,52 @@
+import argparse
+import time
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+'''
+CHECK-IN BENCHMARK
+Runs the check-in engine against the local S3 stand-in and prints records/sec
+for each combination of batch size and pool width.
+
+    python -m benchmarks.bench_checkin --batch-sizes 10 100 1000 --workers 1 8 32
+'''
+
+BUCKET = 'bench-receptionzone'
+
+
+def run(engine, batch_size, workers, latency):
+    s3 = LocalS3Client()
+    records = []
+    for i in range(batch_size):
+        key = f"input_data/2023/itd/doc-{i:06d}.pdf"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'%PDF-1.7')
+        records.append(engine.CheckinRecord(bucket=BUCKET, key=key))
+
+    s3.latency = latency
+    start = time.perf_counter()
+    results = engine.copy_records(s3, records, 'input_data', 'raw_data', max_workers=workers)
+    elapsed = time.perf_counter() - start
+
+    assert engine.summarize(results)['copied'] == batch_size
+    return batch_size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16, 32, 64])
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='simulated CopyObject round trip')
+    args = parser.parse_args()
+
+    engine = load_function_module('reception_modeling_zone_stack', 'checkin_engine')
+
+    print(f"{'batch':>8} {'workers':>8} {'records/sec':>12}")
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            rate = run(engine, batch_size, workers, args.latency_ms / 1000.0)
+            print(f"{batch_size:>8} {workers:>8} {rate:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+from tests.fakes.local_sparql import LocalSparqlServer
+from tests.lambda_loader import load_function_module
+
+'''
+SPARQL WRITER BENCHMARK
+Writes synthetic triples to the local SPARQL endpoint stand-in and prints
+triples/sec for each batch size (triples per INSERT DATA request), over one
+keep-alive connection.
+
+    python -m benchmarks.bench_digest --triples 20000 --batch-sizes 1 10 100 1000 10000
+'''
+
+
+def synthetic_triples(count):
+    return [(f"<urn:project:document/{i // 5:064x}>", f"<urn:project:property{i % 5}>", f'"value {i}"')
+            for i in range(count)]
+
+
+def run(sparql_writer, neptune_client, port, triples, batch_size):
+    session = neptune_client.HttpSession('127.0.0.1', port, use_tls=False)
+    writer = sparql_writer.SparqlWriter(session, max_bytes=1 << 30, max_triples=batch_size)
+    start = time.perf_counter()
+    stats = writer.insert(triples)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return stats['triples'] / elapsed, stats['requests']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--triples', type=int, default=20000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    sparql_writer = load_function_module('neptune_stack', 'sparql_writer')
+    neptune_client = load_function_module('neptune_stack', 'neptune_client')
+    triples = synthetic_triples(args.triples)
+
+    print(f"{'batch':>8} {'requests':>9} {'triples/sec':>12}")
+    with LocalSparqlServer() as server:
+        for batch_size in args.batch_sizes:
+            rate, requests = run(sparql_writer, neptune_client, server.port, triples, batch_size)
+            print(f"{batch_size:>8} {requests:>9} {rate:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
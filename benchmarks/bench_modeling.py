@@ -0,0 +1,69 @@
+import argparse
+import json
+import random
+import time
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+'''
+MODELING BENCHMARK
+Feeds synthetic OCR documents through the modeling function against the local
+S3 stand-in and prints documents/sec for each batch size.
+
+    python -m benchmarks.bench_modeling --batch-sizes 1 10 100 1000
+'''
+
+DOCTYPES = ('form4e', 'ebcd', 'itd')
+
+
+def synthetic_document(rng, index, lines):
+    return {
+        'document_type': rng.choice(DOCTYPES),
+        'source': {'bucket': 'reception', 'key': f"raw_data/2023/itd/doc-{index}.pdf"},
+        'content_sha256': f"{index:064x}",
+        'pages': 1 + lines // 40,
+        'blocks': [{'BlockType': 'LINE', 'Text': f"field {i} value {rng.random():.6f}", 'Confidence': 95.0, 'Page': 1 + i // 40}
+                   for i in range(lines)]
+    }
+
+
+def run(modeling, batch_size, lines, rng):
+    s3 = LocalS3Client()
+    modeling.handler_runtime.register_client('s3', s3)
+    records = []
+    for index in range(batch_size):
+        key = f"processed_data/{rng.choice((2022, 2023))}/{rng.choice(DOCTYPES)}/doc-{index}.pdf.json"
+        s3.put_object(Bucket='reception', Key=key, Body=json.dumps(synthetic_document(rng, index, lines)))
+        records.append({'s3': {'bucket': {'name': 'reception'}, 'object': {'key': key}}})
+
+    start = time.perf_counter()
+    response = modeling.handler({'Records': records}, None)
+    elapsed = time.perf_counter() - start
+    return response['documents'] / elapsed, len(response['files'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--lines', type=int, default=120, help='OCR lines per document')
+    args = parser.parse_args()
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit('pyarrow is required (it is provided by the pyarrow dependency layer in AWS)')
+
+    import os
+    os.environ.setdefault('CONFORMED_BUCKET_NAME', 'conformed')
+    modeling = load_function_module('reception_modeling_zone_stack', 'lambda_modeling_function')
+    rng = random.Random(7)
+
+    print(f"{'batch':>8} {'files':>6} {'docs/sec':>10}")
+    for batch_size in args.batch_sizes:
+        rate, files = run(modeling, batch_size, args.lines, rng)
+        print(f"{batch_size:>8} {files:>6} {rate:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,584 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+from collections import deque, namedtuple
+
+from benchmarks.load_generator import synthetic_load
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_events import LocalEventBridgeClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_textract import LocalTextract
+from tests.lambda_loader import load_function_module
+from tools.trace_report import percentile
+
+'''
+PIPELINE EMULATOR BENCHMARK
+Uploads a synthetic load (see load_generator) and runs it through the real
+handlers of the reception and modeling zone, in process, against the local
+S3, DynamoDB, EventBridge and Textract stand-ins. Every object written to the
+bucket is routed by the notification rules of the synthesized
+ReceptionAndModelingZoneStack template: prefix/suffix filters, direct Lambda
+or SQS destinations with the batch size, batching window and receive count of
+their event source. The events check-in publishes for the documents it
+classifies are routed by the EventBridge rules of the template to their
+queues. The functions get the literal environment variables of the template.
+
+Each function has its own queue and `--concurrency` workers (its
+ReservedConcurrentExecutions, or the maximum concurrency of its event source,
+when the template sets one). Textract
+completions invoke the OCR function that owns the document again. The report
+gives docs/sec, the queue wait and run time of every stage and the end-to-end
+latency of the documents, upload to the last invocation that carried their
+trace. With --min-docs-per-sec, --max-p99-ms or --baseline the exit code is 1
+on a regression.
+
+    cdk synth
+    python -m benchmarks.bench_pipeline --documents 500 --rate 50 --log emulator.log \
+        --baseline pipeline-baseline.json
+'''
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STACK_NAME = 'ReceptionAndModelingZoneStack'
+FUNCTIONS_STACK = 'reception_modeling_zone_stack'
+# An asynchronous (S3 or SNS) invocation is tried three times before it is dropped
+DIRECT_MAX_RECEIVES = 3
+RESOURCE_NAMES = {'AWS::S3::Bucket': 'BucketName', 'AWS::DynamoDB::Table': 'TableName'}
+
+# pattern is the EventPattern of an EventBridge rule, None for an S3 notification
+Rule = namedtuple('Rule', ['bucket', 'prefix', 'suffix', 'function', 'queued', 'batch_size', 'batching_window',
+                           'max_receives', 'pattern'], defaults=(None,))
+# name is the deployed function name, several functions can share a handler module
+FunctionSpec = namedtuple('FunctionSpec', ['module', 'environment', 'concurrency', 'name'], defaults=(None,))
+
+
+def find_template(cdk_out, stack_name=STACK_NAME):
+    templates = []
+    for directory, _, files in os.walk(cdk_out):
+        templates.extend(os.path.join(directory, name) for name in files
+                         if name.endswith('.template.json') and stack_name in name)
+    if not templates:
+        raise SystemExit(f"No {stack_name} template under {cdk_out}, run `cdk synth` first")
+    return sorted(templates)[0]
+
+
+'''
+TEMPLATE REFERENCES
+Values are {"Ref": id} or {"Fn::GetAtt": [id, attribute]}, aliases and
+versions (provisioned concurrency) resolve to their function. Only bucket and
+table names resolve to literals, the rest is left to the stand-ins.
+'''
+def _resource_id(value):
+    if isinstance(value, dict):
+        if 'Ref' in value:
+            return value['Ref']
+        if 'Fn::GetAtt' in value:
+            return value['Fn::GetAtt'][0]
+    return None
+
+
+def _function_id(resources, value):
+    resource_id = _resource_id(value)
+    resource = resources.get(resource_id, {})
+    if resource.get('Type') in ('AWS::Lambda::Alias', 'AWS::Lambda::Version'):
+        return _function_id(resources, resource['Properties']['FunctionName'])
+    return resource_id
+
+
+def _literal(resources, value):
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, dict) or 'Ref' not in value:
+        return None
+    resource = resources.get(value['Ref'], {})
+    name = resource.get('Properties', {}).get(RESOURCE_NAMES.get(resource.get('Type'), ''))
+    return name if isinstance(name, str) else None
+
+
+def _key_filters(entry):
+    filters = {rule['Name'].lower(): rule['Value'] for rule in entry.get('Filter', {}).get('Key', {}).get('FilterRules', [])}
+    return filters.get('prefix', ''), filters.get('suffix', '')
+
+
+def _object_created(entry):
+    return any(event.startswith('s3:ObjectCreated:') for event in entry.get('Events', []))
+
+
+# Exact value matching only, the patterns the stacks write
+def pattern_matches(pattern, event):
+    for field, expected in pattern.items():
+        value = event.get(field) if isinstance(event, dict) else None
+        if isinstance(expected, dict):
+            if not pattern_matches(expected, value):
+                return False
+        elif value not in expected:
+            return False
+    return True
+
+
+'''
+READ THE NOTIFICATION AND EVENTBRIDGE RULES AND THE FUNCTIONS THEY INVOKE FROM A TEMPLATE
+Returns (rules, {function logical id: FunctionSpec})
+'''
+def notification_rules(template):
+    resources = template.get('Resources', {})
+
+    queues = {}
+    max_concurrency = {}
+    for resource in resources.values():
+        if resource.get('Type') != 'AWS::Lambda::EventSourceMapping':
+            continue
+        properties = resource['Properties']
+        queue = resources.get(_resource_id(properties['EventSourceArn']), {}).get('Properties', {})
+        queues[_resource_id(properties['EventSourceArn'])] = (
+            _function_id(resources, properties['FunctionName']),
+            properties.get('BatchSize', 10),
+            properties.get('MaximumBatchingWindowInSeconds', 0),
+            queue.get('RedrivePolicy', {}).get('maxReceiveCount', DIRECT_MAX_RECEIVES)
+        )
+        if properties.get('ScalingConfig', {}).get('MaximumConcurrency'):
+            max_concurrency[_function_id(resources, properties['FunctionName'])] = properties['ScalingConfig']['MaximumConcurrency']
+
+    rules = []
+    for resource in resources.values():
+        if resource.get('Type') != 'Custom::S3BucketNotifications':
+            continue
+        bucket = _literal(resources, resource['Properties']['BucketName'])
+        configuration = resource['Properties'].get('NotificationConfiguration', {})
+        for entry in configuration.get('LambdaFunctionConfigurations', []):
+            if _object_created(entry):
+                rules.append(Rule(bucket, *_key_filters(entry), _function_id(resources, entry['LambdaFunctionArn']),
+                                  False, 1, 0, DIRECT_MAX_RECEIVES))
+        for entry in configuration.get('QueueConfigurations', []):
+            if _object_created(entry) and _resource_id(entry['QueueArn']) in queues:
+                function_id, batch_size, batching_window, max_receives = queues[_resource_id(entry['QueueArn'])]
+                rules.append(Rule(bucket, *_key_filters(entry), function_id, True, batch_size, batching_window,
+                                  max_receives))
+
+    for resource in resources.values():
+        if resource.get('Type') != 'AWS::Events::Rule':
+            continue
+        properties = resource['Properties']
+        for target in properties.get('Targets', []):
+            if _resource_id(target['Arn']) in queues:
+                function_id, batch_size, batching_window, max_receives = queues[_resource_id(target['Arn'])]
+                rules.append(Rule(None, '', '', function_id, True, batch_size, batching_window, max_receives,
+                                  properties['EventPattern']))
+
+    functions = {}
+    for rule in rules:
+        properties = resources[rule.function]['Properties']
+        variables = properties.get('Environment', {}).get('Variables', {})
+        environment = {name: _literal(resources, value) for name, value in variables.items()}
+        functions[rule.function] = FunctionSpec(
+            module=properties['Handler'].rsplit('.', 1)[0],
+            environment={name: value for name, value in environment.items() if value is not None},
+            concurrency=properties.get('ReservedConcurrentExecutions') or max_concurrency.get(rule.function),
+            name=_literal(resources, properties.get('FunctionName'))
+        )
+    return rules, functions
+
+
+# The functions of the emulated stack share the environment of the process
+def merged_environment(functions):
+    environment = {}
+    for spec in functions.values():
+        environment.update(spec.environment)
+    return environment
+
+
+'''
+LOCAL STAND-INS WIRED TO THE EMULATOR
+'''
+class NotifyingS3Client(LocalS3Client):
+
+    def __init__(self, on_created, latency=0.0):
+        super().__init__(latency)
+        self.on_created = on_created
+
+    def put_object(self, Bucket, Key, **kwargs):
+        response = super().put_object(Bucket=Bucket, Key=Key, **kwargs)
+        self.on_created(Bucket, Key)
+        return response
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        response = super().copy_object(Bucket=Bucket, Key=Key, CopySource=CopySource, **kwargs)
+        self.on_created(Bucket, Key)
+        return response
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        response = super().complete_multipart_upload(Bucket=Bucket, Key=Key, UploadId=UploadId,
+                                                     MultipartUpload=MultipartUpload, **kwargs)
+        self.on_created(Bucket, Key)
+        return response
+
+
+class LocalTextractClient:
+
+    def __init__(self, textract, latency=0.0):
+        self.textract = textract
+        self.latency = latency
+
+    def analyze_document(self, Document, **kwargs):
+        time.sleep(self.latency)
+        location = Document['S3Object']
+        return {'Blocks': self.textract.analyze_document(location['Bucket'], location['Name'])}
+
+    def start_document_analysis(self, DocumentLocation, JobTag=None, **kwargs):
+        location = DocumentLocation['S3Object']
+        return {'JobId': self.textract.start_document_analysis(location['Bucket'], location['Name'], JobTag)}
+
+    def get_document_analysis(self, JobId, **kwargs):
+        status, blocks = self.textract.get_document_analysis(JobId)
+        return {'JobStatus': status, 'Blocks': blocks}
+
+
+class Message:
+
+    def __init__(self, message_id, notification, trace_id, enqueued_at):
+        self.message_id = message_id
+        self.notification = notification
+        self.trace_id = trace_id
+        self.enqueued_at = enqueued_at
+        self.receives = 0
+
+
+class StageQueue:
+
+    def __init__(self, name, handler, rule, concurrency):
+        self.name = name
+        self.handler = handler
+        self.rule = rule
+        self.concurrency = concurrency
+        self.messages = deque()
+        self.condition = threading.Condition()
+        self.waits = []
+        self.durations = []
+        self.invocations = 0
+        self.records = 0
+        self.errors = 0
+        self.retries = 0
+        self.dead_letters = 0
+
+    def put(self, message):
+        with self.condition:
+            self.messages.append(message)
+            self.condition.notify()
+
+    '''
+    NEXT BATCH, None ONCE THE EMULATOR STOPS
+    Like an event source mapping, a queued stage waits up to the batching
+    window (scaled) for a full batch
+    '''
+    def take(self, stopped, window_scale=1.0):
+        with self.condition:
+            while True:
+                while not self.messages:
+                    if stopped.is_set():
+                        return None
+                    self.condition.wait(0.05)
+                deadline = self.messages[0].enqueued_at + self.rule.batching_window * window_scale
+                while 0 < len(self.messages) < self.rule.batch_size and time.time() < deadline:
+                    self.condition.wait(max(0.001, deadline - time.time()))
+                if self.messages:
+                    return [self.messages.popleft() for _ in range(min(self.rule.batch_size, len(self.messages)))]
+
+    def summary(self):
+        def ms(values, q):
+            value = percentile(values, q)
+            return None if value is None else round(value * 1000, 1)
+        return {
+            'invocations': self.invocations,
+            'records': self.records,
+            'errors': self.errors,
+            'retries': self.retries,
+            'dead_letters': self.dead_letters,
+            'wait_p50_ms': ms(self.waits, 50),
+            'wait_p99_ms': ms(self.waits, 99),
+            'run_p50_ms': ms(self.durations, 50),
+            'run_p99_ms': ms(self.durations, 99)
+        }
+
+
+class PipelineEmulator:
+
+    def __init__(self, rules, functions, concurrency=10, s3_latency=0.0, textract_latency=0.0,
+                 textract_job_seconds=0.0, window_scale=1.0):
+        self.rules = rules
+        self.window_scale = window_scale
+        self.textract_job_seconds = textract_job_seconds
+        self.s3 = NotifyingS3Client(self.route, latency=s3_latency)
+        self.textract = LocalTextract(self.s3)
+
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._ids = itertools.count(1)
+        self._outstanding = 0
+        # (bucket, key) of a routed document -> the function it was routed to
+        self._owners = {}
+        self.trace_starts = {}
+        self.trace_ends = {}
+
+        self.stages = {}
+        self.completion_stages = {}
+        for function_id, spec in functions.items():
+            module = load_function_module(FUNCTIONS_STACK, spec.module)
+            trigger = next(rule for rule in rules if rule.function == function_id)
+            self.stages[function_id] = StageQueue(spec.name or spec.module, module.handler, trigger,
+                                                  spec.concurrency or concurrency)
+            if hasattr(module, 'ocr_engine'):
+                # Engines cached by an earlier run hold its clients
+                module.ocr_engine._engines.clear()
+                self.completion_stages[function_id] = StageQueue(
+                    f"{spec.name or spec.module} (textract)", module.handler,
+                    Rule(None, '', '', function_id, False, 1, 0, DIRECT_MAX_RECEIVES), spec.concurrency or concurrency
+                )
+
+        runtime = load_function_module(FUNCTIONS_STACK, 'handler_runtime')
+        runtime.register_client('s3', self.s3)
+        runtime.register_client('dynamodb', LocalDynamoDBClient())
+        runtime.register_client('events', LocalEventBridgeClient(self.publish))
+        runtime.register_client('textract', LocalTextractClient(self.textract, textract_latency))
+
+    def _match(self, bucket, key):
+        for rule in self.rules:
+            if (rule.pattern is None and rule.bucket in (None, bucket) and key.startswith(rule.prefix)
+                    and key.endswith(rule.suffix)):
+                return rule
+        return None
+
+    def _enqueue(self, stage, notification, trace_id=None):
+        with self._lock:
+            self._outstanding += 1
+            message_id = f"m-{next(self._ids)}"
+        stage.put(Message(message_id, notification, trace_id, time.time()))
+
+    '''
+    S3 OBJECT CREATED -> THE STAGE OF THE MATCHING RULE
+    '''
+    def route(self, bucket, key):
+        metadata = self.s3.metadata(bucket, key)
+        trace_id = metadata.get('trace-id')
+        if trace_id and metadata.get('trace-start'):
+            with self._lock:
+                self.trace_starts.setdefault(trace_id, int(metadata['trace-start']) / 1000)
+        rule = self._match(bucket, key)
+        if rule is None:
+            return
+        self._enqueue(self.stages[rule.function], {'Records': [{
+            'eventSource': 'aws:s3',
+            'eventName': 'ObjectCreated:Put',
+            's3': {
+                'bucket': {'name': bucket},
+                'object': {'key': urllib.parse.quote_plus(key, safe='/'), 'sequencer': f"{next(self._ids):016X}"}
+            }
+        }]}, trace_id)
+
+    '''
+    PUBLISHED EVENT -> THE QUEUES OF THE MATCHING EVENTBRIDGE RULES
+    '''
+    def publish(self, event):
+        detail = event.get('detail') or {}
+        for rule in self.rules:
+            if rule.pattern is not None and pattern_matches(rule.pattern, event):
+                with self._lock:
+                    self._owners[(detail.get('bucket'), detail.get('key'))] = rule.function
+                self._enqueue(self.stages[rule.function], event, detail.get('trace_id'))
+
+    def _owner(self, bucket, key):
+        with self._lock:
+            if (bucket, key) in self._owners:
+                return self._owners[(bucket, key)]
+        return self._match(bucket, key).function
+
+    def _complete_textract_jobs(self):
+        while not self._stopped.wait(0.01):
+            with self._lock:
+                completions = self.textract.finish_jobs(started_before=time.monotonic() - self.textract_job_seconds)
+                for record in completions['Records']:
+                    location = json.loads(record['Sns']['Message'])['DocumentLocation']
+                    function_id = self._owner(location['S3Bucket'], location['S3ObjectName'])
+                    self._enqueue(self.completion_stages[function_id], {'Records': [record]})
+
+    def _work(self, stage):
+        while True:
+            batch = stage.take(self._stopped, self.window_scale)
+            if batch is None:
+                return
+            self._invoke(stage, batch)
+
+    def _invoke(self, stage, batch):
+        if stage.rule.queued:
+            event = {'Records': [{'eventSource': 'aws:sqs', 'messageId': message.message_id,
+                                  'body': json.dumps(message.notification)} for message in batch]}
+        else:
+            event = batch[0].notification
+
+        started = time.time()
+        errored = False
+        try:
+            response = stage.handler(event, None) or {}
+            failed = {item['itemIdentifier'] for item in response.get('batchItemFailures', [])}
+        except Exception:
+            errored = True
+            failed = {message.message_id for message in batch}
+        ended = time.time()
+
+        retries = []
+        with self._lock:
+            stage.invocations += 1
+            stage.errors += int(errored)
+            stage.records += len(batch)
+            stage.durations.append(ended - started)
+            for message in batch:
+                stage.waits.append(started - message.enqueued_at)
+                message.receives += 1
+                if message.message_id in failed and message.receives < stage.rule.max_receives:
+                    stage.retries += 1
+                    message.enqueued_at = ended
+                    retries.append(message)
+                    continue
+                if message.message_id in failed:
+                    stage.dead_letters += 1
+                elif message.trace_id:
+                    self.trace_ends[message.trace_id] = max(self.trace_ends.get(message.trace_id, 0), ended)
+                self._outstanding -= 1
+        for message in retries:
+            stage.put(message)
+
+    def _idle(self):
+        with self._lock:
+            return self._outstanding == 0 and self.textract.running_jobs() == 0
+
+    def run(self, uploads):
+        stages = list(self.stages.values()) + list(self.completion_stages.values())
+        threads = [threading.Thread(target=self._work, args=(stage,), daemon=True)
+                   for stage in stages for _ in range(stage.concurrency)]
+        threads.append(threading.Thread(target=self._complete_textract_jobs, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        started = time.time()
+        documents = 0
+        for upload in uploads:
+            rule = next((rule for rule in self.rules if rule.pattern is None and upload.key.startswith(rule.prefix)), None)
+            if rule is None or rule.bucket is None:
+                raise ValueError(f"No notification rule of the template matches {upload.key}")
+            time.sleep(max(0.0, started + upload.at - time.time()))
+            self.s3.put_object(Bucket=rule.bucket, Key=upload.key, Body=upload.body)
+            documents += 1
+
+        while not self._idle():
+            time.sleep(0.01)
+        self._stopped.set()
+        for thread in threads:
+            thread.join()
+        return self.report(documents, started, time.time())
+
+    def report(self, documents, started, finished):
+        latencies = [end - self.trace_starts[trace_id] for trace_id, end in self.trace_ends.items()
+                     if trace_id in self.trace_starts]
+        last = max(self.trace_ends.values(), default=finished)
+        return {
+            'documents': documents,
+            'completed': len(self.trace_ends),
+            'seconds': round(finished - started, 3),
+            'docs_per_sec': round(len(self.trace_ends) / max(last - started, 1e-9), 2),
+            'end_to_end_p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            'end_to_end_p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+            'stages': {stage.name: stage.summary()
+                       for stage in list(self.stages.values()) + list(self.completion_stages.values())}
+        }
+
+
+'''
+REGRESSION GATE
+Absolute limits, and a baseline result (--save of an earlier run) that
+docs/sec may not fall below and the p99 may not rise above by more than the
+tolerance
+'''
+def regressions(result, min_docs_per_sec=None, max_p99_ms=None, baseline=None, tolerance=0.2):
+    problems = []
+    dead_letters = sum(stage['dead_letters'] for stage in result['stages'].values())
+    if dead_letters:
+        problems.append(f"{dead_letters} messages dead-lettered")
+    p99 = result['end_to_end_p99_ms']
+    if min_docs_per_sec is not None and result['docs_per_sec'] < min_docs_per_sec:
+        problems.append(f"{result['docs_per_sec']} docs/sec, below {min_docs_per_sec}")
+    if max_p99_ms is not None and (p99 is None or p99 > max_p99_ms):
+        problems.append(f"end-to-end p99 {p99} ms, above {max_p99_ms}")
+    if baseline:
+        if result['docs_per_sec'] < baseline['docs_per_sec'] * (1 - tolerance):
+            problems.append(f"{result['docs_per_sec']} docs/sec against {baseline['docs_per_sec']} in the baseline")
+        if p99 is not None and baseline.get('end_to_end_p99_ms') and p99 > baseline['end_to_end_p99_ms'] * (1 + tolerance):
+            problems.append(f"end-to-end p99 {p99} ms against {baseline['end_to_end_p99_ms']} ms in the baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--template', help=f"synthesized template (default: the {STACK_NAME} template under cdk.out)")
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20.0, help='uploads/sec, 0 uploads everything at once')
+    parser.add_argument('--multipage-ratio', type=float, default=0.2)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--concurrency', type=int, default=10, help='workers of a function without reserved concurrency')
+    parser.add_argument('--s3-latency-ms', type=float, default=10.0)
+    parser.add_argument('--textract-ms', type=float, default=300.0, help='synchronous analysis time')
+    parser.add_argument('--textract-job-ms', type=float, default=3000.0, help='asynchronous job time')
+    parser.add_argument('--window-scale', type=float, default=1.0, help='scales the SQS batching windows')
+    parser.add_argument('--log', help='write the handler logs here (python -m tools.trace_report reads them)')
+    parser.add_argument('--save', help='write the result as JSON (a baseline for later runs)')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-docs-per-sec', type=float)
+    parser.add_argument('--max-p99-ms', type=float)
+    args = parser.parse_args()
+
+    with open(args.template or find_template(os.path.join(ROOT_PATH, 'cdk.out'))) as template_file:
+        rules, functions = notification_rules(json.load(template_file))
+    os.environ.update(merged_environment(functions))
+
+    emulator = PipelineEmulator(rules, functions, concurrency=args.concurrency, s3_latency=args.s3_latency_ms / 1000,
+                                textract_latency=args.textract_ms / 1000,
+                                textract_job_seconds=args.textract_job_ms / 1000, window_scale=args.window_scale)
+    uploads = synthetic_load(args.documents, rate=args.rate or None, multipage_ratio=args.multipage_ratio,
+                             duplicate_ratio=args.duplicate_ratio, seed=args.seed)
+    with contextlib.ExitStack() as stack:
+        log = stack.enter_context(open(args.log, 'w')) if args.log else io.StringIO()
+        stack.enter_context(contextlib.redirect_stdout(log))
+        result = emulator.run(uploads)
+
+    print(f"{result['completed']}/{result['documents']} documents in {result['seconds']}s, "
+          f"{result['docs_per_sec']} docs/sec, end-to-end p50 {result['end_to_end_p50_ms']} ms "
+          f"p99 {result['end_to_end_p99_ms']} ms")
+    print(f"{'stage':<36} {'calls':>6} {'records':>8} {'retries':>8} {'wait p50':>9} {'wait p99':>9} "
+          f"{'run p50':>8} {'run p99':>8}")
+    for name, stage in result['stages'].items():
+        print(f"{name:<36} {stage['invocations']:>6} {stage['records']:>8} {stage['retries']:>8} "
+              f"{stage['wait_p50_ms']!s:>9} {stage['wait_p99_ms']!s:>9} {stage['run_p50_ms']!s:>8} {stage['run_p99_ms']!s:>8}")
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    problems = regressions(result, args.min_docs_per_sec, args.max_p99_ms, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import random
+
+from collections import namedtuple
+
+'''
+SYNTHETIC LOAD
+Uploads shaped like the three reception forms, written the way the local
+Textract stand-in reads them: plain text, pages separated by form feeds.
+Single page documents are uploaded as .png (synchronous OCR), multipage ones
+as .pdf (asynchronous Textract jobs). Arrivals follow a Poisson process at
+`rate` documents/sec, or come all at once when no rate is given.
+
+Every document gets its own field values, so no two uploads share a content
+hash unless duplicate_ratio asks for re-uploads of earlier documents.
+'''
+
+DOCTYPES = ('form4e', 'ebcd', 'itd')
+YEARS = (2022, 2023)
+FIELDS = {
+    'form4e': ('VESSEL', 'CFR', 'PORT OF LANDING', 'SPECIES', 'CATCH KG'),
+    'ebcd': ('CATCH DOCUMENT', 'FLAG STATE', 'VESSEL', 'BLUEFIN WEIGHT KG', 'TRAP'),
+    'itd': ('TRANSHIPMENT', 'DONOR VESSEL', 'RECEIVING VESSEL', 'SPECIES', 'QUANTITY KG')
+}
+
+# at is the upload time in seconds from the start of the load
+Upload = namedtuple('Upload', ['at', 'key', 'body'])
+
+
+def document_text(rng, doctype, pages, lines_per_page):
+    fields = FIELDS[doctype]
+    texts = []
+    for page in range(pages):
+        lines = [f"{doctype.upper()} PAGE {page + 1}"]
+        lines.extend(f"{fields[line % len(fields)]}: {rng.randrange(10 ** 8):08d}" for line in range(lines_per_page - 1))
+        texts.append('\n'.join(lines))
+    return '\f'.join(texts).encode('utf-8')
+
+
+def synthetic_load(documents, rate=None, mix=None, multipage_ratio=0.2, max_pages=8, lines_per_page=30,
+                   duplicate_ratio=0.0, years=YEARS, input_prefix='input_data', seed=7):
+    rng = random.Random(seed)
+    weights = [mix.get(doctype, 0) if mix else 1 for doctype in DOCTYPES]
+    at = 0.0
+    uploaded = []
+    for index in range(documents):
+        if uploaded and rng.random() < duplicate_ratio:
+            doctype, year, extension, body = rng.choice(uploaded)
+        else:
+            doctype = rng.choices(DOCTYPES, weights)[0]
+            year = rng.choice(years)
+            pages = rng.randint(2, max(2, max_pages)) if rng.random() < multipage_ratio else 1
+            extension = 'pdf' if pages > 1 else 'png'
+            body = document_text(rng, doctype, pages, lines_per_page)
+            uploaded.append((doctype, year, extension, body))
+        yield Upload(at, f"{input_prefix.strip('/')}/{year}/{doctype}/doc-{index:07d}.{extension}", body)
+        if rate:
+            at += rng.expovariate(rate)
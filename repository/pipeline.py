@@ -1,7 +1,3 @@
-import json
-
-from repository.util import util as _util
-
 from constructs import Construct
 from aws_cdk import (
     Stack,
@@ -13,6 +9,7 @@ from aws_cdk.pipelines import (
     ShellStep
 )
 from repository.stages.dev_stage import DevStage
+from repository.stages.deployment_waves import describe_waves, stack_dependency_graph
 
 class PipelineStack(Stack):
     
@@ -23,12 +20,24 @@ class PipelineStack(Stack):
                 
         environment = properties.get("environment")
 
+        #THE SYNTH FAILS WHEN LOADING THE CONSTRUCT LIBRARIES GOES OVER THE BUDGET
+        #THE IMPORT TIMES ARE TAKEN FROM THE SYNTH ITSELF, THE APP ONLY RUNS ONCE
+        synth_commands = ["cdk synth"]
+        import_budget = properties.get("properties", {}).get("synth_import_budget_seconds")
+        if import_budget is not None:
+            synth_commands = [
+                "PYTHONPROFILEIMPORTTIME=1 cdk synth 2> synth-importtime.log || (tail -n 200 synth-importtime.log; exit 1)",
+                f"python -m tools.synth_profile --report synth-importtime.log --budget-seconds {import_budget}"
+            ]
+
         print("CREATING pipeline for environment: " + environment)
         
         repository=codecommit.Repository.from_repository_name(self, "CodeCommitRepo", "repository")
                 
         pipeline = CodePipeline(self, "Pipeline",
                                 pipeline_name='Pipeline',
+                                #THE DEPENDENCY LAYERS ARE BUILT IN THE LAMBDA BUILD IMAGE DURING THE SYNTH
+                                docker_enabled_for_synth=True,
                                 synth=ShellStep("Synth",
                                                 input=CodePipelineSource.code_commit(
                                                     repository, environment),
@@ -36,12 +45,18 @@ class PipelineStack(Stack):
                                                     "npm install -g aws-cdk",
                                                     "pip install -r requirements.txt"
                                                 ],
-                                                commands=[
-                                                    "cdk synth"
-                                                ],
+                                                commands=synth_commands,
                                                 ),
                                                 role=None)
         
         #Landing Zone stage
-        pipeline.add_stage(DevStage(self,environment))
+        #STACKS OF THE STAGE DEPLOY IN DEPENDENCY ORDER, THE ONES WITHOUT A PATH BETWEEN THEM SIDE BY SIDE
+        #THE WAVES ARE ONLY PRINTED, CDK PIPELINES ORDERS THE STACKS BY THE SAME DEPENDENCIES
+        dev_stage = DevStage(self,environment)
+        pipeline.add_stage(dev_stage)
+
+        stage_stacks = [child for child in dev_stage.node.children if isinstance(child, Stack)]
+        deploy_minutes = properties.get("properties", {}).get("deploy_minutes", {})
+        for line in describe_waves(stack_dependency_graph(stage_stacks), deploy_minutes):
+            print(line)
     
\ No newline at end of file
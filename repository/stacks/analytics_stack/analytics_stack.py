@@ -1,21 +1,13 @@
 from aws_cdk import (
     Stack,
+    aws_cloudwatch as _cloudwatch,
     aws_iam as _iam,
-    aws_lambda as _lambda,
     aws_s3 as _s3,
-    aws_s3_notifications as _s3n,
-    aws_ec2 as _ec2, 
-    aws_ecs as _ecs,
-    aws_ecs_patterns as _ecs_patterns,
-    aws_neptune as _neptune,
-    aws_athena as _athena,
     aws_quicksight as _quicksight
 )
 
 import aws_cdk as core
 
-from repository.util import util as _util
-
 from constructs import Construct
 
 class AnalyticsStack(Stack):
@@ -43,6 +35,9 @@ class AnalyticsStack(Stack):
         ########### CREATE FEDERATED USERS ROLE ##############
         users_role = self.create_federated_userRole()
 
+        ########### DOCUMENT TRACE DASHBOARD ##############
+        self.trace_dashboard = self.create_trace_dashboard()
+
     def create_datasource(self, quicksight_role):
         _quicksight_datasource_name = f"{self.component_prefix}-quicksight-datasource"
 
@@ -97,8 +92,11 @@ class AnalyticsStack(Stack):
                     relational_table=_quicksight.CfnDataSet.RelationalTableProperty(
                         data_source_arn=datasource.attr_arn,
                         input_columns=[
-                            _quicksight.CfnDataSet.InputColumnProperty(name="document.document_name", type="STRING"),
-                            _quicksight.CfnDataSet.InputColumnProperty(name="document.document_flag", type="STRING"),
+                            _quicksight.CfnDataSet.InputColumnProperty(name="document_name", type="STRING"),
+                            _quicksight.CfnDataSet.InputColumnProperty(name="document_flag", type="STRING"),
+                            _quicksight.CfnDataSet.InputColumnProperty(name="page_count", type="INTEGER"),
+                            _quicksight.CfnDataSet.InputColumnProperty(name="mean_confidence", type="DECIMAL"),
+                            _quicksight.CfnDataSet.InputColumnProperty(name="processed_at", type="DATETIME"),
                         ],
                         name="data-12345",
                         # the properties below are optional
@@ -108,6 +106,42 @@ class AnalyticsStack(Stack):
                 )
             })
     
+    # TIME PER STAGE AND END-TO-END, FROM THE SPANS THE FUNCTIONS LOG FOR EVERY DOCUMENT (handler_runtime.trace_span)
+
+    def create_trace_dashboard(self):
+        namespace = "Project/DocumentTrace"
+        stages = ["checkin", "ocr", "modeling", "digest"]
+
+        def metric(name, stage, statistic):
+            return _cloudwatch.Metric(
+                namespace=namespace,
+                metric_name=name,
+                dimensions_map={"Stage": stage},
+                statistic=statistic,
+                period=core.Duration.minutes(5),
+                label=f"{stage} {statistic}"
+            )
+
+        dashboard = _cloudwatch.Dashboard(
+            self,
+            "document-trace-dashboard",
+            dashboard_name=f"{self.component_prefix}-document-trace"
+        )
+        dashboard.add_widgets(
+            _cloudwatch.GraphWidget(title="Time in stage p50 (ms)", width=12,
+                                    left=[metric("StageDuration", stage, "p50") for stage in stages]),
+            _cloudwatch.GraphWidget(title="Time in stage p99 (ms)", width=12,
+                                    left=[metric("StageDuration", stage, "p99") for stage in stages])
+        )
+        dashboard.add_widgets(
+            #ELAPSED AT THE DIGEST STAGE IS THE TIME FROM THE UPLOAD TO THE GRAPH
+            _cloudwatch.GraphWidget(title="End-to-end, upload to graph (ms)", width=12,
+                                    left=[metric("Elapsed", "digest", "p50"), metric("Elapsed", "digest", "p99")]),
+            _cloudwatch.GraphWidget(title="Time since upload at the end of each stage p99 (ms)", width=12,
+                                    left=[metric("Elapsed", stage, "p99") for stage in stages])
+        )
+        return dashboard
+
     # CREATE ROLE FOR GRAPH-EXPLORER ADN QUICKSIGHT
     
     def create_federated_userRole(self):
@@ -1,16 +1,17 @@
 from aws_cdk import (
     Stack,
     aws_iam as _iam,
-    aws_lambda as _lambda,
     aws_s3 as _s3,
-    aws_s3_notifications as _s3n,
     aws_glue_alpha as _glue_alpha,
-    aws_glue as _glue
+    aws_glue as _glue,
+    aws_events as _events,
+    aws_events_targets as _events_targets
 )
 
-import aws_cdk as core
+import os
 
 from repository.util import util as _util
+from repository.util.profiled_function import ProfiledFunction
 
 from constructs import Construct
 
@@ -21,7 +22,10 @@ class ComformedZoneStack(Stack):
 
         #################### INITIALIZER ####################
         self.properties = self.node.try_get_context("properties").get("properties")
+        self.functions_path = os.path.join(os.path.dirname(__file__), self.properties.get("functions_path"))
         self.parquet_data_path = self.properties.get("parquet_data_path")
+        self.compaction_settings = self.properties.get("compaction", {})
+        self.partition_projection = self.properties.get("partition_projection", {})
         self.catalog_name = self.properties.get("catalog_name")
         env_prefix = self.node.try_get_context("properties").get("env_prefix")
         self.component_prefix = f"project-{env_prefix}"
@@ -33,7 +37,8 @@ class ComformedZoneStack(Stack):
             _conformed_zone_bucket_name,
             encryption=_s3.BucketEncryption.KMS_MANAGED,
             bucket_name=_conformed_zone_bucket_name,
-            enforce_ssl=True
+            enforce_ssl=True,
+            event_bridge_enabled=True
         )
         
         _glue_db_name = f"{self.component_prefix}-glue-db"
@@ -46,10 +51,49 @@ class ComformedZoneStack(Stack):
         #GLUE CRAWLER SETUP
         glue_role = self.setup_glue_role()
 
+        #NO CRAWLER: THE SCHEMA IS DEFINED HERE AND THE PARTITIONS ARE PROJECTED
         self.create_table(glue_db, self.conformed_zone_bucket)
 
+        #SCHEDULED COMPACTION OF THE SMALL PARQUET FILES
+        self.compaction_function = self.create_compaction_job()
+
         #################### INITIALIZER (END) ####################
 
+    '''
+    SCHEDULED JOB THAT MERGES THE SMALL FILES OF EVERY PARTITION AND SWAPS THEM IN THROUGH THE PARTITION MANIFESTS
+    '''
+    def create_compaction_job(self):
+        compaction_function = ProfiledFunction(
+            self,
+            "compaction_function",
+            self.functions_path,
+            profile="compaction",
+            layers=[_util.define_dependency_layer(self, "pyarrow")]
+        )
+
+        self.conformed_zone_bucket.grant_read_write(
+            compaction_function,
+            objects_key_pattern=f"{self.parquet_data_path.strip('/')}/*"
+        )
+
+        compaction_function.add_environment("CONFORMED_BUCKET_NAME", self.conformed_zone_bucket.bucket_name)
+        compaction_function.add_environment("PARQUET_DATA_PATH", self.parquet_data_path)
+        compaction_function.add_environment("COMPACTION_TARGET_MB", str(self.compaction_settings.get("target_file_mb", 128)))
+        compaction_function.add_environment("COMPACTION_SMALL_FILE_MB", str(self.compaction_settings.get("small_file_mb", 32)))
+        compaction_function.add_environment("COMPACTION_ORPHAN_GRACE_HOURS", str(self.compaction_settings.get("orphan_grace_hours", 24)))
+        compaction_function.add_environment("PARQUET_ROW_GROUP_MB", str(self.properties.get("parquet_row_group_mb", 128)))
+
+        _compaction_rule_name = f"{self.component_prefix}-events-compaction"
+        _events.Rule(
+            self,
+            _compaction_rule_name,
+            rule_name=_compaction_rule_name,
+            schedule=_events.Schedule.expression(self.compaction_settings.get("schedule", "rate(1 hour)")),
+            targets=[_events_targets.LambdaFunction(compaction_function.live)]
+        )
+
+        return compaction_function
+
     '''
     SETUP ROLE FOR GLUE TO CRAWL THROUGH S3
     '''
@@ -112,22 +156,47 @@ class ComformedZoneStack(Stack):
             database=db,
             table_name=_glue_table,
             columns=[
-                _glue_alpha.Column(
-                    name='document.document_name',
-                    type=_glue_alpha.Type(
-                        input_string='string',
-                        is_primitive=True
-                    )
-                ),
-                _glue_alpha.Column(
-                    name='document.document_flag',
-                    type=_glue_alpha.Type(
-                        input_string='string',
-                        is_primitive=True
-                    )
-                ),
+                _glue_alpha.Column(name='document_name', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='document_flag', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='source_key', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='content_sha256', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='page_count', type=_glue_alpha.Schema.INTEGER),
+                _glue_alpha.Column(name='line_count', type=_glue_alpha.Schema.INTEGER),
+                _glue_alpha.Column(name='mean_confidence', type=_glue_alpha.Schema.FLOAT),
+                _glue_alpha.Column(name='text', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='processed_at', type=_glue_alpha.Schema.TIMESTAMP),
+                #DOCUMENT TRACE (NULL IN FILES WRITTEN BEFORE TRACING)
+                _glue_alpha.Column(name='trace_id', type=_glue_alpha.Schema.STRING),
+                _glue_alpha.Column(name='trace_start', type=_glue_alpha.Schema.TIMESTAMP),
+            ],
+            partition_keys=[
+                _glue_alpha.Column(name='year', type=_glue_alpha.Schema.INTEGER),
+                _glue_alpha.Column(name='doctype', type=_glue_alpha.Schema.STRING),
             ],
             bucket=bucket,
-            s3_prefix=self.parquet_data_path,
-            data_format=_glue_alpha.DataFormat.PARQUET
+            #THE TABLE READS THE PARQUET FILES LISTED IN THE PARTITION MANIFESTS (SEE partition_manifest.py)
+            s3_prefix=f"{self.parquet_data_path.strip('/')}/_symlink/",
+            data_format=_glue_alpha.DataFormat(
+                input_format=_glue_alpha.InputFormat("org.apache.hadoop.hive.ql.io.SymlinkTextInputFormat"),
+                output_format=_glue_alpha.OutputFormat("org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"),
+                serialization_library=_glue_alpha.SerializationLibrary.PARQUET
+            )
         )
+
+        #PARTITION PROJECTION: ATHENA COMPUTES THE PARTITIONS FROM THESE SETTINGS INSTEAD OF LISTING THEM
+        #THE DOCTYPES FOLLOW THE ROUTING TABLE OF THE RECEPTION ZONE UNLESS THEY ARE LISTED
+        routed_doctypes = list(self.properties.get("document_routing", {}).get("document_types", {})) or ["form4e", "ebcd", "itd"]
+        #EVERY PARAMETER IS OVERRIDDEN ON ITS OWN (THE DOTS OF ITS NAME ESCAPED), THE ONES SET BY THE CONSTRUCT ARE KEPT
+        projection = {
+            "projection.enabled": "true",
+            "projection.year.type": "integer",
+            "projection.year.range": self.partition_projection.get("year_range", "2022,2035"),
+            "projection.doctype.type": "enum",
+            "projection.doctype.values": ",".join(self.partition_projection.get("doctypes", routed_doctypes)),
+            "storage.location.template": f"s3://{bucket.bucket_name}/{self.parquet_data_path.strip('/')}/_symlink/year=${{year}}/doctype=${{doctype}}/"
+        }
+        for parameter, value in projection.items():
+            escaped = parameter.replace(".", "\\.")
+            table.node.default_child.add_property_override(f"TableInput.Parameters.{escaped}", value)
+
+        return table
@@ -0,0 +1,205 @@
+import io
+import json
+import time
+import uuid
+
+from datetime import datetime, timezone
+
+import handler_runtime
+import partition_manifest
+
+# pyarrow is imported by the first call that needs it
+pa = handler_runtime.lazy_module('pyarrow')
+pq = handler_runtime.lazy_module('pyarrow.parquet')
+
+'''
+COMPACTION ENGINE
+Merges the small Parquet files of every partition of the conformed zone into
+files close to a target size.
+
+For each partition manifest the small live files are grouped up to the target
+size, every group is rewritten as one compacted file and the manifest is then
+updated in a single conditional write that removes the group and adds the new
+file, so Athena sees either the old files or the new one, never both or none.
+The lineage of the new file (see partition_manifest) is written first, so the
+digest does not load rows it already has a second time.
+Files no longer listed in any manifest are deleted once they are older than a
+grace period, which leaves time for queries already planned against them.
+'''
+
+DEFAULT_TARGET_MB = 128
+DEFAULT_SMALL_FILE_MB = 32
+DEFAULT_ORPHAN_GRACE_HOURS = 24
+DEFAULT_ROW_GROUP_MB = 128
+MB = 1024 * 1024
+
+
+def list_objects(s3, bucket, prefix):
+    objects = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = obj
+    return objects
+
+
+def list_manifests(s3, bucket, parquet_prefix):
+    prefix = f"{parquet_prefix.strip('/')}/{partition_manifest.MANIFEST_DIR}/"
+    return sorted(key for key in list_objects(s3, bucket, prefix)
+                  if key.endswith('/' + partition_manifest.MANIFEST_NAME))
+
+
+def partition_of(manifest_key, parquet_prefix):
+    prefix = f"{parquet_prefix.strip('/')}/{partition_manifest.MANIFEST_DIR}/"
+    return manifest_key[len(prefix):-len('/' + partition_manifest.MANIFEST_NAME)]
+
+
+'''
+GROUP SMALL FILES (uri, size) INTO RUNS THAT STAY UNDER THE TARGET SIZE
+Only groups of at least two files are worth rewriting.
+'''
+def plan_groups(files, target_bytes, small_bytes):
+    groups = []
+    current = []
+    current_bytes = 0
+    for uri, size in sorted(files):
+        if size >= small_bytes:
+            continue
+        if current and current_bytes + size > target_bytes:
+            groups.append(current)
+            current, current_bytes = [], 0
+        current.append(uri)
+        current_bytes += size
+    groups.append(current)
+    return [group for group in groups if len(group) > 1]
+
+
+'''
+CONFORM A TABLE TO THE MERGED SCHEMA
+Files written before a column was added to the modeling schema get it as nulls
+'''
+def conform_table(table, schema):
+    return pa.table({
+        field.name: table.column(field.name).cast(field.type) if field.name in table.column_names
+        else pa.nulls(table.num_rows, field.type)
+        for field in schema
+    }, schema=schema)
+
+
+def merge_files(s3, bucket, keys, row_group_mb=DEFAULT_ROW_GROUP_MB):
+    tables = [pq.read_table(io.BytesIO(s3.get_object(Bucket=bucket, Key=key)['Body'].read())) for key in keys]
+    schema = pa.unify_schemas([table.schema for table in tables])
+    table = pa.concat_tables([conform_table(table, schema) for table in tables])
+    bytes_per_row = max(1, table.nbytes // max(1, table.num_rows))
+
+    sink = io.BytesIO()
+    pq.write_table(table, sink, row_group_size=max(1, (row_group_mb * MB) // bytes_per_row), compression='snappy')
+    return sink.getvalue(), table.num_rows
+
+
+# Named like modeling's part files so keys sort by write time (the digest watermark relies on it)
+def compacted_key(data_prefix):
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+    return f"{data_prefix}part-{stamp}-{uuid.uuid4().hex}{partition_manifest.COMPACTED_SUFFIX}"
+
+
+def _stats(entries, objects):
+    sizes = [objects[partition_manifest.uri_key(entry)]['Size'] for entry in entries
+             if partition_manifest.uri_key(entry) in objects]
+    return {'files': len(sizes), 'bytes': sum(sizes)}
+
+
+def compact_partition(s3, bucket, parquet_prefix, manifest_key, target_bytes, small_bytes,
+                      orphan_grace_seconds, row_group_mb=DEFAULT_ROW_GROUP_MB, now=None):
+    now = now or datetime.now(timezone.utc)
+    partition = partition_of(manifest_key, parquet_prefix)
+    data_prefix = f"{parquet_prefix.strip('/')}/{partition}/"
+
+    objects = list_objects(s3, bucket, data_prefix)
+    entries, _ = partition_manifest.read_manifest(s3, bucket, manifest_key)
+    report = {'partition': partition, 'before': _stats(entries, objects), 'groups': 0, 'conflicts': 0}
+
+    files = [(entry, objects[partition_manifest.uri_key(entry)]['Size']) for entry in entries
+             if partition_manifest.uri_key(entry) in objects]
+
+    for group in plan_groups(files, target_bytes, small_bytes):
+        body, rows = merge_files(s3, bucket, [partition_manifest.uri_key(uri) for uri in group], row_group_mb)
+        key = compacted_key(data_prefix)
+        lineage = partition_manifest.lineage_key(parquet_prefix, key)
+        s3.put_object(Bucket=bucket, Key=lineage, ContentType='application/json',
+                      Body=json.dumps({'inputs': [partition_manifest.uri_key(uri) for uri in group]}).encode('utf-8'))
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+
+        swapped = partition_manifest.update_manifest(
+            s3, bucket, manifest_key,
+            add=[partition_manifest.data_uri(bucket, key)],
+            remove=group,
+            remove_required=True
+        )
+        if swapped is None:
+            s3.delete_object(Bucket=bucket, Key=key)
+            s3.delete_object(Bucket=bucket, Key=lineage)
+            report['conflicts'] += 1
+            continue
+
+        objects[key] = {'Key': key, 'Size': len(body), 'LastModified': now}
+        report['groups'] += 1
+
+    entries, _ = partition_manifest.read_manifest(s3, bucket, manifest_key)
+    report['after'] = _stats(entries, objects)
+
+    #DELETE THE FILES NO LONGER LISTED ONCE NO QUERY CAN STILL BE READING THEM
+    live = {partition_manifest.uri_key(entry) for entry in entries}
+    orphans = [key for key, obj in objects.items()
+               if key not in live and key.endswith('.parquet')
+               and (now - obj['LastModified']).total_seconds() > orphan_grace_seconds]
+    deleted = orphans + [partition_manifest.lineage_key(parquet_prefix, key) for key in orphans
+                         if key.endswith(partition_manifest.COMPACTED_SUFFIX)]
+    for start in range(0, len(deleted), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in deleted[start:start + 1000]]})
+    report['orphans_deleted'] = len(orphans)
+
+    return report
+
+
+def compact(s3, bucket, parquet_prefix, target_mb=DEFAULT_TARGET_MB, small_file_mb=DEFAULT_SMALL_FILE_MB,
+            orphan_grace_hours=DEFAULT_ORPHAN_GRACE_HOURS, row_group_mb=DEFAULT_ROW_GROUP_MB,
+            remaining_ms=None, reserve_ms=60000):
+    reports = []
+    for manifest_key in list_manifests(s3, bucket, parquet_prefix):
+        if remaining_ms is not None and remaining_ms() < reserve_ms:
+            print(f"Stopping before {manifest_key}, not enough time left in this run")
+            break
+        reports.append(compact_partition(
+            s3, bucket, parquet_prefix, manifest_key,
+            target_bytes=target_mb * MB,
+            small_bytes=small_file_mb * MB,
+            orphan_grace_seconds=orphan_grace_hours * 3600,
+            row_group_mb=row_group_mb
+        ))
+
+    totals = {
+        'partitions': len(reports),
+        'files_before': sum(r['before']['files'] for r in reports),
+        'files_after': sum(r['after']['files'] for r in reports),
+        'bytes_before': sum(r['before']['bytes'] for r in reports),
+        'bytes_after': sum(r['after']['bytes'] for r in reports),
+        'orphans_deleted': sum(r['orphans_deleted'] for r in reports)
+    }
+    return {'totals': totals, 'partitions': reports}
+
+
+def metrics(totals, function_name):
+    names = ('files_before', 'files_after', 'bytes_before', 'bytes_after', 'orphans_deleted')
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ConformedZone/Compaction',
+                'Dimensions': [['FunctionName']],
+                'Metrics': [{'Name': name, 'Unit': 'Bytes' if name.startswith('bytes') else 'Count'} for name in names]
+            }]
+        },
+        'FunctionName': function_name
+    }
+    line.update({name: totals[name] for name in names})
+    return json.dumps(line)
@@ -0,0 +1,23 @@
+import os
+import json
+
+import compaction_engine
+import handler_runtime
+        
+@handler_runtime.instrumented('ConformedZone/Compaction')
+def handler(event, context):
+    report = compaction_engine.compact(
+        handler_runtime.client('s3'),
+        os.environ['CONFORMED_BUCKET_NAME'],
+        os.environ.get('PARQUET_DATA_PATH', '/test/'),
+        target_mb=int(os.environ.get('COMPACTION_TARGET_MB', compaction_engine.DEFAULT_TARGET_MB)),
+        small_file_mb=int(os.environ.get('COMPACTION_SMALL_FILE_MB', compaction_engine.DEFAULT_SMALL_FILE_MB)),
+        orphan_grace_hours=float(os.environ.get('COMPACTION_ORPHAN_GRACE_HOURS', compaction_engine.DEFAULT_ORPHAN_GRACE_HOURS)),
+        row_group_mb=int(os.environ.get('PARQUET_ROW_GROUP_MB', compaction_engine.DEFAULT_ROW_GROUP_MB)),
+        remaining_ms=context.get_remaining_time_in_millis if context is not None else None
+    )
+
+    print(json.dumps(report))
+    print(compaction_engine.metrics(report['totals'], os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'compaction_function')))
+
+    return report['totals']
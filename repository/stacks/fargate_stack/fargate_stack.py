@@ -5,12 +5,8 @@ from aws_cdk import (
     Stack,
     aws_ec2 as _ec2, 
     aws_ecs as _ecs,
-    aws_s3 as _s3,
     aws_iam as _iam,
-    aws_s3_notifications as _s3n,
     aws_ecs_patterns as _ecs_patterns,
-    aws_neptune as _neptune,
-    aws_sagemaker as _sagemaker,
     aws_elasticloadbalancingv2 as elbv2,
     aws_elasticloadbalancingv2_actions as elbv2_actions,
     aws_certificatemanager as _certificatemanager,
@@ -27,6 +23,9 @@ class FargateStack(Stack):
         
         env_prefix = self.node.try_get_context("properties").get("env_prefix")
         self.component_prefix = f"project-{env_prefix}"
+        self.properties = self.node.try_get_context("properties").get("properties")
+        self.graph_proxy_settings = self.properties.get("graph_proxy", {})
+        self.graph_proxy_port = self.graph_proxy_settings.get("port", 8183)
 
         ########## FARGATE ##########
         _cluster_name = f"{self.component_prefix}-ecs-cluster"
@@ -69,7 +68,10 @@ class FargateStack(Stack):
                 enable_logging=True,
                 command=[],
                 environment={
-                    "HOST":"localhost"
+                    "HOST":"localhost",
+                    #EXPLORER QUERIES GO THROUGH THE CACHING PROXY SIDECAR
+                    "USING_PROXY_SERVER":"true",
+                    "GRAPH_CONNECTION_URL":f"http://localhost:{self.graph_proxy_port}"
                     },
                 execution_role=taskExecutionRole),
             memory_limit_mib=2048,      # Default is 512
@@ -85,6 +87,8 @@ class FargateStack(Stack):
             )
         )
 
+        self.add_query_proxy(self.load_balanced_bft_fargate_service.task_definition)
+
         #configure health checks
         self.load_balanced_bft_fargate_service.target_group.configure_health_check(
             path="/explorer",
@@ -135,6 +139,71 @@ class FargateStack(Stack):
             )
         )
 
+    '''
+    CACHING QUERY PROXY SIDECAR
+    Serves repeated explorer read queries from memory and drops its cache when
+    the digest publishes a new graph generation in the neptune zone bucket
+    '''
+    def add_query_proxy(self, task_definition):
+        #THE BUCKET ARN IS BUILT FROM THE NAME, THE NEPTUNE STACK DEPENDS ON THIS ONE
+        _neptune_zone_bucket_name = f"{self.component_prefix}-s3-neptunezone"
+        _generation_key = f"{str(self.properties.get('digest', {}).get('state_path', 'digest_state')).strip('/')}/generation.json"
+        task_definition.add_to_task_role_policy(_iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            actions=["s3:GetObject"],
+            resources=[f"arn:aws:s3:::{_neptune_zone_bucket_name}/{_generation_key}"]
+        ))
+        #WITHOUT LIST ON THE KEY S3 ANSWERS 403 INSTEAD OF 404 UNTIL THE FIRST GENERATION IS PUBLISHED
+        task_definition.add_to_task_role_policy(_iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            actions=["s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{_neptune_zone_bucket_name}"],
+            conditions={"StringEquals": {"s3:prefix": _generation_key}}
+        ))
+
+        #WRITER AND READER ENDPOINTS ARE PUBLISHED BY THE NEPTUNE STACK AND READ AT RUNTIME
+        _endpoint_parameters = {name: _util.neptune_endpoint_parameter_name(self.component_prefix, name)
+                                for name in ("writer-endpoint", "reader-endpoint", "port")}
+        task_definition.add_to_task_role_policy(_iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            actions=["ssm:GetParameters"],
+            resources=[self.format_arn(service="ssm", resource="parameter", resource_name=name.lstrip("/"))
+                       for name in _endpoint_parameters.values()]
+        ))
+
+        proxy_container = task_definition.add_container(
+            "query-proxy",
+            container_name="query-proxy",
+            #BUILT FROM THE STACKS DIRECTORY SO THE IMAGE SHIPS THE SHARED neptune_client MODULE
+            image=_ecs.ContainerImage.from_asset(
+                os.path.dirname(os.path.dirname(__file__)),
+                file="fargate_stack/query_proxy/Dockerfile",
+                exclude=["*", "!fargate_stack", "fargate_stack/*", "!fargate_stack/query_proxy",
+                         "!shared_layer", "shared_layer/*", "!shared_layer/python", "shared_layer/python/*",
+                         "!shared_layer/python/neptune_client.py", "**/__pycache__"]
+            ),
+            memory_reservation_mib=self.graph_proxy_settings.get("memory_mib", 512),
+            logging=_ecs.LogDriver.aws_logs(stream_prefix="query-proxy"),
+            port_mappings=[_ecs.PortMapping(container_port=self.graph_proxy_port)],
+            environment={
+                "NEPTUNE_WRITER_PARAMETER": _endpoint_parameters["writer-endpoint"],
+                "NEPTUNE_READER_PARAMETER": _endpoint_parameters["reader-endpoint"],
+                "NEPTUNE_PORT_PARAMETER": _endpoint_parameters["port"],
+                "PROXY_PORT": str(self.graph_proxy_port),
+                "CACHE_MB": str(self.graph_proxy_settings.get("cache_mb", 256)),
+                "CACHE_TTL_SECONDS": str(self.graph_proxy_settings.get("ttl_seconds", 300)),
+                "GENERATION_BUCKET": _neptune_zone_bucket_name,
+                "GENERATION_KEY": _generation_key,
+                "GENERATION_POLL_SECONDS": str(self.graph_proxy_settings.get("poll_seconds", 30))
+            }
+        )
+
+        task_definition.default_container.add_container_dependencies(_ecs.ContainerDependency(
+            container=proxy_container,
+            condition=_ecs.ContainerDependencyCondition.START
+        ))
+        return proxy_container
+
     def create_cognito_userpool(self, _userpool_name, _vpc):
         #userpool
         cognito_userpool = _cognito.UserPool(
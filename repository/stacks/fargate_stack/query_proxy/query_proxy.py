@@ -0,0 +1,400 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import neptune_client
+
+'''
+CACHING QUERY PROXY
+Runs as a sidecar of the graph-explorer task and sits between the explorer
+and Neptune. Read queries (SPARQL, Gremlin, openCypher) are normalized and
+their responses kept in an LRU cache with a TTL and a memory cap, so popular
+nodes expanded by many users hit the cluster once. Cache misses go to the
+reader endpoints, updates and any other request are passed through to the
+writer (see neptune_client).
+
+The cache is dropped whenever the digest publishes a new graph generation
+(an object in the neptune zone bucket, polled by ETag). Hit rate and latency
+percentiles are served on /proxy/metrics and logged as EMF.
+
+    NEPTUNE_WRITER_PARAMETER=/project-dev/neptune/writer-endpoint \
+    NEPTUNE_READER_PARAMETER=/project-dev/neptune/reader-endpoint \
+    NEPTUNE_PORT_PARAMETER=/project-dev/neptune/port python query_proxy.py
+
+UPSTREAM_URL=https://<endpoint>:8182 is used instead when no parameter is set.
+'''
+
+DEFAULT_PORT = 8183
+DEFAULT_CACHE_MB = 256
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_POLL_SECONDS = 30
+LATENCY_SAMPLES = 2048
+
+LANGUAGES = {'/sparql': 'sparql', '/gremlin': 'gremlin', '/openCypher': 'opencypher'}
+PUNCTUATION = re.compile(r'\s*([{}()\[\],;.=])\s*')
+LITERALS = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|<[^<>\s]*>')
+SPARQL_COMMENT = re.compile(r'#[^\n]*')
+MUTATIONS = {
+    'sparql': re.compile(r'\b(INSERT|DELETE|LOAD|CLEAR|CREATE|DROP|COPY|MOVE|ADD|WITH)\b', re.I),
+    'gremlin': re.compile(r'\b(addV|addE|property|drop|mergeV|mergeE|sideEffect|io)\s*\('),
+    'opencypher': re.compile(r'\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|CALL)\b', re.I)
+}
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host'}
+
+
+'''
+NORMALIZE A QUERY
+Comments are dropped, whitespace collapsed and removed around punctuation
+outside string literals and IRIs, so the same query typed or generated differently shares one entry.
+Returns (normalized text, whether it only reads).
+'''
+def normalize(language, text):
+    parts = []
+    code = []
+    position = 0
+    for match in LITERALS.finditer(text):
+        parts.append(('code', text[position:match.start()]))
+        parts.append(('literal', match.group(0)))
+        position = match.end()
+    parts.append(('code', text[position:]))
+
+    normalized = []
+    for kind, part in parts:
+        if kind == 'code':
+            if language == 'sparql':
+                part = SPARQL_COMMENT.sub(' ', part)
+            part = PUNCTUATION.sub(r'\1', re.sub(r'\s+', ' ', part))
+            code.append(part)
+        normalized.append(part)
+    read_only = not MUTATIONS[language].search(' '.join(code))
+    return ''.join(normalized).strip(), read_only
+
+
+'''
+EXTRACT THE QUERY OF A NEPTUNE HTTP REQUEST
+Returns (language, query text) or None when the request carries no read query
+'''
+def extract_query(method, path, content_type, body):
+    parsed = urllib.parse.urlsplit(path)
+    language = LANGUAGES.get(parsed.path.rstrip('/'))
+    if language is None:
+        return None
+
+    params = urllib.parse.parse_qs(parsed.query)
+    if method == 'POST':
+        if 'json' in (content_type or ''):
+            try:
+                params = {name: [value] for name, value in json.loads(body or b'{}').items()}
+            except (ValueError, AttributeError):
+                return None
+        else:
+            params = urllib.parse.parse_qs(body.decode('utf-8', 'replace'))
+
+    if 'update' in params:
+        return None
+    text = (params.get('gremlin') if language == 'gremlin' else params.get('query')) or [None]
+    if not isinstance(text[0], str):
+        return None
+    return language, text[0]
+
+
+class QueryCache:
+
+    def __init__(self, max_bytes, ttl_seconds, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['expires'] <= self.clock():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry['response']
+
+    def put(self, key, response):
+        size = len(response[2]) + len(key[1]) + 256
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            while self.bytes + size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+            self.entries[key] = {'response': response, 'size': size, 'expires': self.clock() + self.ttl_seconds}
+            self.bytes += size
+            return True
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)['size']
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.stats['invalidations'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class LatencyRecorder:
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = {'hit': collections.deque(maxlen=samples), 'miss': collections.deque(maxlen=samples),
+                        'pass': collections.deque(maxlen=samples)}
+        self._lock = threading.Lock()
+
+    def record(self, outcome, milliseconds):
+        with self._lock:
+            self.samples[outcome].append(milliseconds)
+
+    def percentiles(self):
+        result = {}
+        with self._lock:
+            for outcome, samples in self.samples.items():
+                ordered = sorted(samples)
+                for percentile in (50, 99):
+                    value = ordered[min(len(ordered) - 1, len(ordered) * percentile // 100)] if ordered else 0.0
+                    result[f"{outcome}_p{percentile}_ms"] = round(value, 3)
+        return result
+
+
+'''
+ENDPOINT RESOLVER
+The cluster endpoints are published as SSM parameters by the neptune stack,
+which is deployed after this one, so they are looked up at runtime and
+refreshed when they change
+'''
+class EndpointResolver:
+
+    def __init__(self, ssm, writer_parameter, reader_parameter, port_parameter):
+        self.ssm = ssm
+        self.names = {'writer': writer_parameter, 'reader': reader_parameter, 'port': port_parameter}
+        self.current = None
+
+    def resolve(self):
+        response = self.ssm.get_parameters(Names=list(self.names.values()))
+        values = {parameter['Name']: parameter['Value'] for parameter in response.get('Parameters', [])}
+        if self.names['writer'] not in values:
+            return None
+        return (values[self.names['writer']],
+                [endpoint for endpoint in values.get(self.names['reader'], '').split(',') if endpoint],
+                int(values.get(self.names['port'], neptune_client.DEFAULT_PORT)))
+
+    def refresh(self, client):
+        endpoints = self.resolve()
+        if endpoints is None or endpoints == self.current:
+            return False
+        self.current = endpoints
+        writer, readers, port = endpoints
+        client.port = port
+        client.set_endpoints(writer, readers)
+        return True
+
+
+'''
+GENERATION WATCHER
+Drops the cache when the generation object written by the digest changes
+'''
+class GenerationWatcher:
+
+    def __init__(self, cache, s3, bucket, key):
+        self.cache = cache
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.etag = None
+
+    def check(self):
+        try:
+            etag = self.s3.head_object(Bucket=self.bucket, Key=self.key)['ETag']
+        except Exception as error:
+            if str(getattr(error, 'response', {}).get('Error', {}).get('Code', '')) in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        changed = self.etag is not None and etag != self.etag
+        self.etag = etag
+        if changed:
+            self.cache.clear()
+        return changed
+
+
+def metrics(cache, latency):
+    values = dict(cache.snapshot(), **latency.percentiles())
+    names = ['hit_rate', 'hits', 'misses', 'entries', 'bytes', 'evictions', 'invalidations',
+             'hit_p50_ms', 'hit_p99_ms', 'miss_p50_ms', 'miss_p99_ms']
+    return dict({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'GraphExplorer/QueryProxy',
+                'Dimensions': [[]],
+                'Metrics': [{'Name': name, 'Unit': 'Milliseconds' if name.endswith('_ms') else 'None'} for name in names]
+            }]
+        }
+    }, **values)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, headers, body, cache_status=None):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        started = time.perf_counter()
+        proxy = self.server.proxy
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))) if method == 'POST' else None
+
+        if self.path == '/proxy/metrics':
+            return self._reply(200, [('Content-Type', 'application/json')],
+                               json.dumps(metrics(proxy.cache, proxy.latency)).encode('utf-8'))
+
+        key = None
+        query = extract_query(method, self.path, self.headers.get('Content-Type'), body)
+        if query is not None:
+            language, text = query
+            normalized, read_only = normalize(language, text)
+            if read_only:
+                key = (language, normalized, self.headers.get('Accept', ''))
+
+        if key is not None:
+            cached = proxy.cache.get(key)
+            if cached is not None:
+                self._reply(*cached, cache_status='HIT')
+                return proxy.latency.record('hit', (time.perf_counter() - started) * 1000)
+
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_HEADERS}
+        try:
+            session = proxy.client.read() if key is not None else proxy.client.write()
+            status, response_headers, content = session.request(method, self.path, body, headers)
+            response = (status, [(name, value) for name, value in response_headers if name.lower() not in HOP_HEADERS], content)
+        except Exception as error:
+            return self._reply(502, [('Content-Type', 'application/json')],
+                               json.dumps({'code': 'BadGateway', 'detailedMessage': str(error)}).encode('utf-8'))
+
+        if key is not None and response[0] == 200:
+            proxy.cache.put(key, response)
+        self._reply(*response, cache_status='MISS' if key is not None else None)
+        proxy.latency.record('miss' if key is not None else 'pass', (time.perf_counter() - started) * 1000)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class QueryProxy:
+
+    def __init__(self, client, port=DEFAULT_PORT, cache_mb=DEFAULT_CACHE_MB, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 host='0.0.0.0'):
+        self.cache = QueryCache(int(cache_mb * 1024 * 1024), ttl_seconds)
+        self.latency = LatencyRecorder()
+        self.client = client
+        self.server = ThreadingHTTPServer((host, port), ProxyHandler)
+        self.server.daemon_threads = True
+        self.server.proxy = self
+        self.port = self.server.server_address[1]
+
+    def serve_forever(self, poll_interval=0.5):
+        self.server.serve_forever(poll_interval=poll_interval)
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def watch(proxy, watcher, resolver, poll_seconds, metrics_seconds=60):
+    last_metrics = time.monotonic()
+    while True:
+        time.sleep(poll_seconds)
+        if resolver is not None:
+            try:
+                if resolver.refresh(proxy.client):
+                    print(json.dumps({'event': 'endpoints', 'endpoints': resolver.current}))
+            except Exception as error:
+                print(json.dumps({'event': 'endpoint_lookup_failed', 'error': str(error)}))
+        if watcher is not None:
+            try:
+                if watcher.check():
+                    print(json.dumps({'event': 'invalidated', 'generation': watcher.etag}))
+            except Exception as error:
+                print(json.dumps({'event': 'generation_check_failed', 'error': str(error)}))
+        if time.monotonic() - last_metrics >= metrics_seconds:
+            print(json.dumps(metrics(proxy.cache, proxy.latency)), flush=True)
+            last_metrics = time.monotonic()
+
+
+def client_from_url(url):
+    parsed = urllib.parse.urlsplit(url)
+    port = parsed.port or neptune_client.DEFAULT_PORT
+    return neptune_client.NeptuneClient(f"{parsed.hostname}:{port}", use_tls=parsed.scheme == 'https')
+
+
+def main():
+    import boto3
+
+    client = client_from_url(os.environ.get('UPSTREAM_URL') or 'https://localhost:8182')
+    resolver = None
+    if os.environ.get('NEPTUNE_WRITER_PARAMETER'):
+        resolver = EndpointResolver(boto3.client('ssm'), os.environ['NEPTUNE_WRITER_PARAMETER'],
+                                    os.environ['NEPTUNE_READER_PARAMETER'], os.environ['NEPTUNE_PORT_PARAMETER'])
+        try:
+            resolver.refresh(client)
+        except Exception as error:
+            print(json.dumps({'event': 'endpoint_lookup_failed', 'error': str(error)}))
+
+    proxy = QueryProxy(
+        client,
+        port=int(os.environ.get('PROXY_PORT', DEFAULT_PORT)),
+        cache_mb=float(os.environ.get('CACHE_MB', DEFAULT_CACHE_MB)),
+        ttl_seconds=float(os.environ.get('CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    )
+
+    watcher = None
+    if os.environ.get('GENERATION_BUCKET'):
+        watcher = GenerationWatcher(proxy.cache, boto3.client('s3'), os.environ['GENERATION_BUCKET'], os.environ['GENERATION_KEY'])
+    threading.Thread(target=watch, args=(proxy, watcher, resolver, float(os.environ.get('GENERATION_POLL_SECONDS', DEFAULT_POLL_SECONDS))),
+                     daemon=True).start()
+
+    print(json.dumps({'event': 'started', 'port': proxy.port, 'writer': client.writer, 'readers': client.readers}), flush=True)
+    proxy.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import io
+import json
+import re
+import time
+import uuid
+
+import digest_state
+import handler_runtime
+import rdf_mapping
+
+# pyarrow is imported by the first call that needs it
+pq = handler_runtime.lazy_module('pyarrow.parquet')
+
+'''
+DIGEST ENGINE
+Turns conformed Parquet files into RDF and loads them into Neptune by one of
+two paths, chosen by the number of triples in the batch:
+
+    sparql  below bulk_threshold, size-bounded INSERT DATA updates
+    bulk    N-Triples files staged under <NEPTUNE_STAGING_PATH>/<run_id>/ in the
+            neptune zone bucket, then one loader job over that folder
+
+digest_incremental finds the objects to load itself from the digest state
+(see digest_state), so a run costs the size of the delta.
+
+Once the triples are in the graph the report lists the traces of the loaded
+documents, for the digest spans. A bulk load that outlives the invocation is
+confirmed by a later run and its documents are not traced.
+'''
+
+PARTITION_PATTERN = re.compile(r'(?:^|/)year=(\d+)/doctype=([^/]+)/')
+DEFAULT_BULK_THRESHOLD = 50000
+DEFAULT_FILE_TRIPLES = 500000
+IN_PROGRESS_STATUSES = {'LOAD_IN_PROGRESS', 'LOAD_NOT_STARTED', 'LOAD_IN_QUEUE'}
+SUCCESS_STATUSES = IN_PROGRESS_STATUSES | {'LOAD_COMPLETED'}
+
+
+class LoadFailed(Exception):
+    pass
+
+
+def partition_values(key):
+    match = PARTITION_PATTERN.search(key)
+    if match is None:
+        return {}
+    return {'year': int(match.group(1)), 'doctype': match.group(2)}
+
+
+def read_rows(s3, bucket, key):
+    body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    rows = pq.read_table(io.BytesIO(body)).to_pylist()
+    values = partition_values(key)
+    for row in rows:
+        row.update(values)
+    return rows
+
+
+'''
+THE TRACES OF A BATCH OF ROWS, ONE PER DOCUMENT
+'''
+def row_traces(rows):
+    traces = {}
+    for row in rows:
+        if row.get('trace_id') and row['trace_id'] not in traces:
+            traces[row['trace_id']] = {
+                'trace_id': row['trace_id'],
+                'trace_start': handler_runtime.epoch_ms(row.get('trace_start')),
+                'key': row.get('source_key')
+            }
+    return list(traces.values())
+
+
+def choose_path(triple_count, bulk_threshold):
+    return 'bulk' if triple_count >= bulk_threshold else 'sparql'
+
+
+'''
+WRITE THE TRIPLES AS N-TRIPLES FILES AND RETURN THE FOLDER URI FOR THE LOADER
+'''
+def stage_ntriples(s3, bucket, prefix, run_id, triples, file_triples=DEFAULT_FILE_TRIPLES):
+    folder = f"{prefix.strip('/')}/{run_id}/".lstrip('/')
+    keys = []
+    for index, chunk in enumerate(rdf_mapping.ntriples_chunks(triples, file_triples)):
+        key = f"{folder}part-{index:05d}.nt"
+        s3.put_object(Bucket=bucket, Key=key, Body=chunk.encode('utf-8'), ContentType='application/n-triples')
+        keys.append(key)
+    return f"s3://{bucket}/{folder}", keys
+
+
+def digest(s3, objects, sparql, loader, staging_bucket, staging_prefix,
+           bulk_threshold=DEFAULT_BULK_THRESHOLD, file_triples=DEFAULT_FILE_TRIPLES,
+           namespace=rdf_mapping.DEFAULT_NAMESPACE, wait_seconds=300, run_id=None):
+    rows = []
+    for bucket, key in objects:
+        rows.extend(read_rows(s3, bucket, key))
+    triples = rdf_mapping.rows_to_triples(rows, namespace)
+
+    path = choose_path(len(triples), bulk_threshold)
+    report = {'path': path, 'files': len(objects), 'rows': len(rows), 'triples': len(triples)}
+
+    if path == 'sparql':
+        report['sparql'] = sparql.insert(triples)
+        report['traces'] = row_traces(rows)
+        return report
+
+    run_id = run_id or uuid.uuid4().hex
+    source, keys = stage_ntriples(s3, staging_bucket, staging_prefix, run_id, triples, file_triples)
+    load_id = loader.start(source)
+    status = loader.wait(load_id, budget_seconds=wait_seconds)
+    report.update({'source': source, 'staged_files': len(keys), 'load': status})
+    if status['status'] not in SUCCESS_STATUSES:
+        raise LoadFailed(f"Neptune load {load_id} of {source} ended with {status['status']}")
+    if status['status'] == 'LOAD_COMPLETED':
+        report['traces'] = row_traces(rows)
+    return report
+
+
+'''
+LOAD EVERYTHING WRITTEN TO THE CONFORMED ZONE SINCE THE LAST RUN
+A bulk load still running when the invocation ends is kept in the state and
+checked by the next run before its objects are marked as loaded.
+'''
+def digest_incremental(s3, conformed_bucket, parquet_prefix, state_bucket, state_path, sparql, loader,
+                       staging_prefix, max_files=digest_state.DEFAULT_MAX_FILES,
+                       settle_seconds=digest_state.DEFAULT_SETTLE_SECONDS, now=None, **options):
+    key = digest_state.state_key(state_path)
+    state, etag = digest_state.load_state(s3, state_bucket, key)
+
+    pending_load = state.pop('pending_load', None)
+    if pending_load:
+        status = loader.status(pending_load['load_id'])
+        if status['status'] in IN_PROGRESS_STATUSES:
+            return {'path': 'bulk', 'waiting': status}
+        if status['status'] == 'LOAD_COMPLETED':
+            digest_state.mark_loaded(state, pending_load['objects'], [], now, settle_seconds)
+        resumed_load = status
+    else:
+        resumed_load = None
+
+    pending, covered, drained = digest_state.pending_objects(s3, conformed_bucket, parquet_prefix, state, max_files)
+    report = {'path': None, 'files': 0, 'covered': len(covered), 'remaining': len(pending) == max_files}
+    if resumed_load:
+        report['resumed_load'] = resumed_load
+    if pending:
+        report.update(digest(s3, [(conformed_bucket, obj_key) for obj_key, _ in pending], sparql, loader,
+                             state_bucket, staging_prefix, **options))
+
+    load = report.get('load')
+    if load and load['status'] in IN_PROGRESS_STATUSES:
+        state['pending_load'] = {'load_id': load['load_id'], 'objects': [list(obj) for obj in pending + covered]}
+    else:
+        digest_state.mark_loaded(state, pending + covered, drained, now, settle_seconds)
+    digest_state.save_state(s3, state_bucket, key, state, etag)
+    return report
+
+
+def graph_changed(report):
+    loads = [report.get('load'), report.get('resumed_load')]
+    applied = report.get('path') == 'sparql' and report.get('triples')
+    return bool(applied or any(load and load['status'] == 'LOAD_COMPLETED' for load in loads))
+
+
+'''
+PUBLISH A NEW GRAPH GENERATION
+Readers that cache query results (the explorer query proxy) watch the ETag
+of this object and drop their cache when it changes
+'''
+def publish_generation(s3, bucket, state_path, report, now=None):
+    body = {'published_at': time.time() if now is None else now, 'path': report.get('path'),
+            'triples': report.get('triples', 0)}
+    key = digest_state.generation_key(state_path)
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(body).encode('utf-8'), ContentType='application/json')
+    return key
@@ -1,14 +1,101 @@
 import os
 import json
-        
+
+import digest_engine
+import digest_state
+import handler_runtime
+import neptune_client
+import neptune_loader
+import rdf_mapping
+import sparql_writer
+
+# The Neptune client is created once per container and reused by warm invocations
+_neptune_client = None
+
+def get_neptune_client():
+    global _neptune_client
+    if _neptune_client is None:
+        _neptune_client = neptune_client.NeptuneClient.from_env()
+    return _neptune_client
+
+'''
+KEEP ONLY PARQUET OBJECTS
+The staged N-Triples files land in the neptune zone bucket too and must never
+be digested again
+'''
+def parquet_objects(records):
+    objects = []
+    for record in records:
+        if not record.key.endswith('.parquet'):
+            print(json.dumps({'key': record.key, 'status': 'skipped'}))
+            continue
+        objects.append((record.bucket, record.key))
+    return objects
+
+'''
+S3 NOTIFICATIONS NAME THE PARQUET OBJECTS TO LOAD
+A queued micro-batch of object-created events or a schedule runs one
+incremental digest, which finds the new objects itself
+'''
+@handler_runtime.instrumented('NeptuneZone/Digest')
 def handler(event, context):
-    json_region = os.environ['AWS_REGION']
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json"
-        },
-        "body": json.dumps({
-            "Region ": json_region
-        })
-    }
\ No newline at end of file
+    entered = handler_runtime.now_ms()
+    records = event.get('Records', [])
+    # Only direct S3 notifications name objects, queued events just start an incremental run
+    notified = [record for record in handler_runtime.iter_records(event)
+                if record.source == 's3' and record.message_id is None]
+    objects = parquet_objects(notified)
+    if notified and not objects:
+        return {'path': None, 'files': 0}
+
+    endpoint = os.environ['NEPTUNE_ENDPOINT']
+    port = os.environ.get('NEPTUNE_PORT', '8182')
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000 if context else 300
+
+    sparql = sparql_writer.SparqlWriter(
+        get_neptune_client().write(),
+        max_bytes=int(os.environ.get('SPARQL_BATCH_BYTES', sparql_writer.DEFAULT_BATCH_BYTES))
+    )
+    loader = neptune_loader.NeptuneLoader(endpoint, port, os.environ['NEPTUNE_LOADER_ROLE_ARN'], os.environ['AWS_REGION'])
+    options = {
+        'bulk_threshold': int(os.environ.get('BULK_LOAD_THRESHOLD', digest_engine.DEFAULT_BULK_THRESHOLD)),
+        'file_triples': int(os.environ.get('BULK_LOAD_FILE_TRIPLES', digest_engine.DEFAULT_FILE_TRIPLES)),
+        'namespace': os.environ.get('GRAPH_NAMESPACE', rdf_mapping.DEFAULT_NAMESPACE),
+        'wait_seconds': max(0, remaining_seconds - 30)
+    }
+    staging_bucket = os.environ['NEPTUNE_BUCKET_NAME']
+    staging_prefix = os.environ.get('NEPTUNE_STAGING_PATH', 'staging')
+
+    state_path = os.environ.get('DIGEST_STATE_PATH', digest_state.DEFAULT_STATE_PATH)
+
+    if objects:
+        report = digest_engine.digest(handler_runtime.client('s3'), objects, sparql, loader, staging_bucket, staging_prefix, **options)
+        return publish(report, staging_bucket, state_path, entered)
+
+    try:
+        report = digest_engine.digest_incremental(
+            handler_runtime.client('s3'),
+            os.environ['CONFORMED_BUCKET_NAME'],
+            os.environ.get('PARQUET_DATA_PATH', 'test'),
+            staging_bucket,
+            state_path,
+            sparql,
+            loader,
+            staging_prefix,
+            max_files=int(os.environ.get('DIGEST_MAX_FILES', digest_state.DEFAULT_MAX_FILES)),
+            settle_seconds=int(os.environ.get('DIGEST_SETTLE_SECONDS', digest_state.DEFAULT_SETTLE_SECONDS)),
+            **options
+        )
+    except digest_state.StateConflict:
+        # A concurrent run saved the state first, the objects loaded here are found again and reloaded idempotently
+        report = {'path': None, 'conflict': True}
+    report['events'] = len(records)
+    return publish(report, staging_bucket, state_path, entered)
+
+def publish(report, bucket, state_path, entered):
+    for trace in report.pop('traces', []):
+        print(handler_runtime.trace_span(trace, 'digest', trace['key'], entered))
+    if digest_engine.graph_changed(report):
+        report['generation'] = digest_engine.publish_generation(handler_runtime.client('s3'), bucket, state_path, report)
+    print(json.dumps(report))
+    return report
@@ -0,0 +1,152 @@
+import json
+import time
+
+import partition_manifest
+
+'''
+DIGEST STATE
+Durable record of the conformed objects already loaded into the graph, so a
+run only reads the delta. It is one JSON object in the neptune zone bucket:
+
+    {"partitions": {"<parquet_prefix>/year=2023/doctype=itd/": {
+        "watermark": "<parquet_prefix>/year=2023/doctype=itd/part-20231017T101500",
+        "loaded": {"<key>": "<etag>", ...}}},
+     "pending_load": {"load_id": "...", "objects": [["<key>", "<etag>"], ...]}}
+
+Data files are named part-<UTC stamp>-..., so within a partition the keys
+sort by write time and each partition is listed with StartAfter=watermark.
+The watermark trails the last run by a settle interval, which covers writers
+whose PUT lands after a later-stamped file; objects between the watermark
+and now are remembered by key+ETag so they are not loaded twice. Partitions
+are found through their symlink manifests (one LIST for all of them).
+
+A compacted file whose inputs are all loaded (or loaded in the same run)
+holds no new rows: it is covered, marked as loaded without being read. One
+without lineage, or with an input still to load, is loaded again.
+'''
+
+MANIFEST_DIR = '_symlink'
+DEFAULT_STATE_PATH = 'digest_state'
+DEFAULT_SETTLE_SECONDS = 900
+DEFAULT_MAX_FILES = 500
+
+
+class StateConflict(Exception):
+    pass
+
+
+def _error_code(error):
+    return str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+
+
+def state_key(state_path):
+    return f"{state_path.strip('/')}/state.json"
+
+
+def generation_key(state_path):
+    return f"{state_path.strip('/')}/generation.json"
+
+
+def load_state(s3, bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except Exception as error:
+        if _error_code(error) in ('NoSuchKey', '404'):
+            return {'partitions': {}}, None
+        raise
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+'''
+SAVE THE STATE, FAILING IF ANOTHER RUN SAVED IT SINCE IT WAS READ
+'''
+def save_state(s3, bucket, key, state, etag):
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        response = s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(state).encode('utf-8'),
+                                 ContentType='application/json', **condition)
+    except Exception as error:
+        if _error_code(error) in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409', 'NoSuchKey'):
+            raise StateConflict(key)
+        raise
+    return response['ETag']
+
+
+def list_partitions(s3, bucket, parquet_prefix):
+    prefix = parquet_prefix.strip('/')
+    manifests = f"{prefix}/{MANIFEST_DIR}/"
+    partitions = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=manifests):
+        for obj in page.get('Contents', []):
+            partition_path = obj['Key'][len(manifests):].rsplit('/', 1)[0]
+            partitions.append(f"{prefix}/{partition_path}/")
+    return sorted(partitions)
+
+
+def watermark_at(partition, epoch):
+    return f"{partition}part-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(epoch))}"
+
+
+def _compaction_inputs(s3, bucket, parquet_prefix, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=partition_manifest.lineage_key(parquet_prefix, key))
+    except Exception as error:
+        if _error_code(error) in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(response['Body'].read())['inputs']
+
+
+'''
+LIST NEW OR CHANGED DATA FILES
+Returns up to max_files (key, etag) pairs to load, the covered compacted
+files (marked as loaded with them, never read) and the partitions that were
+fully listed, whose watermark may be advanced once the files are loaded
+'''
+def pending_objects(s3, bucket, parquet_prefix, state, max_files=DEFAULT_MAX_FILES):
+    pending = []
+    covered = []
+    drained = []
+    for partition in list_partitions(s3, bucket, parquet_prefix):
+        entry = state['partitions'].get(partition, {})
+        loaded = entry.get('loaded', {})
+        watermark = entry.get('watermark', '')
+        listed = set()
+        complete = True
+        for page in s3.get_paginator('list_objects_v2').paginate(
+                Bucket=bucket, Prefix=partition, StartAfter=entry.get('watermark', '')):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if not key.endswith('.parquet') or '/' in key[len(partition):] or loaded.get(key) == obj['ETag']:
+                    continue
+                if key.endswith(partition_manifest.COMPACTED_SUFFIX):
+                    inputs = _compaction_inputs(s3, bucket, parquet_prefix, key)
+                    if inputs is not None and all(
+                            item in loaded or item in listed or item <= watermark for item in inputs):
+                        covered.append((key, obj['ETag']))
+                        continue
+                if len(pending) == max_files:
+                    complete = False
+                    break
+                pending.append((key, obj['ETag']))
+                listed.add(key)
+            if not complete:
+                break
+        if not complete:
+            break
+        drained.append(partition)
+    return pending, covered, drained
+
+
+def mark_loaded(state, objects, drained, now=None, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    now = time.time() if now is None else now
+    for key, etag in objects:
+        partition = key.rsplit('/', 1)[0] + '/'
+        entry = state['partitions'].setdefault(partition, {'watermark': '', 'loaded': {}})
+        entry['loaded'][key] = etag
+
+    for partition in drained:
+        entry = state['partitions'].setdefault(partition, {'watermark': '', 'loaded': {}})
+        entry['watermark'] = max(entry['watermark'], watermark_at(partition, now - settle_seconds))
+        entry['loaded'] = {key: etag for key, etag in entry['loaded'].items() if key > entry['watermark']}
+    return state
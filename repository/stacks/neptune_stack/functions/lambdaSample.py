@@ -1,6 +1,9 @@
 import os
 import json
+
+import handler_runtime
         
+@handler_runtime.instrumented('Samples')
 def handler(event, context):
     json_region = os.environ['AWS_REGION']
     return {
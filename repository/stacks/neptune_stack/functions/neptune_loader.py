@@ -0,0 +1,86 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+'''
+NEPTUNE BULK LOADER
+Submits loader jobs for RDF files staged in S3 and polls them. The cluster
+reads the files itself through its associated IAM role, so a backfill does
+not have to go through SPARQL update requests.
+'''
+
+TERMINAL_STATUSES = {
+    'LOAD_COMPLETED', 'LOAD_COMMITTED_W_WRITE_CONFLICTS', 'LOAD_CANCELLED_BY_USER',
+    'LOAD_CANCELLED_DUE_TO_ERRORS', 'LOAD_UNEXPECTED_ERROR', 'LOAD_FAILED',
+    'LOAD_S3_READ_ERROR', 'LOAD_S3_ACCESS_DENIED_ERROR', 'LOAD_DATA_DEADLOCK',
+    'LOAD_DATA_FAILED_DUE_TO_FEED_MODIFIED_OR_DELETED', 'LOAD_FAILED_BECAUSE_DEPENDENCY_NOT_SATISFIED',
+    'LOAD_FAILED_INVALID_REQUEST'
+}
+
+
+def urllib_transport(method, url, body=None, timeout=30):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, json.loads(response.read() or b'{}')
+
+
+class NeptuneLoader:
+
+    def __init__(self, endpoint, port, iam_role_arn, region, transport=urllib_transport, sleep=time.sleep):
+        self.url = f"https://{endpoint}:{port}/loader"
+        self.iam_role_arn = iam_role_arn
+        self.region = region
+        self.transport = transport
+        self.sleep = sleep
+
+    '''
+    SEND A LOADER REQUEST, A NON-2XX ANSWER FAILS WITH THE ERROR BODY OF THE LOADER
+    urlopen raises HTTPError for those, its body names the reason (BadRequestException, ...)
+    '''
+    def _request(self, method, url, body, description):
+        try:
+            status, response = self.transport(method, url, body)
+        except urllib.error.HTTPError as error:
+            status, response = error.code, error.read().decode('utf-8', errors='replace')
+        if not 200 <= status < 300:
+            raise RuntimeError(f"{description} failed with {status}: {response}")
+        return response
+
+    def start(self, source_uri, data_format='ntriples', parallelism='MEDIUM'):
+        response = self._request('POST', self.url, {
+            'source': source_uri,
+            'format': data_format,
+            'iamRoleArn': self.iam_role_arn,
+            'region': self.region,
+            'failOnError': 'FALSE',
+            'parallelism': parallelism,
+            'updateSingleCardinalityProperties': 'FALSE',
+            'queueRequest': 'TRUE'
+        }, f"Loader request for {source_uri}")
+        return response['payload']['loadId']
+
+    def status(self, load_id):
+        response = self._request('GET', f"{self.url}/{load_id}?details=true&errors=true", None,
+                                 f"Status request of load {load_id}")
+        overall = response['payload']['overallStatus']
+        return {
+            'load_id': load_id,
+            'status': overall['status'],
+            'total_records': overall.get('totalRecords', 0),
+            'total_time_seconds': overall.get('totalTimeSpent', 0),
+            'parsing_errors': overall.get('parsingErrors', 0),
+            'insert_errors': overall.get('insertErrors', 0)
+        }
+
+    '''
+    POLL A LOAD UNTIL IT FINISHES OR THE TIME BUDGET RUNS OUT (THE LAST STATUS IS RETURNED EITHER WAY)
+    '''
+    def wait(self, load_id, poll_seconds=5, budget_seconds=300, clock=time.monotonic):
+        deadline = clock() + budget_seconds
+        while True:
+            status = self.status(load_id)
+            if status['status'] in TERMINAL_STATUSES or clock() + poll_seconds > deadline:
+                return status
+            self.sleep(poll_seconds)
@@ -0,0 +1,61 @@
+'''
+RDF MAPPING
+Maps rows of the conformed zone to N-Triples. Every document becomes one
+subject identified by its content hash, so loading the same row twice leaves
+the graph unchanged.
+'''
+
+DEFAULT_NAMESPACE = 'urn:project:'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+
+LITERAL_PROPERTIES = [
+    ('document_name', 'documentName', None),
+    ('document_flag', 'documentFlag', None),
+    ('doctype', 'documentType', None),
+    ('year', 'year', 'integer'),
+    ('page_count', 'pageCount', 'integer'),
+    ('line_count', 'lineCount', 'integer'),
+    ('source_key', 'sourceKey', None)
+]
+
+
+def escape_literal(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def literal(value, datatype=None):
+    if datatype:
+        return f'"{escape_literal(value)}"^^<{XSD}{datatype}>'
+    return f'"{escape_literal(value)}"'
+
+
+def document_triples(row, namespace=DEFAULT_NAMESPACE):
+    subject = f"<{namespace}document/{row['content_sha256']}>"
+    triples = [(subject, RDF_TYPE, f"<{namespace}Document>")]
+    for column, predicate, datatype in LITERAL_PROPERTIES:
+        value = row.get(column)
+        if value is not None:
+            triples.append((subject, f"<{namespace}{predicate}>", literal(value, datatype)))
+    return triples
+
+
+def rows_to_triples(rows, namespace=DEFAULT_NAMESPACE):
+    triples = []
+    for row in rows:
+        if row.get('content_sha256'):
+            triples.extend(document_triples(row, namespace))
+    return triples
+
+
+def ntriples(triples):
+    return ''.join(f"{s} {p} {o} .\n" for s, p, o in triples)
+
+
+'''
+SPLIT TRIPLES INTO N-TRIPLES CHUNKS OF AT MOST max_triples EACH
+'''
+def ntriples_chunks(triples, max_triples):
+    for start in range(0, len(triples), max_triples):
+        yield ntriples(triples[start:start + max_triples])
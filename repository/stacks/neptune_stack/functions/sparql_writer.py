@@ -0,0 +1,79 @@
+import random
+import time
+import urllib.parse
+
+import rdf_mapping
+
+'''
+SPARQL WRITER
+Sends small deltas to Neptune as INSERT DATA updates. Triples are grouped
+into size-bounded requests, which go to the writer over a keep-alive
+session of the shared neptune_client that warm invocations reuse.
+Concurrent modification and throttling responses are retried with jittered
+exponential backoff. Larger batches go through the bulk loader instead (see
+digest_engine).
+'''
+
+DEFAULT_BATCH_BYTES = 512 * 1024
+DEFAULT_BATCH_TRIPLES = 10000
+RETRYABLE_CODES = ('ConcurrentModificationException', 'ThrottlingException')
+RETRYABLE_STATUSES = {429, 503}
+
+
+class SparqlUpdateError(Exception):
+
+    def __init__(self, status, body):
+        super().__init__(f"SPARQL update failed with {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+
+
+def batches(triples, max_bytes=DEFAULT_BATCH_BYTES, max_triples=DEFAULT_BATCH_TRIPLES):
+    batch, size = [], 0
+    for triple in triples:
+        line = rdf_mapping.ntriples([triple])
+        if batch and (size + len(line) > max_bytes or len(batch) >= max_triples):
+            yield batch
+            batch, size = [], 0
+        batch.append(triple)
+        size += len(line)
+    if batch:
+        yield batch
+
+
+def is_retryable(status, body):
+    return status in RETRYABLE_STATUSES or any(code in body for code in RETRYABLE_CODES)
+
+
+class SparqlWriter:
+
+    def __init__(self, session, max_bytes=DEFAULT_BATCH_BYTES, max_triples=DEFAULT_BATCH_TRIPLES,
+                 max_retries=6, base_delay=0.1, max_delay=5.0, sleep=time.sleep, rng=random):
+        self.session = session
+        self.max_bytes = max_bytes
+        self.max_triples = max_triples
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng
+
+    def _send(self, batch):
+        update = 'INSERT DATA {\n' + rdf_mapping.ntriples(batch) + '}'
+        body = urllib.parse.urlencode({'update': update}).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            status, response = self.session.post('/sparql', body, 'application/x-www-form-urlencoded')
+            if status == 200:
+                return attempt
+            if attempt == self.max_retries or not is_retryable(status, response):
+                raise SparqlUpdateError(status, response)
+            # Full jitter keeps concurrent writers from retrying in lockstep
+            self.sleep(self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def insert(self, triples):
+        stats = {'triples': 0, 'requests': 0, 'retries': 0}
+        for batch in batches(triples, self.max_bytes, self.max_triples):
+            stats['retries'] += self._send(batch)
+            stats['requests'] += 1
+            stats['triples'] += len(batch)
+        return stats
@@ -4,18 +4,21 @@ import aws_cdk as core
 from aws_cdk import (
     Stack,
     aws_ec2 as _ec2, 
-    aws_ecs as _ecs,
     aws_s3 as _s3,
     aws_iam as _iam,
     aws_s3_notifications as _s3n,
-    aws_ecs_patterns as _ecs_patterns,
     aws_neptune as _neptune,
-    aws_sagemaker as _sagemaker,
-    aws_lambda as _lambda,
+    aws_events as _events,
+    aws_events_targets as _events_targets,
+    aws_sqs as _sqs,
+    aws_lambda_event_sources as _lambda_event_sources,
+    aws_ssm as _ssm,
+    aws_applicationautoscaling as _appscaling,
     Duration as _Duration
 )
 
 from repository.util import util as _util
+from repository.util.profiled_function import ProfiledFunction
 
 from constructs import Construct
 
@@ -29,12 +32,21 @@ class NeptuneStack(Stack):
         ########## INITIALIZER ##########       
         self.properties = self.node.try_get_context("properties").get("properties")
         self.functions_path = os.path.join(os.path.dirname(__file__), self.properties.get("functions_path"))
-        self.neptune_data_path = str(self.properties.get("neptune_data_path"))
+        self.neptune_data_path = str(self.properties.get("neptune_data_path")).strip("/")
+        self.neptune_staging_path = str(self.properties.get("neptune_staging_path", "staging")).strip("/")
+        self.bulk_load = self.properties.get("bulk_load", {})
+        self.digest_settings = self.properties.get("digest", {})
+        self.digest_state_path = str(self.digest_settings.get("state_path", "digest_state")).strip("/")
+
+        #"microbatch" QUEUES THE CONFORMED ZONE OBJECT-CREATED EVENTS, "direct" DIGESTS PARQUET DROPPED UNDER neptune_data_path
+        self.digest_trigger_mode = self.digest_settings.get("trigger_mode", "microbatch")
+        if self.digest_trigger_mode == "direct":
+            check_disjoint_prefixes(self.neptune_data_path, [self.neptune_staging_path, self.digest_state_path])
         env_prefix = self.node.try_get_context("properties").get("env_prefix")
         self.component_prefix = f"project-{env_prefix}"
+        self.sizing = sizing_profile(self.properties, env_prefix)
         self.saml_provider_ARN = self.properties.get("saml_provider_ARN")
         self.neptune_cluster_ARN = self.properties.get("neptune_cluster_ARN")
-        zip_path = os.path.join(os.path.dirname(__file__), "layer/sparqlwrapper.zip")
         
         #CREATING BUCKET TO STORE GRAPH MODELED DATA
         _neptune_zone_bucket_name = f"{self.component_prefix}-s3-neptunezone"
@@ -54,36 +66,28 @@ class NeptuneStack(Stack):
             security_group_name=_lambda_digest_name
         )
 
-        #CREATE AWS MANAGED AWSSDKPandas LAYER
-        AWSSDKPandas_layer_arn = "arn:aws:lambda:eu-west-1:123456789012:layer:AWSSDKPandas-Python39:8"
-        AWSSDKPandas_layer = _lambda.LayerVersion.from_layer_version_arn(
-            self, 'AWSManagedLayer', AWSSDKPandas_layer_arn)
-        
-        #CUSTOM SPARQLWrapper LAYER
-        sparqlwrapper_layer = self.define_layer(_function_name="sparqlwrapper_layer", _function_path=zip_path)
-
-        #ADD LAYERS TO A LIST
-        layer_list = [AWSSDKPandas_layer, sparqlwrapper_layer]
+        #THE DIGEST READS PARQUET WITH THE PYARROW LAYER AND TALKS SPARQL THROUGH THE SHARED LAYER CLIENT
+        layer_list = [_util.define_dependency_layer(self, "pyarrow")]
 
         #CREATE DIGEST FUNCTION
-        self.digest_function = _util.define_lambda_function_on_vpc_with_secgroup_and_layer(
+        self.digest_function = ProfiledFunction(
             self, 
             'digest_function', 
             self.functions_path,
-            network_stack.vpc,
-            sg_lambda_digest,
-            layer_list
+            profile="digest",
+            layers=layer_list,
+            vpc=network_stack.vpc,
+            security_groups=[sg_lambda_digest]
         )
 
-        #ListObjectsV2
+        #ListObjectsV2 (STARTAFTER LISTING OF THE CONFORMED PARTITIONS)
         self.digest_function.add_to_role_policy(
             _iam.PolicyStatement( # Allow extra policies for conformed zone S3 Bucket
                 effect=_iam.Effect.ALLOW,
                 actions=[
-                    "s3:ListObjectsV2"
+                    "s3:ListBucket"
                 ],
-                resources=[comformed_zone_stack.conformed_zone_bucket.bucket_arn,
-                        f"{comformed_zone_stack.conformed_zone_bucket.bucket_arn}/*"]
+                resources=[comformed_zone_stack.conformed_zone_bucket.bucket_arn]
             )
         )
 
@@ -99,24 +103,64 @@ class NeptuneStack(Stack):
             )
         )
 
+        #THE DIGEST FUNCTION AND THE NEPTUNE LOADER READ AND WRITE OBJECTS THROUGH THE SAME ENDPOINT
+        #THE ARN IS BUILT FROM THE NAME SO THE NETWORK STACK DOES NOT DEPEND ON THIS ONE
+        network_stack.s3_endpoint.add_to_policy(
+            _iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW,
+                principals=[_iam.AnyPrincipal()],
+                actions=[
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:ListBucket"
+                ],
+                resources=[f"{comformed_zone_stack.conformed_zone_bucket.bucket_arn}/*",
+                        f"arn:aws:s3:::{_neptune_zone_bucket_name}",
+                        f"arn:aws:s3:::{_neptune_zone_bucket_name}/*"]
+            )
+        )
+
         #GRANT READ ACCESS SO THE RECEPTION FUNCTION CAN READ AND WRITE ON THE BUCKET
         comformed_zone_stack.conformed_zone_bucket.grant_read(
             self.digest_function
         )
 
-        #GRANT WRITE PRIVILEGE SO THE DIGEST FUNCTION CAN STORE FILES IN NEPTUNE PREINGESTION BUCKET
+        #GRANT WRITE PRIVILEGE SO THE DIGEST FUNCTION CAN STAGE FILES FOR THE NEPTUNE LOADER
         self.neptune_data_bucket.grant_write(
             self.digest_function, 
-            objects_key_pattern=self.neptune_data_path
+            objects_key_pattern=f"{self.neptune_staging_path}/*"
         )
 
-        self.neptune_data_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.digest_function),
-            _s3.NotificationKeyFilter(
-                prefix=self.neptune_data_path
+        #THE DIGEST STATE (OBJECTS ALREADY LOADED INTO THE GRAPH) LIVES NEXT TO THE STAGED FILES
+        self.neptune_data_bucket.grant_read_write(
+            self.digest_function,
+            objects_key_pattern=f"{self.digest_state_path}/*"
+        )
+
+        if self.digest_trigger_mode == "direct":
+            #ONLY PARQUET DROPS TRIGGER THE DIGEST, IT NEVER WRITES UNDER THIS PREFIX
+            self.neptune_data_bucket.grant_read(
+                self.digest_function,
+                objects_key_pattern=f"{self.neptune_data_path}/*"
             )
+            self.neptune_data_bucket.add_event_notification(
+                _s3.EventType.OBJECT_CREATED, 
+                _s3n.LambdaDestination(self.digest_function.live),
+                _s3.NotificationKeyFilter(
+                    prefix=f"{self.neptune_data_path}/",
+                    suffix=".parquet"
+                )
+            )
+        else:
+            self.create_digest_trigger(comformed_zone_stack)
+
+        #ROLE THE NEPTUNE CLUSTER ASSUMES TO READ THE STAGED FILES DURING A BULK LOAD
+        _loader_role_name = f"{self.component_prefix}-iam-neptuneloader"
+        self.neptune_loader_role = _iam.Role(self, _loader_role_name,
+            role_name=_loader_role_name,
+            assumed_by=_iam.ServicePrincipal("rds.amazonaws.com")
         )
+        self.neptune_data_bucket.grant_read(self.neptune_loader_role, f"{self.neptune_staging_path}/*")
 
         ########## NEPTUNE ##########
         _neptune_cluster_name = f"{self.component_prefix}-neptune-cluster"
@@ -124,12 +168,121 @@ class NeptuneStack(Stack):
             _neptune_cluster_name, 
             network_stack.vpc, 
             fargate_stack.fargateServiceSecGroup,
-            sg_lambda_digest
+            sg_lambda_digest,
+            self.neptune_loader_role
         )
+
+        #DIGEST CONFIGURATION, BATCHES ABOVE THE THRESHOLD GO THROUGH THE BULK LOADER
+        self.digest_function.add_environment("NEPTUNE_ENDPOINT", graph_db.attr_endpoint)
+        self.digest_function.add_environment("NEPTUNE_READ_ENDPOINT", graph_db.attr_read_endpoint)
+        self.digest_function.add_environment("NEPTUNE_PORT", graph_db.attr_port)
+        self.digest_function.add_environment("NEPTUNE_LOADER_ROLE_ARN", self.neptune_loader_role.role_arn)
+        self.digest_function.add_environment("NEPTUNE_BUCKET_NAME", self.neptune_data_bucket.bucket_name)
+        self.digest_function.add_environment("NEPTUNE_STAGING_PATH", self.neptune_staging_path)
+        self.digest_function.add_environment("BULK_LOAD_THRESHOLD", str(self.bulk_load.get("threshold_triples", 50000)))
+        self.digest_function.add_environment("BULK_LOAD_FILE_TRIPLES", str(self.bulk_load.get("file_triples", 500000)))
+        self.digest_function.add_environment("SPARQL_BATCH_BYTES", str(int(self.properties.get("sparql_batch_kb", 512)) * 1024))
+        self.digest_function.add_environment("GRAPH_NAMESPACE", str(self.properties.get("graph_namespace", "urn:project:")))
+
+        #INCREMENTAL DIGEST OF THE CONFORMED ZONE, ONLY OBJECTS NOT LOADED YET ARE READ
+        self.digest_function.add_environment("CONFORMED_BUCKET_NAME", comformed_zone_stack.conformed_zone_bucket.bucket_name)
+        self.digest_function.add_environment("PARQUET_DATA_PATH", str(self.properties.get("parquet_data_path")))
+        self.digest_function.add_environment("DIGEST_STATE_PATH", self.digest_state_path)
+        self.digest_function.add_environment("DIGEST_MAX_FILES", str(self.digest_settings.get("max_files", 500)))
+        self.digest_function.add_environment("DIGEST_SETTLE_SECONDS", str(self.digest_settings.get("settle_seconds", 900)))
+
+        _digest_rule_name = f"{self.component_prefix}-events-digest"
+        _events.Rule(
+            self,
+            _digest_rule_name,
+            rule_name=_digest_rule_name,
+            schedule=_events.Schedule.expression(self.digest_settings.get("schedule", "rate(15 minutes)")),
+            targets=[_events_targets.LambdaFunction(self.digest_function.live)]
+        )
+
+        self.export_endpoints(graph_db)
         
         ########## NEPTUNE [END] ##########
     
-    def create_neptune_cluster(self , _cluster_name, _vpc, sg_fargate, sg_lambda_digest):
+    '''
+    MICRO-BATCHED DIGEST TRIGGER
+    Object-created events of the conformed zone data files go through EventBridge
+    into a queue. The event source hands them over in batches of up to batch_size
+    events or window_seconds, and each batch starts one incremental digest run.
+    '''
+    def create_digest_trigger(self, comformed_zone_stack):
+        microbatch = self.digest_settings.get("microbatch", {})
+        _queue_name = f"{self.component_prefix}-sqs-digest-trigger"
+        dead_letter_queue = _sqs.Queue(
+            self,
+            f"{_queue_name}-dlq",
+            queue_name=f"{_queue_name}-dlq",
+            encryption=_sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            retention_period=_Duration.days(14)
+        )
+
+        #VISIBILITY TIMEOUT FOLLOWS THE AWS GUIDANCE OF SIX TIMES THE FUNCTION TIMEOUT
+        queue = _sqs.Queue(
+            self,
+            _queue_name,
+            queue_name=_queue_name,
+            encryption=_sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            visibility_timeout=_Duration.seconds(self.digest_function.timeout.to_seconds() * 6),
+            dead_letter_queue=_sqs.DeadLetterQueue(
+                max_receive_count=microbatch.get("max_receive_count", 3),
+                queue=dead_letter_queue
+            )
+        )
+
+        _rule_name = f"{self.component_prefix}-events-digest-trigger"
+        _events.Rule(
+            self,
+            _rule_name,
+            rule_name=_rule_name,
+            event_pattern=_events.EventPattern(
+                source=["aws.s3"],
+                detail_type=["Object Created"],
+                detail={
+                    "bucket": {"name": [comformed_zone_stack.conformed_zone_bucket.bucket_name]},
+                    "object": {"key": [{"prefix": f"{comformed_zone_stack.parquet_data_path.strip('/')}/year="}]}
+                }
+            ),
+            targets=[_events_targets.SqsQueue(queue)]
+        )
+
+        #THE STATE IS SAVED CONDITIONALLY, TWO RUNS AT MOST KEEP CONFLICTS RARE
+        self.digest_function.live.add_event_source(_lambda_event_sources.SqsEventSource(
+            queue,
+            batch_size=microbatch.get("batch_size", 1000),
+            max_batching_window=_Duration.seconds(microbatch.get("window_seconds", 120)),
+            max_concurrency=2
+        ))
+        return queue
+
+    '''
+    WRITER AND READER ENDPOINTS
+    Exported as stack outputs and published as SSM parameters, which is how the
+    explorer tasks (deployed before this stack) find them at runtime
+    '''
+    def export_endpoints(self, graph_db):
+        endpoints = {
+            "writer-endpoint": graph_db.attr_endpoint,
+            "reader-endpoint": graph_db.attr_read_endpoint,
+            "port": graph_db.attr_port
+        }
+        for name, value in endpoints.items():
+            core.CfnOutput(self, f"neptune-{name}",
+                value=value,
+                export_name=f"{self.component_prefix}-neptune-{name}"
+            )
+            _ssm.StringParameter(self, f"{self.component_prefix}-ssm-neptune-{name}",
+                parameter_name=_util.neptune_endpoint_parameter_name(self.component_prefix, name),
+                string_value=value
+            )
+
+    def create_neptune_cluster(self , _cluster_name, _vpc, sg_fargate, sg_lambda_digest, loader_role):
         sg_graph_db = _ec2.SecurityGroup(self, f"{_cluster_name}-sg",
             vpc=_vpc,
             allow_all_outbound=True,
@@ -159,13 +312,13 @@ class NeptuneStack(Stack):
             backup_retention_period=1,
             preferred_backup_window='00:00-06:00',
             preferred_maintenance_window='sun:22:00-mon:00:00',
-            vpc_security_group_ids=[sg_graph_db.security_group_id]
+            vpc_security_group_ids=[sg_graph_db.security_group_id],
+            associated_roles=[_neptune.CfnDBCluster.DBClusterRoleProperty(role_arn=loader_role.role_arn)]
         )
         graph_db.add_dependency(graph_db_subnet_group)
 
         graph_db_instance = _neptune.CfnDBInstance(self, f"{_cluster_name}-instance",
-            db_instance_class='db.t3.medium',
-            #db_instance_class='db.r5.large',
+            db_instance_class=self.sizing["writer_instance_class"],
             allow_major_version_upgrade=False,
             auto_minor_version_upgrade=False,
             availability_zone=_vpc.availability_zones[0],
@@ -175,29 +328,85 @@ class NeptuneStack(Stack):
         )
         graph_db_instance.add_dependency(graph_db)
 
-        _neptune_replica_name = f"{_cluster_name}-replica"
-        graph_db_replica_instance = _neptune.CfnDBInstance(
-            self, 
-            _neptune_replica_name,
-            db_instance_class='db.t3.medium',
-            #db_instance_class='db.r5.large',
-            allow_major_version_upgrade=False,
-            auto_minor_version_upgrade=False,
-            availability_zone=_vpc.availability_zones[-1],
-            db_cluster_identifier=graph_db.db_cluster_identifier,
-            db_instance_identifier=_neptune_replica_name,
-            preferred_maintenance_window='sun:18:00-sun:18:30'
-        )
-        graph_db_replica_instance.add_dependency(graph_db)
-        graph_db_replica_instance.add_dependency(graph_db_instance)
+        #THE PROFILE'S MINIMUM OF READERS IS PROVISIONED HERE, SPREAD FROM THE LAST AVAILABILITY ZONE BACKWARDS
+        replicas = []
+        for index in range(self.sizing["min_replicas"]):
+            _neptune_replica_name = f"{_cluster_name}-replica" + (f"-{index + 1}" if index else "")
+            graph_db_replica_instance = _neptune.CfnDBInstance(
+                self, 
+                _neptune_replica_name,
+                db_instance_class=self.sizing["reader_instance_class"],
+                allow_major_version_upgrade=False,
+                auto_minor_version_upgrade=False,
+                availability_zone=_vpc.availability_zones[-1 - index % len(_vpc.availability_zones)],
+                db_cluster_identifier=graph_db.db_cluster_identifier,
+                db_instance_identifier=_neptune_replica_name,
+                preferred_maintenance_window='sun:18:00-sun:18:30'
+            )
+            graph_db_replica_instance.add_dependency(graph_db)
+            graph_db_replica_instance.add_dependency(graph_db_instance)
+            replicas.append(graph_db_replica_instance)
+
+        if self.sizing["max_replicas"] > self.sizing["min_replicas"]:
+            self.add_replica_autoscaling(graph_db, [graph_db_instance] + replicas)
 
         return graph_db
 
-    def define_layer(self, _function_name, _function_path):
-        print("Creating LAMBDA layer: " + _function_name + "/" + _function_path)
-        
-        return _lambda.LayerVersion(
+    '''
+    READ REPLICA AUTOSCALING
+    Application Auto Scaling adds readers (up to max_replicas) when their average
+    CPU stays above the profile's target and removes the ones it added when it drops
+    '''
+    def add_replica_autoscaling(self, graph_db, instances):
+        _scaling_name = f"{self.component_prefix}-neptune-readerscaling"
+        scalable_target = _appscaling.ScalableTarget(
             self,
-            id=_function_name, 
-            code=_lambda.Code.from_asset(_function_path)
-        )
\ No newline at end of file
+            _scaling_name,
+            service_namespace=_appscaling.ServiceNamespace.NEPTUNE,
+            scalable_dimension="neptune:cluster:ReadReplicaCount",
+            resource_id=f"cluster:{graph_db.db_cluster_identifier}",
+            min_capacity=self.sizing["min_replicas"],
+            max_capacity=self.sizing["max_replicas"]
+        )
+        for instance in instances:
+            scalable_target.node.add_dependency(instance)
+
+        scalable_target.scale_to_track_metric(
+            f"{_scaling_name}-cpu",
+            predefined_metric=_appscaling.PredefinedMetric.NEPTURE_READER_AVERAGE_CPU_UTILIZATION,
+            target_value=self.sizing.get("reader_cpu_target", 70),
+            scale_out_cooldown=_Duration.seconds(self.sizing.get("scale_out_cooldown_seconds", 300)),
+            scale_in_cooldown=_Duration.seconds(self.sizing.get("scale_in_cooldown_seconds", 900))
+        )
+        return scalable_target
+
+'''
+THE DIGEST MUST NEVER WRITE UNDER THE PREFIX THAT TRIGGERS IT
+'''
+def check_disjoint_prefixes(trigger_prefix, write_prefixes):
+    trigger = trigger_prefix.strip("/") + "/"
+    for prefix in write_prefixes:
+        written = prefix.strip("/") + "/"
+        if written.startswith(trigger) or trigger.startswith(written):
+            raise ValueError(f"Digest writes under '{written}' would re-trigger it through '{trigger}'")
+
+
+'''
+SIZING PROFILE OF THE ENVIRONMENT
+properties.sizing_profiles is keyed by profile name, the profile is picked by
+properties.sizing_profile and defaults to the environment prefix
+'''
+def sizing_profile(properties, env_prefix):
+    profiles = properties.get("sizing_profiles", {})
+    name = properties.get("sizing_profile", env_prefix)
+    if name not in profiles:
+        raise ValueError(f"No Neptune sizing profile '{name}' in sizing_profiles ({', '.join(sorted(profiles))})")
+
+    profile = dict(profiles[name])
+    profile.setdefault("writer_instance_class", "db.t3.medium")
+    profile.setdefault("reader_instance_class", profile["writer_instance_class"])
+    profile.setdefault("min_replicas", 1)
+    profile.setdefault("max_replicas", profile["min_replicas"])
+    if not 0 <= profile["min_replicas"] <= profile["max_replicas"] <= 15:
+        raise ValueError(f"Sizing profile '{name}' needs 0 <= min_replicas <= max_replicas <= 15")
+    return profile
@@ -1,7 +1,6 @@
 from aws_cdk import (
     Stack,
-    aws_ec2 as ec2,
-    aws_elasticloadbalancingv2 as elbv2
+    aws_ec2 as ec2
 )
 from constructs import (
     Construct
@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import handler_runtime
+import move_engine
+
+'''
+CHECK-IN ENGINE
+Moves a batch of newly uploaded objects from the input prefix to the raw
+prefix on a bounded thread pool (see move_engine) and reports the outcome of every record, so a
+single bad key never fails the whole batch. With a document router, every
+document is classified, copied to its normalized raw key and announced to
+the OCR function of its type (see document_router).
+'''
+
+DEFAULT_MAX_WORKERS = 16
+# Headers S3 drops when a copy replaces the metadata
+COPIED_HEADERS = ('CacheControl', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage')
+
+
+'''
+RAISED BY THE HANDLER OF A DIRECT (ASYNCHRONOUS) INVOCATION WITH FAILED RECORDS
+Lambda then retries the event; the records already moved are dropped by the dedup index
+'''
+class CheckinFailed(Exception):
+    pass
+
+
+class CheckinRecord:
+
+    def __init__(self, bucket, key, size=None, etag=None, sequencer=None, record_id=None):
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.sequencer = sequencer
+        self.record_id = record_id
+
+
+'''
+PARSE THE S3 RECORDS OF AN EVENT (DIRECT OR SQS WRAPPED)
+'''
+def parse_s3_records(event):
+    records = []
+    for record in handler_runtime.iter_records(event):
+        if record.bucket is None:
+            continue
+        records.append(CheckinRecord(
+            bucket=record.bucket,
+            key=record.key,
+            size=record.size,
+            etag=record.etag,
+            sequencer=record.sequencer,
+            record_id=record.message_id
+        ))
+    return records
+
+
+'''
+MAP AN INPUT KEY TO ITS RAW KEY (None WHEN THE KEY IS OUTSIDE THE INPUT PREFIX)
+'''
+def destination_key(key, input_prefix, raw_prefix):
+    input_prefix = input_prefix.strip('/') + '/'
+    raw_prefix = raw_prefix.strip('/') + '/'
+    if not key.startswith(input_prefix) or key == input_prefix:
+        return None
+    return raw_prefix + key[len(input_prefix):]
+
+
+'''
+MOVE ONE RECORD
+With a dedup index, redelivered events and already checked-in contents are
+dropped before the copy; the claims are released again if the copy fails so a
+retry is not mistaken for a duplicate. The copy starts the trace of the
+document (see handler_runtime), unless the uploader already set one.
+
+Documents the router cannot classify are left in the input prefix as
+unclassified, their claims released so they go through once the routing
+table knows their type.
+
+The source is deleted once the copy is verified and announced when the move
+settings ask for it, and right away when its content was already checked in. A redelivered event of a moved object then fails on the
+missing source, the dedup index is what drops it.
+'''
+def copy_record(s3, record, input_prefix, raw_prefix, dedup=None, hasher=None, router=None, events=None,
+                move=move_engine.MoveSettings()):
+    entered = handler_runtime.now_ms()
+    new_key = destination_key(record.key, input_prefix, raw_prefix)
+    result = {
+        'bucket': record.bucket,
+        'key': record.key,
+        'destination_key': new_key,
+        'record_id': record.record_id
+    }
+
+    if new_key is None:
+        result['status'] = 'skipped'
+        return result
+
+    claims = []
+    try:
+        if dedup is not None and record.sequencer:
+            claim = dedup.claim_event(record.bucket, record.key, record.sequencer)
+            if claim is None:
+                result['status'] = 'duplicate'
+                result['reason'] = 'event'
+                return result
+            claims.append(claim)
+
+        # Read before the content is hashed, so its ETag is at most as recent as the hashed version
+        head = s3.head_object(Bucket=record.bucket, Key=record.key, ChecksumMode='ENABLED')
+
+        if dedup is not None:
+            result['content_sha256'] = hasher(s3, record.bucket, record.key)
+            claim = dedup.claim_content(result['content_sha256'], record.key)
+            if claim is None:
+                result['status'] = 'duplicate'
+                result['reason'] = 'content'
+                if move.delete_source:
+                    result['source_deleted'] = move_engine.delete_source(s3, record.bucket, record.key, head['ETag'])
+                return result
+            claims.append(claim)
+
+        # The copy replaces the metadata to add the trace, the uploader's metadata and headers are kept
+        route = None
+        if router is not None:
+            relative_key = record.key[len(input_prefix.strip('/')) + 1:]
+            route = router.classify(s3, record.bucket, record.key, relative_key, head)
+            if route is None:
+                result['status'] = 'unclassified'
+                result['destination_key'] = None
+                _release(dedup, claims)
+                return result
+            new_key = router.raw_key(raw_prefix, relative_key, route)
+            result['destination_key'] = new_key
+            result['document_type'] = route.document_type
+        metadata = head.get('Metadata') or {}
+        trace = (handler_runtime.trace_from_metadata(metadata)
+                 or handler_runtime.new_trace(handler_runtime.epoch_ms(head.get('LastModified'))))
+        result['method'] = move_engine.copy(
+            s3, record.bucket, record.key, new_key, head, move,
+            Metadata={**metadata, **handler_runtime.trace_metadata(trace)},
+            ContentType=head.get('ContentType', 'binary/octet-stream'),
+            **{header: head[header] for header in COPIED_HEADERS if head.get(header)}
+        )
+        result['verified'] = move_engine.verify(s3, record.bucket, new_key, head)
+        if route is not None:
+            router.publish(events, router.event(record.bucket, new_key, route, trace['trace_id'],
+                                                head.get('ContentLength', record.size)))
+        if move.delete_source:
+            result['source_deleted'] = move_engine.delete_source(s3, record.bucket, record.key, head['ETag'])
+        result['status'] = 'copied'
+        result['trace_id'] = trace['trace_id']
+        print(handler_runtime.trace_span(trace, 'checkin', record.key, entered))
+    except Exception as error:
+        result['status'] = 'failed'
+        result['error'] = f"{type(error).__name__}: {error}"
+        _release(dedup, claims)
+
+    return result
+
+
+def _release(dedup, claims):
+    for claim in claims:
+        try:
+            dedup.release(claim)
+        except Exception as release_error:
+            print(f"Failed to release dedup claim {claim}: {release_error}")
+
+
+'''
+MOVE A BATCH OF RECORDS IN PARALLEL, RESULTS ARE RETURNED IN INPUT ORDER
+'''
+def copy_records(s3, records, input_prefix, raw_prefix, max_workers=DEFAULT_MAX_WORKERS, dedup=None, hasher=None,
+                 router=None, events=None, move=move_engine.MoveSettings()):
+    if not records:
+        return []
+
+    def copy(record):
+        return copy_record(s3, record, input_prefix, raw_prefix, dedup=dedup, hasher=hasher, router=router,
+                           events=events, move=move)
+
+    workers = max(1, min(int(max_workers), len(records)))
+    if workers == 1:
+        return [copy(record) for record in records]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(copy, records))
+
+
+def summarize(results):
+    summary = {'copied': 0, 'duplicate': 0, 'skipped': 0, 'failed': 0}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
@@ -0,0 +1,23 @@
+import base64
+import hashlib
+
+'''
+CONTENT HASH
+SHA-256 of an S3 object, taken from the full-object checksum S3 stores when
+one is available and otherwise computed by streaming the body.
+'''
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_sha256(s3, bucket, key):
+    head = s3.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+    checksum = head.get('ChecksumSHA256')
+    if checksum and head.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT' and '-' not in checksum:
+        return base64.b64decode(checksum).hex()
+
+    digest = hashlib.sha256()
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    for chunk in body.iter_chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+
+'''
+DEDUP INDEX
+Idempotency index of the check-in stage, stored in DynamoDB.
+
+    event#<bucket>/<key>#<sequencer>   one S3 notification, expires after the TTL
+    content#<sha256>                   one document content, kept forever
+
+Claims are conditional puts, so only the first delivery of an event and the
+first upload of a content ever reach the downstream stages.
+'''
+
+DEFAULT_EVENT_TTL_SECONDS = 7 * 24 * 3600
+
+
+class DedupIndex:
+
+    def __init__(self, dynamodb, table_name, event_ttl_seconds=DEFAULT_EVENT_TTL_SECONDS, clock=time.time):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.event_ttl_seconds = event_ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _claim(self, pk, attributes):
+        item = {'pk': {'S': pk}, 'claimed_at': {'N': str(int(self.clock()))}}
+        item.update(attributes)
+        try:
+            self.dynamodb.put_item(
+                TableName=self.table_name,
+                Item=item,
+                ConditionExpression='attribute_not_exists(pk)'
+            )
+        except Exception as error:
+            if getattr(error, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                with self._lock:
+                    self.hits += 1
+                return None
+            raise
+        with self._lock:
+            self.misses += 1
+        return pk
+
+    '''
+    CLAIM ONE DELIVERY OF AN S3 NOTIFICATION, RETURNS THE CLAIM OR None FOR A REDELIVERY
+    '''
+    def claim_event(self, bucket, key, sequencer):
+        return self._claim(
+            f"event#{bucket}/{key}#{sequencer}",
+            {'expires_at': {'N': str(int(self.clock()) + self.event_ttl_seconds)}}
+        )
+
+    '''
+    CLAIM A DOCUMENT CONTENT, RETURNS THE CLAIM OR None WHEN THE CONTENT WAS ALREADY CHECKED IN
+    '''
+    def claim_content(self, content_sha256, key):
+        return self._claim(f"content#{content_sha256}", {'first_key': {'S': key}})
+
+    def release(self, claim):
+        if claim is not None:
+            self.dynamodb.delete_item(TableName=self.table_name, Key={'pk': {'S': claim}})
+
+    def metrics(self, function_name):
+        return json.dumps({
+            '_aws': {
+                'Timestamp': int(self.clock() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': 'ReceptionZone/Checkin',
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [
+                        {'Name': 'DedupHits', 'Unit': 'Count'},
+                        {'Name': 'DedupMisses', 'Unit': 'Count'}
+                    ]
+                }]
+            },
+            'FunctionName': function_name,
+            'DedupHits': self.hits,
+            'DedupMisses': self.misses
+        })
@@ -0,0 +1,129 @@
+import json
+import os
+import re
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import handler_runtime
+
+'''
+DOCUMENT ROUTER
+Check-in classifies every document against the routing table of the stack
+(properties.document_routing) and announces it on EventBridge, where one rule
+per document type forwards it to the queue of its OCR function:
+
+    "document_types":{
+        "itd":{"key_pattern":"(^|/)itd(/|$)", "content_markers":["TRANSHIPMENT"], "max_concurrency":5}
+    }
+
+The document type comes from the first key_pattern matching the key below the
+input prefix (the type name as a path segment when no pattern is given), then
+from the first content marker found in the first signature_bytes of the
+object. The year is the first 19xx/20xx path segment of the key, the year the
+object was uploaded otherwise. Documents are copied to
+<raw>/<year>/<document_type>/<rest of the key>.
+'''
+
+DEFAULT_SIGNATURE_BYTES = 4096
+DEFAULT_EVENT_SOURCE = 'project.reception'
+DEFAULT_EVENT_BUS = 'default'
+YEAR_SEGMENT = re.compile(r'^(19|20)\d{2}$')
+
+# classified_by is "key" or "content"
+Route = namedtuple('Route', ['document_type', 'year', 'classified_by'])
+
+
+class DocumentRouter:
+
+    def __init__(self, document_types, signature_bytes=DEFAULT_SIGNATURE_BYTES, event_source=DEFAULT_EVENT_SOURCE,
+                 event_bus=DEFAULT_EVENT_BUS):
+        self.signature_bytes = int(signature_bytes)
+        self.event_source = event_source
+        self.event_bus = event_bus
+        self.document_types = []
+        for document_type, settings in document_types.items():
+            pattern = settings.get('key_pattern') or f"(^|/){re.escape(document_type)}(/|$)"
+            markers = [marker.upper() for marker in settings.get('content_markers', [])]
+            self.document_types.append((document_type, re.compile(pattern, re.IGNORECASE), markers))
+
+    def _type_of_key(self, relative_key):
+        for document_type, pattern, _ in self.document_types:
+            if pattern.search(relative_key):
+                return document_type
+        return None
+
+    def _type_of_content(self, s3, bucket, key):
+        if not self.signature_bytes or not any(markers for _, _, markers in self.document_types):
+            return None
+        body = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{self.signature_bytes - 1}")['Body']
+        signature = body.read().decode('latin-1').upper()
+        for document_type, _, markers in self.document_types:
+            if any(marker in signature for marker in markers):
+                return document_type
+        return None
+
+    '''
+    CLASSIFY AN INPUT OBJECT, None WHEN NO DOCUMENT TYPE MATCHES
+    head is the head_object response of the object (its LastModified dates
+    documents without a year in their key)
+    '''
+    def classify(self, s3, bucket, key, relative_key, head):
+        document_type, classified_by = self._type_of_key(relative_key), 'key'
+        if document_type is None:
+            document_type, classified_by = self._type_of_content(s3, bucket, key), 'content'
+        if document_type is None:
+            return None
+
+        year = next((segment for segment in relative_key.split('/')[:-1] if YEAR_SEGMENT.match(segment)), None)
+        if year is None:
+            uploaded = head.get('LastModified') or datetime.now(timezone.utc)
+            year = str(uploaded.year)
+        return Route(document_type, year, classified_by)
+
+    '''
+    RAW KEY OF A ROUTED DOCUMENT
+    The leading year and document type segments of the input key are replaced
+    by the normalized ones, the rest of the key is kept
+    '''
+    def raw_key(self, raw_prefix, relative_key, route):
+        segments = relative_key.split('/')
+        while len(segments) > 1 and (segments[0] == route.year or segments[0].lower() == route.document_type.lower()):
+            segments.pop(0)
+        return '/'.join([raw_prefix.strip('/'), route.year, route.document_type] + segments)
+
+    def event(self, bucket, key, route, trace_id=None, size=None):
+        return {
+            'Source': self.event_source,
+            'DetailType': handler_runtime.ROUTED_DETAIL_TYPE,
+            'EventBusName': self.event_bus,
+            'Detail': json.dumps({
+                'bucket': bucket,
+                'key': key,
+                'document_type': route.document_type,
+                'year': route.year,
+                'classified_by': route.classified_by,
+                'size': size,
+                'trace_id': trace_id
+            })
+        }
+
+    def publish(self, events, entry):
+        response = events.put_events(Entries=[entry])
+        if response.get('FailedEntryCount'):
+            failure = response['Entries'][0]
+            raise RuntimeError(f"PutEvents failed: {failure.get('ErrorCode')} {failure.get('ErrorMessage')}")
+
+
+'''
+THE ROUTER OF THE FUNCTION, None WITHOUT A ROUTING TABLE (CHECK-IN ONLY COPIES)
+'''
+def from_environment():
+    if not os.environ.get('ROUTING_TABLE'):
+        return None
+    return DocumentRouter(
+        json.loads(os.environ['ROUTING_TABLE']),
+        signature_bytes=os.environ.get('ROUTING_SIGNATURE_BYTES', DEFAULT_SIGNATURE_BYTES),
+        event_source=os.environ.get('ROUTING_EVENT_SOURCE', DEFAULT_EVENT_SOURCE),
+        event_bus=os.environ.get('ROUTING_EVENT_BUS', DEFAULT_EVENT_BUS)
+    )
@@ -1,31 +1,58 @@
 import os
 import json
-import urllib.parse
-import boto3
-        
+
+import checkin_engine
+import content_hash
+import dedup_index
+import document_router
+import handler_runtime
+import move_engine
+
+@handler_runtime.instrumented('ReceptionZone/Checkin')
 def handler(event, context):
-# Get the object from the event and show its content type
-    s3 = boto3.client('s3')
-
-    # Check if there are any new records in the event
-    if 'Records' in event and len(event['Records']) > 0:
-        for record in event['Records']:
-            # Extract the bucket name and key of the newly uploaded object
-            s3_bucket = record['s3']['bucket']['name']
-            key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
-            
-            print(s3_bucket)
-            print(key)
-
-            # Check if the key has a specific prefix and rename the object
-            if key.startswith('input_data/'):
-                stripped_key = key.replace("input_data/", "")
-                print(stripped_key)
-                new_key_renamed = 'raw_data/' + stripped_key
-                print(new_key_renamed)
-                
-                s3.copy_object(
-                 Bucket=s3_bucket,
-                 CopySource={'Bucket': s3_bucket, 'Key': key},
-                 Key=new_key_renamed
-                )
\ No newline at end of file
+    records = checkin_engine.parse_s3_records(event)
+
+    dedup = None
+    if os.environ.get('DEDUP_TABLE_NAME'):
+        dedup = dedup_index.DedupIndex(
+            handler_runtime.client('dynamodb'),
+            os.environ['DEDUP_TABLE_NAME'],
+            event_ttl_seconds=int(os.environ.get('DEDUP_EVENT_TTL_SECONDS', dedup_index.DEFAULT_EVENT_TTL_SECONDS))
+        )
+
+    router = document_router.from_environment()
+
+    results = checkin_engine.copy_records(
+        handler_runtime.client('s3'),
+        records,
+        input_prefix=os.environ.get('INPUT_DATA_PATH', 'input_data'),
+        raw_prefix=os.environ.get('RAW_DATA_PATH', 'raw_data'),
+        max_workers=int(os.environ.get('CHECKIN_MAX_WORKERS', checkin_engine.DEFAULT_MAX_WORKERS)),
+        dedup=dedup,
+        hasher=content_hash.content_sha256,
+        router=router,
+        events=handler_runtime.client('events') if router is not None else None,
+        move=move_engine.settings_from(os.environ)
+    )
+
+    for result in results:
+        if result['status'] in ('failed', 'unclassified'):
+            print(json.dumps(result))
+
+    summary = checkin_engine.summarize(results)
+    print(json.dumps(summary))
+
+    if dedup is not None:
+        print(dedup.metrics(os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'lambda_checkin_function')))
+
+    failed_record_ids = [result['record_id'] for result in results if result['status'] == 'failed']
+    #ONLY SQS BATCHES REPORT THEIR FAILURES, A DIRECT INVOCATION FAILS SO LAMBDA RETRIES IT
+    if failed_record_ids and not handler_runtime.is_sqs_event(event):
+        raise checkin_engine.CheckinFailed(f"{len(failed_record_ids)} of {len(results)} records failed")
+
+    response = {
+        'summary': summary,
+        'results': results
+    }
+    response.update(handler_runtime.batch_response(event, failed_record_ids))
+    return response
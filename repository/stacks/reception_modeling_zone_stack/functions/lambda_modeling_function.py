@@ -1,14 +1,76 @@
 import os
 import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+import handler_runtime
+import modeling_engine
+
+def _read(record):
+    message_id, bucket, key = record
+    try:
+        document, trace = modeling_engine.read_document(handler_runtime.client('s3'), bucket, key)
+        return message_id, key, document, trace, None
+    except Exception as error:
+        return message_id, key, None, None, f"{type(error).__name__}: {error}"
         
+@handler_runtime.instrumented('ReceptionZone/Modeling')
 def handler(event, context):
-    json_region = os.environ['AWS_REGION']
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json"
-        },
-        "body": json.dumps({
-            "Region ": json_region
-        })
-    }
\ No newline at end of file
+    entered = handler_runtime.now_ms()
+    processed_prefix = os.environ.get('PROCESSED_DATA_PATH', 'processed_data')
+
+    records = []
+    for record in handler_runtime.iter_records(event):
+        if record.bucket is None:
+            continue
+        if modeling_engine.parse_processed_key(record.key, processed_prefix) is None:
+            print(json.dumps({'key': record.key, 'status': 'skipped'}))
+            continue
+        records.append((record.message_id, record.bucket, record.key))
+
+    if not records:
+        return handler_runtime.batch_response(event, [])
+
+    with ThreadPoolExecutor(max_workers=min(16, len(records))) as pool:
+        reads = list(pool.map(_read, records))
+
+    failed_message_ids = []
+    documents = []
+    traces = {}
+    message_ids = []
+    for message_id, key, document, trace, error in reads:
+        if error is not None:
+            print(json.dumps({'key': key, 'status': 'failed', 'error': error}))
+            failed_message_ids.append(message_id)
+        else:
+            documents.append((key, document))
+            message_ids.append(message_id)
+            if trace:
+                traces[key] = trace
+
+    written = []
+    if documents:
+        try:
+            tables = modeling_engine.partition_tables(
+                modeling_engine.document_columns(documents, processed_prefix, traces=traces)
+            )
+            written = modeling_engine.write_partitions(
+                handler_runtime.client('s3'),
+                os.environ['CONFORMED_BUCKET_NAME'],
+                os.environ.get('PARQUET_DATA_PATH', '/test/'),
+                tables,
+                row_group_mb=int(os.environ.get('PARQUET_ROW_GROUP_MB', modeling_engine.DEFAULT_ROW_GROUP_MB))
+            )
+            for key, trace in traces.items():
+                print(handler_runtime.trace_span(trace, 'modeling', key, entered))
+        except Exception as error:
+            print(json.dumps({'status': 'failed', 'documents': len(documents), 'error': f"{type(error).__name__}: {error}"}))
+            if not handler_runtime.is_sqs_event(event):
+                raise
+            failed_message_ids.extend(message_ids)
+
+    print(json.dumps({'documents': len(documents), 'files': written}))
+
+    response = {'documents': len(documents), 'files': written}
+    response.update(handler_runtime.batch_response(event, failed_message_ids))
+    return response
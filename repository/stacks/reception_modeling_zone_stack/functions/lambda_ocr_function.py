@@ -0,0 +1,11 @@
+import os
+
+import handler_runtime
+import ocr_engine
+
+# One function per document type of the routing table, deployed from this module
+DOCUMENT_TYPE = os.environ.get("DOCUMENT_TYPE")
+
+@handler_runtime.instrumented('ReceptionZone/Ocr')
+def handler(event, context):
+    return ocr_engine.handle(event, ocr_engine.get_engine(DOCUMENT_TYPE))
@@ -0,0 +1,13 @@
+import os
+
+import handler_runtime
+import ocr_engine
+import page_fanout
+
+# Every step of the ocr-pages state machine, the engine is the one of the document type of the job
+PAGES_PER_CHUNK = int(os.environ.get("OCR_PAGES_PER_CHUNK", page_fanout.DEFAULT_PAGES_PER_CHUNK))
+
+@handler_runtime.instrumented('ReceptionZone/OcrPages')
+def handler(event, context):
+    engine = ocr_engine.get_engine(event['job'].get('document_type'))
+    return page_fanout.handle(event, engine, PAGES_PER_CHUNK)
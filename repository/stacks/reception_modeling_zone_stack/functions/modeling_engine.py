@@ -0,0 +1,158 @@
+import io
+import json
+import time
+import uuid
+
+from datetime import datetime, timezone
+
+import handler_runtime
+import partition_manifest
+
+# pyarrow is imported by the first call that needs it
+pa = handler_runtime.lazy_module('pyarrow')
+pq = handler_runtime.lazy_module('pyarrow.parquet')
+
+'''
+MODELING ENGINE
+Turns a batch of OCR documents (processed_data/<year>/<doctype>/<name>.json)
+into Parquet files for the conformed zone. The batch is converted column by
+column into one Arrow table, split by partition and written as
+
+    <parquet_data_path>year=<year>/doctype=<doctype>/part-<timestamp>-<uuid>.parquet
+
+Partition values live in the path only, as Athena expects. Every new file is
+then added to the symlink manifest of its partition, which is what makes it
+visible to the conformed table.
+'''
+
+SCHEMA_FIELDS = [
+    ('document_name', 'string'),
+    ('document_flag', 'string'),
+    ('source_key', 'string'),
+    ('content_sha256', 'string'),
+    ('page_count', 'int32'),
+    ('line_count', 'int32'),
+    ('mean_confidence', 'float32'),
+    ('text', 'string'),
+    ('processed_at', 'timestamp'),
+    ('trace_id', 'string'),
+    ('trace_start', 'timestamp')
+]
+PARTITION_FIELDS = ('year', 'doctype')
+DEFAULT_ROW_GROUP_MB = 128
+
+
+'''
+SPLIT A PROCESSED KEY INTO ITS PARTITION VALUES AND DOCUMENT NAME
+'''
+def parse_processed_key(key, processed_prefix):
+    processed_prefix = processed_prefix.strip('/') + '/'
+    if not key.startswith(processed_prefix) or not key.endswith('.json'):
+        return None
+    parts = key[len(processed_prefix):].split('/')
+    if len(parts) < 3 or not parts[0].isdigit():
+        return None
+    return int(parts[0]), parts[1], parts[-1][:-len('.json')]
+
+
+'''
+BUILD THE COLUMNS OF A BATCH
+documents is a list of (processed_key, ocr_document) pairs, traces maps a
+processed key to the trace read with its document
+'''
+def document_columns(documents, processed_prefix, processed_at=None, traces=None):
+    processed_at = processed_at or datetime.now(timezone.utc)
+    traces = traces or {}
+    columns = {name: [] for name, _ in SCHEMA_FIELDS}
+    columns.update({name: [] for name in PARTITION_FIELDS})
+
+    for key, document in documents:
+        year, doctype, name = parse_processed_key(key, processed_prefix)
+        lines = [block for block in document.get('blocks', []) if block.get('BlockType') == 'LINE']
+        confidences = [block['Confidence'] for block in lines if 'Confidence' in block]
+
+        columns['year'].append(year)
+        columns['doctype'].append(doctype)
+        columns['document_name'].append(name)
+        columns['document_flag'].append('ok' if lines else 'empty')
+        columns['source_key'].append(document.get('source', {}).get('key'))
+        columns['content_sha256'].append(document.get('content_sha256'))
+        columns['page_count'].append(document.get('pages', 0))
+        columns['line_count'].append(len(lines))
+        columns['mean_confidence'].append(sum(confidences) / len(confidences) if confidences else None)
+        columns['text'].append('\n'.join(block.get('Text', '') for block in lines))
+        columns['processed_at'].append(processed_at)
+        trace = traces.get(key) or {}
+        trace_start = trace.get('trace_start')
+        columns['trace_id'].append(trace.get('trace_id'))
+        columns['trace_start'].append(None if trace_start is None else datetime.fromtimestamp(trace_start / 1000, timezone.utc))
+
+    return columns
+
+
+def arrow_schema():
+    types = {
+        'string': pa.string(),
+        'int32': pa.int32(),
+        'float32': pa.float32(),
+        'timestamp': pa.timestamp('ms', tz='UTC')
+    }
+    return pa.schema([(name, types[kind]) for name, kind in SCHEMA_FIELDS])
+
+
+'''
+SPLIT THE COLUMNS INTO ONE ARROW TABLE PER PARTITION
+'''
+def partition_tables(columns):
+    schema = arrow_schema()
+    table = pa.table({name: pa.array(columns[name], type=schema.field(name).type) for name in schema.names},
+                     schema=schema)
+
+    indices = {}
+    for row, partition in enumerate(zip(columns['year'], columns['doctype'])):
+        indices.setdefault(partition, []).append(row)
+
+    return {
+        partition: table if len(rows) == table.num_rows else table.take(pa.array(rows, type=pa.int64()))
+        for partition, rows in indices.items()
+    }
+
+
+def row_group_rows(table, row_group_mb=DEFAULT_ROW_GROUP_MB):
+    if table.num_rows == 0:
+        return 1
+    bytes_per_row = max(1, table.nbytes // table.num_rows)
+    return max(1, (row_group_mb * 1024 * 1024) // bytes_per_row)
+
+
+def partition_path(year, doctype):
+    return f"year={year}/doctype={doctype}"
+
+
+def parquet_key(parquet_prefix, year, doctype, now=None):
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))
+    return f"{parquet_prefix.strip('/')}/{partition_path(year, doctype)}/part-{stamp}-{uuid.uuid4().hex}.parquet"
+
+
+def write_partitions(s3, bucket, parquet_prefix, tables, row_group_mb=DEFAULT_ROW_GROUP_MB):
+    written = []
+    for (year, doctype), table in sorted(tables.items()):
+        sink = io.BytesIO()
+        pq.write_table(table, sink, row_group_size=row_group_rows(table, row_group_mb), compression='snappy')
+        key = parquet_key(parquet_prefix, year, doctype)
+        s3.put_object(Bucket=bucket, Key=key, Body=sink.getvalue())
+        partition_manifest.update_manifest(
+            s3, bucket,
+            partition_manifest.manifest_key(parquet_prefix, partition_path(year, doctype)),
+            add=[partition_manifest.data_uri(bucket, key)]
+        )
+        written.append({'key': key, 'rows': table.num_rows, 'bytes': sink.tell()})
+    return written
+
+
+'''
+READ AN OCR DOCUMENT AND THE TRACE OF ITS OBJECT
+'''
+def read_document(s3, bucket, key):
+    response = s3.get_object(Bucket=bucket, Key=key)
+    return json.loads(response['Body'].read()), handler_runtime.trace_from_metadata(response.get('Metadata'))
@@ -0,0 +1,136 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+MOVE ENGINE
+Moves an object server side, the way check-in takes a document from the
+input prefix to the raw prefix: one CopyObject below the multipart threshold,
+parallel UploadPartCopy calls above it (a single copy stops at 5 GB and runs
+as one stream). Every call is conditioned on the ETag of the source, so a
+source overwritten during the move fails it instead of mixing two versions.
+The copy is verified against the size and the full-object checksum of the
+source before the source is deleted, again only if it is still the version
+that was copied.
+
+ChecksumType and the IfMatch of DeleteObject need botocore 1.36 or later,
+newer than the SDK of the Lambda runtime: check-in ships it in the boto3
+dependency layer.
+'''
+
+MIB = 1024 * 1024
+MIN_PART_SIZE = 5 * MIB
+MAX_PART_SIZE = 5 * 1024 * MIB
+MAX_PARTS = 10000
+DEFAULT_MULTIPART_THRESHOLD = 128 * MIB
+DEFAULT_PART_SIZE = 64 * MIB
+DEFAULT_PART_WORKERS = 8
+# Full-object checksums S3 keeps whatever the part layout of the copy
+FULL_OBJECT_CHECKSUMS = ('ChecksumCRC64NVME', 'ChecksumCRC32', 'ChecksumCRC32C')
+
+MoveSettings = namedtuple('MoveSettings', ['multipart_threshold', 'part_size', 'part_workers', 'delete_source'],
+                          defaults=(DEFAULT_MULTIPART_THRESHOLD, DEFAULT_PART_SIZE, DEFAULT_PART_WORKERS, False))
+
+
+class MoveError(Exception):
+    pass
+
+
+'''
+SPLIT AN OBJECT INTO (part number, first byte, last byte)
+Parts are no larger than part_size but small enough to give every worker a
+part, within the 5 MB - 5 GB part size and 10,000 parts limits of S3
+'''
+def plan_parts(size, part_size=DEFAULT_PART_SIZE, workers=DEFAULT_PART_WORKERS):
+    part_size = min(part_size, -(-size // max(1, workers)))
+    part_size = max(part_size, MIN_PART_SIZE, -(-size // MAX_PARTS))
+    part_size = min(-(-part_size // MIB) * MIB, MAX_PART_SIZE)
+    return [(number, first, min(first + part_size, size) - 1)
+            for number, first in enumerate(range(0, size, part_size), start=1)]
+
+
+'''
+COPY THE SOURCE TO new_key, RETURNS "copy" OR "multipart"
+head is the head_object response of the source, attributes the Metadata,
+ContentType and headers of the copy
+'''
+def copy(s3, bucket, key, new_key, head, settings=MoveSettings(), **attributes):
+    source = {'Bucket': bucket, 'Key': key}
+    size = head['ContentLength']
+    if size < settings.multipart_threshold:
+        s3.copy_object(Bucket=bucket, CopySource=source, Key=new_key, CopySourceIfMatch=head['ETag'],
+                       MetadataDirective='REPLACE', **attributes)
+        return 'copy'
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=new_key, ChecksumAlgorithm='CRC64NVME',
+                                           ChecksumType='FULL_OBJECT', **attributes)['UploadId']
+
+    def copy_part(part):
+        number, first, last = part
+        response = s3.upload_part_copy(Bucket=bucket, Key=new_key, UploadId=upload_id, PartNumber=number,
+                                       CopySource=source, CopySourceRange=f"bytes={first}-{last}",
+                                       CopySourceIfMatch=head['ETag'])
+        # A checksummed upload only completes with the checksum of every part
+        result = response['CopyPartResult']
+        return {'PartNumber': number, 'ETag': result['ETag'], 'ChecksumCRC64NVME': result['ChecksumCRC64NVME']}
+
+    parts = plan_parts(size, settings.part_size, settings.part_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(settings.part_workers, len(parts)))) as pool:
+            completed = list(pool.map(copy_part, parts))
+        s3.complete_multipart_upload(Bucket=bucket, Key=new_key, UploadId=upload_id,
+                                     MultipartUpload={'Parts': completed})
+    except Exception:
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=new_key, UploadId=upload_id)
+        except Exception as abort_error:
+            print(f"Failed to abort multipart upload {upload_id} of {new_key}: {abort_error}")
+        raise
+    return 'multipart'
+
+
+'''
+CHECK THE COPY AGAINST THE SOURCE, RETURNS WHAT WAS COMPARED ("checksum" OR "size")
+head must come from head_object(..., ChecksumMode="ENABLED") for the checksums to be compared.
+A copy that does not match is deleted.
+'''
+def verify(s3, bucket, new_key, head):
+    copied = s3.head_object(Bucket=bucket, Key=new_key, ChecksumMode='ENABLED')
+    problem, compared = None, 'size'
+    if copied['ContentLength'] != head['ContentLength']:
+        problem = f"{new_key} holds {copied['ContentLength']} bytes, the source {head['ContentLength']}"
+
+    for field in FULL_OBJECT_CHECKSUMS:
+        if problem or not (head.get(field) and copied.get(field)):
+            continue
+        if head.get('ChecksumType', 'FULL_OBJECT') == copied.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT':
+            if copied[field] != head[field]:
+                problem = f"{field} of {new_key} does not match the source"
+            compared = 'checksum'
+            break
+
+    if problem:
+        s3.delete_object(Bucket=bucket, Key=new_key)
+        raise MoveError(problem)
+    return compared
+
+
+'''
+DELETE THE SOURCE UNLESS IT WAS OVERWRITTEN SINCE THE COPY
+Returns False when it could not be deleted, the copy stands either way
+'''
+def delete_source(s3, bucket, key, etag):
+    try:
+        s3.delete_object(Bucket=bucket, Key=key, IfMatch=etag)
+        return True
+    except Exception as error:
+        print(f"Failed to delete the source {key} of a move: {error}")
+        return False
+
+
+def settings_from(environ):
+    return MoveSettings(
+        multipart_threshold=int(environ.get('MOVE_MULTIPART_THRESHOLD_MB', DEFAULT_MULTIPART_THRESHOLD // MIB)) * MIB,
+        part_size=int(environ.get('MOVE_PART_SIZE_MB', DEFAULT_PART_SIZE // MIB)) * MIB,
+        part_workers=int(environ.get('MOVE_PART_WORKERS', DEFAULT_PART_WORKERS)),
+        delete_source=environ.get('MOVE_DELETE_SOURCE', 'false').lower() == 'true'
+    )
@@ -0,0 +1,351 @@
+import json
+import os
+import uuid
+
+from abc import ABC, abstractmethod
+
+import content_hash
+import handler_runtime
+import pending_jobs
+
+'''
+OCR ENGINE
+Shared by the form4e, ebcd and itd OCR functions.
+
+Single page images are analyzed synchronously. PDF and TIFF documents go
+through StartDocumentAnalysis and the function returns immediately; Textract
+publishes the completion to an SNS topic that invokes the same function,
+which then pages through GetDocumentAnalysis and writes the result. When the
+function has a page fan-out state machine they are split into page chunks
+analyzed in parallel instead (see page_fanout), and its merge step completes
+the job.
+
+Results are cached by content hash under the cache prefix, so a document that
+is uploaded again or replayed is never sent to Textract twice. While a job is
+running its pending record (keyed by the same hash, which is also the job tag,
+see pending_jobs) collects every output waiting for it, with the trace of the
+raw object behind each output and the time it entered the stage.
+'''
+
+ASYNC_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+FEATURE_TYPES = ['TABLES', 'FORMS']
+
+
+'''
+TEXTRACT BACKEND
+Everything the engine needs from Textract. Tests provide a local fake.
+'''
+class TextractBackend(ABC):
+
+    @abstractmethod
+    def analyze_document(self, bucket, key):
+        pass
+
+    @abstractmethod
+    def start_document_analysis(self, bucket, key, job_tag):
+        pass
+
+    @abstractmethod
+    def get_document_analysis(self, job_id):
+        pass
+
+
+class BotoTextractBackend(TextractBackend):
+
+    def __init__(self, client, sns_topic_arn, role_arn, feature_types=FEATURE_TYPES):
+        self.client = client
+        self.sns_topic_arn = sns_topic_arn
+        self.role_arn = role_arn
+        self.feature_types = feature_types
+
+    def analyze_document(self, bucket, key):
+        response = self.client.analyze_document(
+            Document={'S3Object': {'Bucket': bucket, 'Name': key}},
+            FeatureTypes=self.feature_types
+        )
+        return response['Blocks']
+
+    def start_document_analysis(self, bucket, key, job_tag):
+        response = self.client.start_document_analysis(
+            DocumentLocation={'S3Object': {'Bucket': bucket, 'Name': key}},
+            FeatureTypes=self.feature_types,
+            JobTag=job_tag,
+            NotificationChannel={'SNSTopicArn': self.sns_topic_arn, 'RoleArn': self.role_arn}
+        )
+        return response['JobId']
+
+    def get_document_analysis(self, job_id):
+        blocks = []
+        kwargs = {'JobId': job_id, 'MaxResults': 1000}
+        while True:
+            response = self.client.get_document_analysis(**kwargs)
+            if response['JobStatus'] != 'SUCCEEDED':
+                return response['JobStatus'], blocks
+            blocks.extend(response.get('Blocks', []))
+            if not response.get('NextToken'):
+                return 'SUCCEEDED', blocks
+            kwargs['NextToken'] = response['NextToken']
+
+
+'''
+PAGE FAN-OUT BACKEND
+Starts an execution of the ocr-pages state machine, named after the job
+'''
+class StepFunctionsPages:
+
+    def __init__(self, client, state_machine_arn):
+        self.client = client
+        self.state_machine_arn = state_machine_arn
+
+    # Execution names are limited to 80 characters
+    def new_job_id(self, content_sha256):
+        return f"{content_sha256[:40]}-{uuid.uuid4().hex[:12]}"
+
+    def start(self, job):
+        self.client.start_execution(stateMachineArn=self.state_machine_arn, name=job['job_id'],
+                                    input=json.dumps({'job': job}))
+
+
+'''
+MAP A RAW KEY TO ITS PROCESSED KEY
+'''
+def processed_key(key, raw_prefix, processed_prefix):
+    raw_prefix = raw_prefix.strip('/') + '/'
+    processed_prefix = processed_prefix.strip('/') + '/'
+    if not key.startswith(raw_prefix):
+        return None
+    return processed_prefix + key[len(raw_prefix):] + '.json'
+
+
+def build_document(document_type, bucket, key, content_sha256, blocks):
+    pages = max((block.get('Page', 1) for block in blocks), default=0)
+    return {
+        'document_type': document_type,
+        'source': {'bucket': bucket, 'key': key},
+        'content_sha256': content_sha256,
+        'pages': pages,
+        'blocks': blocks
+    }
+
+
+class OcrEngine:
+
+    def __init__(self, s3, textract, document_type, raw_prefix, processed_prefix, cache_prefix, hasher, jobs,
+                 pages=None):
+        self.s3 = s3
+        self.textract = textract
+        self.jobs = jobs
+        self.pages = pages
+        self.document_type = document_type
+        self.raw_prefix = raw_prefix
+        self.processed_prefix = processed_prefix
+        self.cache_prefix = cache_prefix.strip('/')
+        self.hasher = hasher
+
+    def cache_key(self, content_sha256):
+        return f"{self.cache_prefix}/results/{content_sha256[:2]}/{content_sha256}.json"
+
+    def _read_json(self, bucket, key):
+        try:
+            return json.loads(self.s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+        except Exception as error:
+            if _error_code(error) in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def _write_json(self, bucket, key, value):
+        self.s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(value).encode('utf-8'),
+                           ContentType='application/json')
+
+    def _read_trace(self, bucket, key):
+        return handler_runtime.trace_from_metadata(self.s3.head_object(Bucket=bucket, Key=key).get('Metadata'))
+
+    '''
+    COPY THE CACHED RESULT TO THE OUTPUTS
+    traces maps an output to its trace and the time it entered the stage
+    '''
+    def _publish(self, bucket, content_sha256, document, outputs, traces=None):
+        cache_key = self.cache_key(content_sha256)
+        traces = traces or {}
+        if document is not None:
+            self._write_json(bucket, cache_key, document)
+        for output in outputs:
+            trace = (traces.get(output) or {}).get('trace')
+            self.s3.copy_object(
+                Bucket=bucket,
+                CopySource={'Bucket': bucket, 'Key': cache_key},
+                Key=output,
+                MetadataDirective='REPLACE',
+                Metadata=handler_runtime.trace_metadata(trace),
+                ContentType='application/json'
+            )
+            if trace:
+                print(handler_runtime.trace_span(trace, 'ocr', output, traces[output]['entered']))
+
+    '''
+    PROCESS A NEWLY CREATED RAW OBJECT
+    Returns cached, analyzed, started, fanned_out or joined (a job for the same content is already running).
+    document_type is the type check-in routed the document as, the type of the engine by default
+    '''
+    def process_object(self, bucket, key, document_type=None):
+        entered = handler_runtime.now_ms()
+        document_type = document_type or self.document_type
+        output = processed_key(key, self.raw_prefix, self.processed_prefix)
+        if output is None:
+            return {'key': key, 'status': 'skipped'}
+
+        content_sha256 = self.hasher(self.s3, bucket, key)
+        result = {'key': key, 'content_sha256': content_sha256, 'destination_key': output}
+        traces = {output: {'trace': self._read_trace(bucket, key), 'entered': entered}}
+
+        if self._read_json(bucket, self.cache_key(content_sha256)) is not None:
+            self._publish(bucket, content_sha256, None, [output], traces)
+            result['status'] = 'cached'
+            return result
+
+        if not key.lower().endswith(ASYNC_EXTENSIONS):
+            blocks = self.textract.analyze_document(bucket, key)
+            document = build_document(document_type, bucket, key, content_sha256, blocks)
+            self._publish(bucket, content_sha256, document, [output], traces)
+            result['status'] = 'analyzed'
+            return result
+
+        pending = self.jobs.join(content_sha256, output, traces[output])
+        if pending is not None:
+            result['status'] = 'joined'
+            result['job_id'] = pending['job_id']
+            return result
+
+        if self.pages is not None:
+            return self._fan_out(bucket, key, content_sha256, document_type, output, traces, result)
+
+        job_id = self.textract.start_document_analysis(bucket, key, job_tag=content_sha256)
+        job = {'job_id': job_id, 'bucket': bucket, 'key': key, 'document_type': document_type}
+        if not self.jobs.start(content_sha256, job, output, traces[output]):
+            # Another delivery of the content recorded its job first, the completion of this one is ignored
+            return self.process_object(bucket, key, document_type)
+        result['status'] = 'started'
+        result['job_id'] = job_id
+        return result
+
+    '''
+    START THE PAGE FAN-OUT OF A MULTIPAGE DOCUMENT
+    The pending record is written first so the merge always finds it; the
+    first delivery of the content to record its job is the one that starts it
+    '''
+    def _fan_out(self, bucket, key, content_sha256, document_type, output, traces, result):
+        job = {
+            'job_id': self.pages.new_job_id(content_sha256),
+            'bucket': bucket,
+            'key': key,
+            'content_sha256': content_sha256,
+            'document_type': document_type
+        }
+        if not self.jobs.start(content_sha256, job, output, traces[output]):
+            return self.process_object(bucket, key, document_type)
+        try:
+            self.pages.start(job)
+        except Exception:
+            self.jobs.finish(content_sha256, job['job_id'])
+            raise
+        result['status'] = 'fanned_out'
+        result['job_id'] = job['job_id']
+        return result
+
+    '''
+    COLLECT THE RESULT OF A FINISHED ASYNCHRONOUS JOB
+    blocks are given by the merge step of a page fan-out, read from Textract otherwise.
+    The result is cached before the pending record is dropped, so an output
+    either joined the job and is published here or finds the cached result
+    '''
+    def complete_job(self, bucket, job_id, content_sha256, status, blocks=None):
+        pending = self.jobs.get(content_sha256)
+        if pending is None or pending['job_id'] != job_id:
+            return {'job_id': job_id, 'status': 'unknown'}
+
+        if status == 'SUCCEEDED' and blocks is None:
+            status, blocks = self.textract.get_document_analysis(job_id)
+
+        if status != 'SUCCEEDED':
+            self.jobs.finish(content_sha256, job_id)
+            return {'job_id': job_id, 'key': pending['key'], 'status': 'failed', 'error': f"OCR job {status}"}
+
+        document = build_document(pending.get('document_type', self.document_type), pending['bucket'], pending['key'],
+                                  content_sha256, blocks)
+        self._write_json(bucket, self.cache_key(content_sha256), document)
+        pending = self.jobs.finish(content_sha256, job_id)
+        if pending is None:
+            # A redelivered completion finished the job first
+            return {'job_id': job_id, 'status': 'unknown'}
+        self._publish(bucket, content_sha256, None, pending['outputs'], pending['traces'])
+        return {'job_id': job_id, 'key': pending['key'], 'status': 'completed', 'outputs': pending['outputs']}
+
+
+def _error_code(error):
+    return str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+
+
+# Engines are created once per container and reused by warm invocations
+_engines = {}
+
+def get_engine(document_type):
+    if document_type not in _engines:
+        _engines[document_type] = OcrEngine(
+            handler_runtime.client('s3'),
+            BotoTextractBackend(
+                handler_runtime.client('textract'),
+                sns_topic_arn=os.environ.get('TEXTRACT_SNS_TOPIC_ARN'),
+                role_arn=os.environ.get('TEXTRACT_ROLE_ARN')
+            ),
+            document_type=document_type,
+            raw_prefix=os.environ.get('RAW_DATA_PATH', 'raw_data'),
+            processed_prefix=os.environ.get('PROCESSED_DATA_PATH', 'processed_data'),
+            cache_prefix=os.environ.get('OCR_CACHE_PATH', 'ocr_cache'),
+            hasher=content_hash.content_sha256,
+            jobs=pending_jobs.PendingJobs(
+                handler_runtime.client('dynamodb'),
+                os.environ['OCR_JOBS_TABLE_NAME'],
+                job_ttl_seconds=int(os.environ.get('OCR_JOB_TTL_SECONDS', pending_jobs.DEFAULT_JOB_TTL_SECONDS))
+            ),
+            pages=StepFunctionsPages(
+                handler_runtime.client('stepfunctions'),
+                os.environ['OCR_PAGES_STATE_MACHINE_ARN']
+            ) if os.environ.get('OCR_PAGES_STATE_MACHINE_ARN') else None
+        )
+    return _engines[document_type]
+
+
+'''
+HANDLE AN OCR FUNCTION INVOCATION
+S3 and routed (direct or SQS wrapped) records start the analysis, SNS records complete it
+'''
+def handle(event, engine):
+    results = []
+    failed_message_ids = []
+
+    for record in handler_runtime.iter_records(event):
+        if record.source == 'sns':
+            # Completion message published by Textract
+            location = record.body.get('DocumentLocation', {})
+            result = engine.complete_job(
+                location.get('S3Bucket'),
+                record.body['JobId'],
+                record.body.get('JobTag'),
+                record.body['Status']
+            )
+            results.append(result)
+            if result['status'] == 'failed':
+                print(json.dumps(result))
+            continue
+
+        try:
+            document_type = record.body.get('document_type') if record.source == 'route' else None
+            results.append(engine.process_object(record.bucket, record.key, document_type))
+        except Exception as error:
+            print(json.dumps({'key': record.key, 'status': 'failed', 'error': f"{type(error).__name__}: {error}"}))
+            results.append({'key': record.key, 'status': 'failed'})
+            failed_message_ids.append(record.message_id)
+
+    response = {'results': results}
+    response.update(handler_runtime.batch_response(event, failed_message_ids))
+    return response
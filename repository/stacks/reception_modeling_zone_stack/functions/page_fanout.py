@@ -0,0 +1,140 @@
+import io
+import json
+import posixpath
+
+import handler_runtime
+
+pypdf = handler_runtime.lazy_module('pypdf')
+Image = handler_runtime.lazy_module('PIL.Image')
+
+'''
+PAGE FAN-OUT
+Multipage OCR as a map over page chunks instead of one long Textract job.
+The ocr-pages state machine runs the steps below through one function:
+
+    split  writes every page of the document as a single page object under
+           <cache>/pages/<content hash>/ and plans chunks of pages_per_chunk pages
+    chunk  analyzes the pages of one chunk synchronously (Map state, retried on failure)
+           and writes their blocks to the same prefix
+    merge  concatenates the chunk results in page order and completes the pending
+           job of the OCR engine, which publishes one processed document
+    fail   drops the pending job once a chunk ran out of retries
+
+A retried chunk overwrites its own result; merge and fail remove the pages
+and results of the job.
+'''
+
+DEFAULT_PAGES_PER_CHUNK = 4
+
+
+def split_pdf(body):
+    reader = pypdf.PdfReader(io.BytesIO(body))
+    for page in reader.pages:
+        writer = pypdf.PdfWriter()
+        writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        yield buffer.getvalue()
+
+
+def split_tiff(body):
+    image = Image.open(io.BytesIO(body))
+    for frame in range(getattr(image, 'n_frames', 1)):
+        image.seek(frame)
+        buffer = io.BytesIO()
+        image.save(buffer, format='TIFF')
+        yield buffer.getvalue()
+
+
+# Splitters by extension, each yields the pages of a document as single page documents
+SPLITTERS = {'.pdf': split_pdf, '.tif': split_tiff, '.tiff': split_tiff}
+
+
+'''
+GROUP PAGES 1..page_count INTO CHUNKS OF pages_per_chunk PAGES
+'''
+def plan_chunks(page_count, pages_per_chunk=DEFAULT_PAGES_PER_CHUNK):
+    pages_per_chunk = max(1, int(pages_per_chunk))
+    return [list(range(first, min(first + pages_per_chunk, page_count + 1)))
+            for first in range(1, page_count + 1, pages_per_chunk)]
+
+
+def pages_prefix(engine, job):
+    return f"{engine.cache_prefix}/pages/{job['content_sha256']}/"
+
+
+def split(engine, job, pages_per_chunk=DEFAULT_PAGES_PER_CHUNK):
+    bucket, key = job['bucket'], job['key']
+    extension = posixpath.splitext(key)[1].lower()
+    body = engine.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    page_keys = []
+    for number, page in enumerate(SPLITTERS[extension](body), start=1):
+        page_key = f"{pages_prefix(engine, job)}page-{number:05d}{extension}"
+        engine.s3.put_object(Bucket=bucket, Key=page_key, Body=page)
+        page_keys.append(page_key)
+
+    chunks = [{'index': index, 'pages': [{'page': page, 'key': page_keys[page - 1]} for page in pages]}
+              for index, pages in enumerate(plan_chunks(len(page_keys), pages_per_chunk))]
+    return {'job': job, 'chunks': chunks}
+
+
+'''
+ANALYZE THE PAGES OF A CHUNK
+Each page is analyzed as a single page document, its blocks are renumbered to
+the page of the whole document
+'''
+def analyze_chunk(engine, job, chunk):
+    blocks = []
+    for page in chunk['pages']:
+        for block in engine.textract.analyze_document(job['bucket'], page['key']):
+            blocks.append(dict(block, Page=page['page']))
+
+    result_key = f"{pages_prefix(engine, job)}chunk-{chunk['index']:05d}.json"
+    engine._write_json(job['bucket'], result_key, blocks)
+    return {'index': chunk['index'], 'key': result_key}
+
+
+def _clean_up(engine, job):
+    paginator = engine.s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=job['bucket'], Prefix=pages_prefix(engine, job)):
+        keys = [{'Key': item['Key']} for item in page.get('Contents', [])]
+        if keys:
+            engine.s3.delete_objects(Bucket=job['bucket'], Delete={'Objects': keys, 'Quiet': True})
+
+
+def merge(engine, job, results):
+    blocks = []
+    for result in sorted(results, key=lambda result: result['index']):
+        blocks.extend(engine._read_json(job['bucket'], result['key']))
+    completed = engine.complete_job(job['bucket'], job['job_id'], job['content_sha256'], 'SUCCEEDED', blocks=blocks)
+    _clean_up(engine, job)
+    return completed
+
+
+def fail(engine, job, error=None):
+    failed = engine.complete_job(job['bucket'], job['job_id'], job['content_sha256'], 'FAILED')
+    _clean_up(engine, job)
+    if error:
+        failed['cause'] = error
+    print(json.dumps(failed))
+    return failed
+
+
+'''
+HANDLE A STEP OF THE OCR-PAGES STATE MACHINE
+The action of the event is split, chunk, merge or fail; the Map state passes
+every chunk with the job, merge gets the chunk results and fail the error the
+state machine caught
+'''
+def handle(event, engine, pages_per_chunk=DEFAULT_PAGES_PER_CHUNK):
+    action, job = event['action'], event['job']
+    if action == 'split':
+        return split(engine, job, pages_per_chunk)
+    if action == 'chunk':
+        return analyze_chunk(engine, job, event['chunk'])
+    if action == 'merge':
+        return merge(engine, job, event['results'])
+    if action == 'fail':
+        return fail(engine, job, event.get('error'))
+    raise ValueError(f"Unknown page fan-out action {action}")
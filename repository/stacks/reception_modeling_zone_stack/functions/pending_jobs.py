@@ -0,0 +1,99 @@
+import json
+import time
+
+'''
+PENDING OCR JOBS
+The asynchronous OCR jobs that are running, stored in DynamoDB and keyed by
+the content hash of the document (the job tag of Textract).
+
+    job#<sha256>   job_id, the job (JSON), the outputs waiting for it (output -> trace JSON), expires_at
+
+Every change is one conditional write, so concurrent deliveries of the same
+content never overwrite each other: a job is recorded once
+(attribute_not_exists), an output joins a running job by setting its own
+entry of the outputs map (attribute_exists) and finishing a job deletes the
+record of that job id and returns the outputs collected until then.
+'''
+
+DEFAULT_JOB_TTL_SECONDS = 24 * 3600
+
+
+def _condition_failed(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+class PendingJobs:
+
+    def __init__(self, dynamodb, table_name, job_ttl_seconds=DEFAULT_JOB_TTL_SECONDS, clock=time.time):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.job_ttl_seconds = job_ttl_seconds
+        self.clock = clock
+
+    def _key(self, content_sha256):
+        return {'pk': {'S': f"job#{content_sha256}"}}
+
+    def _record(self, item):
+        if not item:
+            return None
+        outputs = {output: json.loads(value['S']) for output, value in item['outputs']['M'].items()}
+        return dict(json.loads(item['job']['S']), outputs=sorted(outputs), traces=outputs)
+
+    def get(self, content_sha256):
+        return self._record(self.dynamodb.get_item(TableName=self.table_name, Key=self._key(content_sha256),
+                                                   ConsistentRead=True).get('Item'))
+
+    '''
+    RECORD A STARTED JOB WITH ITS FIRST OUTPUT, RETURNS False WHEN A JOB FOR THE CONTENT IS ALREADY RECORDED
+    '''
+    def start(self, content_sha256, job, output, trace):
+        item = dict(self._key(content_sha256),
+                    job_id={'S': job['job_id']},
+                    job={'S': json.dumps(job)},
+                    outputs={'M': {output: {'S': json.dumps(trace)}}},
+                    expires_at={'N': str(int(self.clock()) + self.job_ttl_seconds)})
+        try:
+            self.dynamodb.put_item(TableName=self.table_name, Item=item, ConditionExpression='attribute_not_exists(pk)')
+        except Exception as error:
+            if _condition_failed(error):
+                return False
+            raise
+        return True
+
+    '''
+    ADD AN OUTPUT TO THE RUNNING JOB OF THE CONTENT, RETURNS THE JOB OR None WHEN NO JOB IS RUNNING
+    '''
+    def join(self, content_sha256, output, trace):
+        try:
+            response = self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key=self._key(content_sha256),
+                UpdateExpression='SET outputs.#output = :trace',
+                ConditionExpression='attribute_exists(pk)',
+                ExpressionAttributeNames={'#output': output},
+                ExpressionAttributeValues={':trace': {'S': json.dumps(trace)}},
+                ReturnValues='ALL_NEW'
+            )
+        except Exception as error:
+            if _condition_failed(error):
+                return None
+            raise
+        return self._record(response['Attributes'])
+
+    '''
+    DROP THE RECORD OF A JOB, RETURNS IT WITH EVERY OUTPUT THAT JOINED OR None WHEN IT IS ALREADY GONE
+    '''
+    def finish(self, content_sha256, job_id):
+        try:
+            response = self.dynamodb.delete_item(
+                TableName=self.table_name,
+                Key=self._key(content_sha256),
+                ConditionExpression='job_id = :job_id',
+                ExpressionAttributeValues={':job_id': {'S': job_id}},
+                ReturnValues='ALL_OLD'
+            )
+        except Exception as error:
+            if _condition_failed(error):
+                return None
+            raise
+        return self._record(response.get('Attributes'))
@@ -1,17 +1,30 @@
 from aws_cdk import (
     Stack,
     aws_iam as _iam,
-    aws_lambda as _lambda,
     aws_s3 as _s3,
     aws_s3_notifications as _s3n,
-    aws_kms as _kms,
-    aws_s3_deployment as _aws_s3_deployment
+    aws_s3_deployment as _aws_s3_deployment,
+    aws_sqs as _sqs,
+    aws_dynamodb as _dynamodb,
+    aws_events as _events,
+    aws_events_targets as _events_targets,
+    aws_sns as _sns,
+    aws_sns_subscriptions as _sns_subscriptions,
+    aws_lambda_event_sources as _lambda_event_sources,
+    aws_stepfunctions as _sfn,
+    aws_stepfunctions_tasks as _sfn_tasks,
+    Duration as _Duration
 )
 
+import json
 import os
 
 from constructs import Construct
 from repository.util import util as _util
+from repository.util.profiled_function import ProfiledFunction
+
+#DETAIL TYPE OF THE EVENTS CHECK-IN PUBLISHES FOR EVERY CLASSIFIED DOCUMENT (handler_runtime.ROUTED_DETAIL_TYPE)
+ROUTED_DETAIL_TYPE = "Document Routed"
 
 class ReceptionAndModelingZoneStack(Stack):
 
@@ -27,6 +40,23 @@ class ReceptionAndModelingZoneStack(Stack):
         self.input_data_path = str(self.properties.get("input_data_path"))
         self.raw_data_path = str(self.properties.get("raw_data_path"))
         self.processed_data_path = str(self.properties.get("processed_data_path"))
+        self.ocr_cache_path = str(self.properties.get("ocr_cache_path", "ocr_cache"))
+        self.parquet_data_path = str(self.properties.get("parquet_data_path"))
+
+        #"direct" invokes the functions from the S3 notifications, "queued" buffers them in SQS first
+        self.ingestion_mode = self.properties.get("ingestion_mode", "direct")
+        self.ingestion_queue_settings = self.properties.get("ingestion_queue", {})
+        self.stage_queues = {}
+
+        #THE ROUTING TABLE: ONE OCR FUNCTION PER DOCUMENT TYPE, FED BY EVENTBRIDGE (see document_router)
+        self.document_routing = self.properties.get("document_routing", {})
+        self.document_types = self.document_routing.get("document_types", {})
+        self.routing_event_source = self.document_routing.get("event_source", "project.reception")
+        self.ocr_functions = {}
+
+        #MULTIPAGE DOCUMENTS ARE SPLIT INTO PAGE CHUNKS ANALYZED IN PARALLEL BY A STATE MACHINE (see page_fanout)
+        self.ocr_pages_settings = self.properties.get("ocr_pages", {})
+        self.ocr_pages_state_machine = None
 
         self.dev_role_ARN = self.properties.get("dev_role")
         self.saml_provider_ARN = self.properties.get("saml_provider_ARN")
@@ -34,13 +64,39 @@ class ReceptionAndModelingZoneStack(Stack):
         self.component_prefix = f"project-{env_prefix}"
 
         #CREATE CHECKIN AND MODELING FUNCTIONS
-        self.lambda_checkin_function = _util.define_lambda_function(self, "lambda_checkin_function", self.functions_path)
-        self.lambda_modeling_function = _util.define_lambda_function(self, "lambda_modeling_function", self.functions_path)
-        
-        #CREATE OCR FUNCTIONS
-        self.lambda_ocr_form4e = _util.define_lambda_function_with_role(self, "lambda_ocr_form4e", self.functions_path, self.create_lambda_ocr_role("lambda_ocr_form4e"))
-        self.lambda_ocr_ebcd = _util.define_lambda_function_with_role(self, "lambda_ocr_ebcd", self.functions_path, self.create_lambda_ocr_role("lambda_ocr_ebcd"))
-        self.lambda_ocr_itd = _util.define_lambda_function_with_role(self, "lambda_ocr_itd", self.functions_path, self.create_lambda_ocr_role("lambda_ocr_itd"))
+        self.lambda_checkin_function = ProfiledFunction(self, "lambda_checkin_function", self.functions_path, profile="checkin")
+        self.lambda_modeling_function = ProfiledFunction(self, "lambda_modeling_function", self.functions_path, profile="modeling")
+
+        #THE MODELING FUNCTION WRITES PARQUET WITH THE PYARROW LAYER AND UPDATES THE PARTITION MANIFESTS (SHARED LAYER)
+        self.lambda_modeling_function.add_layers(
+            _util.define_dependency_layer(self, "pyarrow")
+        )
+
+        self.lambda_checkin_function.add_environment("INPUT_DATA_PATH", self.input_data_path)
+        self.lambda_checkin_function.add_environment("RAW_DATA_PATH", self.raw_data_path)
+        self.lambda_checkin_function.add_environment("CHECKIN_MAX_WORKERS", str(self.properties.get("checkin_max_workers", 16)))
+
+        #CHECK-IN MOVES THE DOCUMENTS: PARALLEL PART COPIES ABOVE THE MULTIPART THRESHOLD, THE SOURCE DELETED ONCE VERIFIED
+        #THE FULL-OBJECT CRC64NVME CHECKSUMS AND CONDITIONAL DELETES NEED A NEWER BOTO3 THAN THE ONE OF THE PYTHON 3.9 RUNTIME
+        self.lambda_checkin_function.add_layers(
+            _util.define_dependency_layer(self, "boto3", pure_python=True)
+        )
+        _move_settings = self.properties.get("checkin_move", {})
+        self.lambda_checkin_function.add_environment("MOVE_MULTIPART_THRESHOLD_MB", str(_move_settings.get("multipart_threshold_mb", 128)))
+        self.lambda_checkin_function.add_environment("MOVE_PART_SIZE_MB", str(_move_settings.get("part_size_mb", 64)))
+        self.lambda_checkin_function.add_environment("MOVE_PART_WORKERS", str(_move_settings.get("part_workers", 8)))
+        self.lambda_checkin_function.add_environment("MOVE_DELETE_SOURCE", str(_move_settings.get("delete_source", True)).lower())
+
+        #CHECK-IN CLASSIFIES THE DOCUMENTS WITH THE KEY PATTERNS AND CONTENT MARKERS OF THE ROUTING TABLE
+        routing_table = {
+            document_type: {field: settings[field] for field in ("key_pattern", "content_markers") if field in settings}
+            for document_type, settings in self.document_types.items()
+        }
+        self.lambda_checkin_function.add_environment("ROUTING_TABLE", json.dumps(routing_table, separators=(",", ":")))
+        self.lambda_checkin_function.add_environment("ROUTING_SIGNATURE_BYTES", str(self.document_routing.get("signature_bytes", 4096)))
+        self.lambda_checkin_function.add_environment("ROUTING_EVENT_SOURCE", self.routing_event_source)
+        self.lambda_checkin_function.add_environment("ROUTING_EVENT_BUS", "default")
+        _events.EventBus.from_event_bus_name(self, "DefaultEventBus", "default").grant_put_events_to(self.lambda_checkin_function)
 
         #CREATE LANDINGZONE BUCKET (secured by KMS with key rotation)
         self._reception_zone_bucket_name = f"{self.component_prefix}-s3-receptionzone"
@@ -60,150 +116,312 @@ class ReceptionAndModelingZoneStack(Stack):
             destination_bucket=self.landing_zone_bucket
         )
         
-        #GRANT READ ACCESS SO THE RECEPTION FUNCTION CAN READ AND WRITE ON THE BUCKET
+        #GRANT READ, WRITE AND DELETE ACCESS SO THE RECEPTION FUNCTION CAN MOVE THE DOCUMENTS ON THE BUCKET
         self.landing_zone_bucket.grant_read(
             self.lambda_checkin_function, 
-            objects_key_pattern=self.input_data_path
+            objects_key_pattern=f"{self.input_data_path}/*"
         )
 
         self.landing_zone_bucket.grant_write(
             self.lambda_checkin_function, 
-            objects_key_pattern=self.raw_data_path
+            objects_key_pattern=f"{self.raw_data_path}/*"
         )
 
-        #GRANT READ AND WRITE ACCESS SO THE OCR FORM4E FUNCTION CAN READ AND WRITE ON THE BUCKET        
+        #THE MOVE HEADS THE COPY TO VERIFY IT AGAINST THE SOURCE (HeadObject NEEDS s3:GetObject)
         self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_form4e, 
-            objects_key_pattern=f"{self.raw_data_path}/2022/form4e/*"
+            self.lambda_checkin_function,
+            objects_key_pattern=f"{self.raw_data_path}/*"
         )
-        
-        self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_form4e, 
-            objects_key_pattern=f"{self.processed_data_path}/2022/form4e/*"
+
+        self.landing_zone_bucket.grant_delete(
+            self.lambda_checkin_function,
+            objects_key_pattern=f"{self.input_data_path}/*"
         )
-       
-        self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_form4e, 
-            objects_key_pattern=f"{self.raw_data_path}/2023/form4e/*"
+
+        #CREATE THE DEDUP INDEX SO CHECKIN DROPS REDELIVERED EVENTS AND RE-UPLOADED DOCUMENTS
+        _dedup_table_name = f"{self.component_prefix}-dynamodb-checkin-dedup"
+        self.dedup_table = _dynamodb.Table(
+            self,
+            _dedup_table_name,
+            table_name=_dedup_table_name,
+            partition_key=_dynamodb.Attribute(name="pk", type=_dynamodb.AttributeType.STRING),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=_dynamodb.TableEncryption.AWS_MANAGED,
+            time_to_live_attribute="expires_at"
         )
-        
-        self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_form4e, 
-            objects_key_pattern=f"{self.processed_data_path}/2023/form4e/*"
+        self.dedup_table.grant_read_write_data(self.lambda_checkin_function)
+
+        self.lambda_checkin_function.add_environment("DEDUP_TABLE_NAME", self.dedup_table.table_name)
+        self.lambda_checkin_function.add_environment("DEDUP_EVENT_TTL_SECONDS", str(self.properties.get("dedup_event_ttl_days", 7) * 24 * 3600))
+
+        #CREATE THE TABLE OF THE RUNNING OCR JOBS, EVERY DELIVERY OF THE SAME CONTENT JOINS ITS JOB WITH A CONDITIONAL UPDATE
+        _ocr_jobs_table_name = f"{self.component_prefix}-dynamodb-ocr-jobs"
+        self.ocr_jobs_table = _dynamodb.Table(
+            self,
+            _ocr_jobs_table_name,
+            table_name=_ocr_jobs_table_name,
+            partition_key=_dynamodb.Attribute(name="pk", type=_dynamodb.AttributeType.STRING),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=_dynamodb.TableEncryption.AWS_MANAGED,
+            time_to_live_attribute="expires_at"
         )
-        
-        #GRANT READ AND WRITE ACCESS SO THE OCR EBCD FUNCTION CAN READ AND WRITE ON THE BUCKET        
+
+        #CREATE THE PAGE FAN-OUT OF THE MULTIPAGE DOCUMENTS, SHARED BY EVERY DOCUMENT TYPE
+        if self.ocr_pages_settings.get("enabled", False) and self.document_types:
+            self.ocr_pages_state_machine = self.create_ocr_pages_state_machine()
+
+        #CREATE ONE OCR FUNCTION AND ROUTE PER DOCUMENT TYPE OF THE ROUTING TABLE
+        for document_type, settings in self.document_types.items():
+            self.ocr_functions[document_type] = self.add_document_route(document_type, settings)
+
+        #GRANT READ ACCESS ON THE OCR OUTPUT AND WRITE ACCESS ON THE CONFORMED ZONE SO THE MODELING FUNCTION CAN WRITE PARQUET
         self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_ebcd, 
-            objects_key_pattern=f"{self.raw_data_path}/2022/ebcd/*"
+            self.lambda_modeling_function,
+            objects_key_pattern=f"{self.processed_data_path}/*"
         )
-        
-        self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_ebcd, 
-            objects_key_pattern=f"{self.processed_data_path}/2022/ebcd/*"
+
+        _conformed_zone_bucket_name = f"{self.component_prefix}-s3-conformedzone"
+        conformed_zone_bucket = _s3.Bucket.from_bucket_name(self, f"get{_conformed_zone_bucket_name}", _conformed_zone_bucket_name)
+        conformed_zone_bucket.grant_read_write(
+            self.lambda_modeling_function,
+            objects_key_pattern=f"{self.parquet_data_path.strip('/')}/*"
         )
-   
-        self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_ebcd, 
-            objects_key_pattern=f"{self.raw_data_path}/2023/ebcd/*"
+
+        self.lambda_modeling_function.add_environment("PROCESSED_DATA_PATH", self.processed_data_path)
+        self.lambda_modeling_function.add_environment("CONFORMED_BUCKET_NAME", _conformed_zone_bucket_name)
+        self.lambda_modeling_function.add_environment("PARQUET_DATA_PATH", self.parquet_data_path)
+        self.lambda_modeling_function.add_environment("PARQUET_ROW_GROUP_MB", str(self.properties.get("parquet_row_group_mb", 128)))
+
+        #ADD THE EVENT NOTIFICATION SO THE CHECKIN FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
+        self.add_stage_trigger(self.lambda_checkin_function, self.input_data_path)
+
+        #ADD THE EVENT NOTIFICATION SO THE MODELING FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
+        self.add_stage_trigger(self.lambda_modeling_function, self.processed_data_path)
+
+        #################### INITIALIZER [END] ####################
+
+    '''
+    ROUTE OBJECT CREATED EVENTS UNDER A PREFIX TO A STAGE FUNCTION
+    In "queued" mode every function gets its own queue (and DLQ), shared by all the prefixes that feed it
+    '''
+    def add_stage_trigger(self, function, prefix):
+        if self.ingestion_mode == "queued":
+            destination = _s3n.SqsDestination(self.create_stage_queue(function))
+        else:
+            destination = _s3n.LambdaDestination(function.live)
+
+        self.landing_zone_bucket.add_event_notification(
+            _s3.EventType.OBJECT_CREATED, 
+            destination,
+            _s3.NotificationKeyFilter(
+                prefix=prefix
+            )
         )
-        
-        self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_ebcd, 
-            objects_key_pattern=f"{self.processed_data_path}/2023/ebcd/*"
+
+    def create_stage_queue(self, function, max_concurrency=None):
+        function_id = function.node.id
+        if function_id in self.stage_queues:
+            return self.stage_queues[function_id]
+
+        _queue_name = f"{self.component_prefix}-sqs-{function_id}"
+        dead_letter_queue = _sqs.Queue(
+            self,
+            f"{_queue_name}-dlq",
+            queue_name=f"{_queue_name}-dlq",
+            encryption=_sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            retention_period=_Duration.days(14)
+        )
+
+        #VISIBILITY TIMEOUT FOLLOWS THE AWS GUIDANCE OF SIX TIMES THE FUNCTION TIMEOUT
+        queue = _sqs.Queue(
+            self,
+            _queue_name,
+            queue_name=_queue_name,
+            encryption=_sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            visibility_timeout=_Duration.seconds(function.timeout.to_seconds() * 6),
+            dead_letter_queue=_sqs.DeadLetterQueue(
+                max_receive_count=self.ingestion_queue_settings.get("max_receive_count", 3),
+                queue=dead_letter_queue
+            )
         )
 
-        #GRANT READ AND WRITE ACCESS SO THE OCR ITD FUNCTION CAN READ AND WRITE ON THE BUCKET        
+        function.live.add_event_source(_lambda_event_sources.SqsEventSource(
+            queue,
+            batch_size=self.ingestion_queue_settings.get("batch_size", 10),
+            max_batching_window=_Duration.seconds(self.ingestion_queue_settings.get("max_batching_window_seconds", 5)),
+            max_concurrency=max_concurrency,
+            report_batch_item_failures=True
+        ))
+
+        self.stage_queues[function_id] = queue
+        return queue
+
+    '''
+    ROUTE THE DOCUMENTS OF ONE TYPE TO ITS OCR FUNCTION
+    An EventBridge rule forwards the routed events of the type to the queue of the function, whose event source
+    caps the concurrent executions the type can take (max_concurrency, between 2 and 1000)
+    '''
+    def add_document_route(self, document_type, settings):
+        max_concurrency = settings.get("max_concurrency")
+        if max_concurrency is not None and not 2 <= max_concurrency <= 1000:
+            raise ValueError(f"document_routing '{document_type}': max_concurrency must be between 2 and 1000")
+
+        function_name = f"lambda_ocr_{document_type}"
+        function = ProfiledFunction(self, function_name, self.functions_path, profile="ocr",
+                                    handler_module="lambda_ocr_function", role=self.create_lambda_ocr_role(function_name))
+        self.configure_ocr_function(function, document_type)
+
+        if self.ocr_pages_state_machine is not None:
+            self.ocr_pages_state_machine.grant_start_execution(function)
+            function.add_environment("OCR_PAGES_STATE_MACHINE_ARN", self.ocr_pages_state_machine.state_machine_arn)
+
+        #THE FUNCTION READS AND WRITES THE DOCUMENTS OF ITS TYPE, WHATEVER THEIR YEAR
         self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_itd, 
-            objects_key_pattern=f"{self.raw_data_path}/2022/itd/*"
+            function,
+            objects_key_pattern=f"{self.raw_data_path}/*/{document_type}/*"
         )
-        
+
         self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_itd, 
-            objects_key_pattern=f"{self.processed_data_path}/2022/itd/*"
+            function,
+            objects_key_pattern=f"{self.processed_data_path}/*/{document_type}/*"
+        )
+
+        _rule_name = f"{self.component_prefix}-rule-route-{document_type}"
+        _events.Rule(
+            self,
+            _rule_name,
+            rule_name=_rule_name,
+            event_pattern=_events.EventPattern(
+                source=[self.routing_event_source],
+                detail_type=[ROUTED_DETAIL_TYPE],
+                detail={"document_type": [document_type]}
+            ),
+            targets=[_events_targets.SqsQueue(self.create_stage_queue(function, max_concurrency=max_concurrency))]
         )
-   
+        return function
+
+    '''
+    SPLIT -> MAP OVER THE PAGE CHUNKS -> MERGE, ALL STEPS RUN BY THE OCR-PAGES FUNCTION
+    Failed chunks are retried chunk_retries times with backoff, then the job is failed and its pending record dropped
+    '''
+    def create_ocr_pages_state_machine(self):
+        function_name = "lambda_ocr_pages"
+        function = ProfiledFunction(self, function_name, self.functions_path, profile="ocr_pages",
+                                    role=self.create_lambda_ocr_role(function_name))
+        function.add_layers(
+            _util.define_dependency_layer(self, "pages")
+        )
+        function.add_environment("RAW_DATA_PATH", self.raw_data_path)
+        function.add_environment("PROCESSED_DATA_PATH", self.processed_data_path)
+        function.add_environment("OCR_CACHE_PATH", self.ocr_cache_path)
+        function.add_environment("OCR_PAGES_PER_CHUNK", str(self.ocr_pages_settings.get("pages_per_chunk", 4)))
+        self.add_ocr_jobs_table(function)
+
+        #THE FUNCTION SPLITS THE RAW DOCUMENTS OF EVERY TYPE AND COMPLETES THEIR PENDING JOBS
         self.landing_zone_bucket.grant_read(
-            self.lambda_ocr_itd, 
-            objects_key_pattern=f"{self.raw_data_path}/2023/itd/*"
+            function,
+            objects_key_pattern=f"{self.raw_data_path}/*"
         )
-        
         self.landing_zone_bucket.grant_write(
-            self.lambda_ocr_itd, 
-            objects_key_pattern=f"{self.processed_data_path}/2023/itd/*"
+            function,
+            objects_key_pattern=f"{self.processed_data_path}/*"
         )
-
-        #ADD THE EVENT NOTIFICATION SO THE OCR FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_checkin_function),
-            _s3.NotificationKeyFilter(
-                prefix=self.input_data_path
-            )
+        self.landing_zone_bucket.grant_read_write(
+            function,
+            objects_key_pattern=f"{self.ocr_cache_path}/*"
         )
-
-        #ADD THE EVENT NOTIFICATION SO THE OCR FORM4E FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_form4e),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2022/form4e/"
-            )
+        self.landing_zone_bucket.grant_delete(
+            function,
+            objects_key_pattern=f"{self.ocr_cache_path}/*"
         )
 
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_form4e),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2023/form4e/"
+        def step(name, action, **parameters):
+            return _sfn_tasks.LambdaInvoke(
+                self,
+                name,
+                lambda_function=function.live,
+                payload=_sfn.TaskInput.from_object({"action": action, **parameters}),
+                payload_response_only=True
             )
+
+        split_pages = step("SplitPages", "split", job=_sfn.JsonPath.object_at("$.job"))
+        analyze_chunk = step("AnalyzeChunk", "chunk", job=_sfn.JsonPath.object_at("$.job"),
+                             chunk=_sfn.JsonPath.object_at("$.chunk"))
+        analyze_chunk.add_retry(
+            errors=["States.ALL"],
+            max_attempts=self.ocr_pages_settings.get("chunk_retries", 2),
+            interval=_Duration.seconds(5),
+            backoff_rate=2
         )
+        merge_pages = step("MergePages", "merge", job=_sfn.JsonPath.object_at("$.job"),
+                           results=_sfn.JsonPath.object_at("$.results"))
+        fail_job = step("FailJob", "fail", job=_sfn.JsonPath.object_at("$.job"),
+                        error=_sfn.JsonPath.object_at("$.error"))
 
-        #ADD THE EVENT NOTIFICATION SO THE OCR EBCD FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_ebcd),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2022/ebcd/"
-            )
+        chunks = _sfn.Map(
+            self,
+            "AnalyzeChunks",
+            items_path="$.chunks",
+            max_concurrency=self.ocr_pages_settings.get("max_concurrency", 10),
+            parameters={"job.$": "$.job", "chunk.$": "$$.Map.Item.Value"},
+            result_path="$.results"
         )
+        chunks.iterator(analyze_chunk)
 
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_ebcd),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2023/ebcd/"
-            )
+        failed = fail_job.next(_sfn.Fail(self, "PagesFailed", error="OcrPagesFailed"))
+        for task in (split_pages, chunks, merge_pages):
+            task.add_catch(failed, errors=["States.ALL"], result_path="$.error")
+
+        _state_machine_name = f"{self.component_prefix}-sfn-ocr-pages"
+        return _sfn.StateMachine(
+            self,
+            _state_machine_name,
+            state_machine_name=_state_machine_name,
+            definition=split_pages.next(chunks).next(merge_pages),
+            timeout=_Duration.hours(2)
         )
 
-        #ADD THE EVENT NOTIFICATION SO THE OCR EBCD FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_itd),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2022/itd/"
-            )
+    '''
+    TEXTRACT PUBLISHES THE COMPLETION OF EVERY ASYNCHRONOUS JOB TO A TOPIC THAT INVOKES THE OCR FUNCTION AGAIN
+    '''
+    def configure_ocr_function(self, function, document_type):
+        _topic_name = f"{self.component_prefix}-sns-textract-{document_type}"
+        completion_topic = _sns.Topic(
+            self,
+            _topic_name,
+            topic_name=_topic_name
         )
+        completion_topic.add_subscription(_sns_subscriptions.LambdaSubscription(function.live))
 
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_ocr_itd),
-            _s3.NotificationKeyFilter(
-                prefix=f"{self.raw_data_path}/2023/itd/"
-            )
+        _textract_role_name = f"{self.component_prefix}-textract-role-{document_type}"
+        textract_role = _iam.Role(
+            self,
+            _textract_role_name,
+            role_name=_textract_role_name,
+            assumed_by=_iam.ServicePrincipal('textract.amazonaws.com')
         )
+        completion_topic.grant_publish(textract_role)
+        textract_role.grant_pass_role(function.grant_principal)
 
-        #ADD THE EVENT NOTIFICATION SO THE MODELING FUNCTION GETS TRIGGERED ONCE A NEW FILE IS UPLOADED TO THE BUCKET
-        self.landing_zone_bucket.add_event_notification(
-            _s3.EventType.OBJECT_CREATED, 
-            _s3n.LambdaDestination(self.lambda_modeling_function),
-            _s3.NotificationKeyFilter(
-                prefix=self.processed_data_path
-            )
+        self.landing_zone_bucket.grant_read_write(
+            function,
+            objects_key_pattern=f"{self.ocr_cache_path}/*"
         )
 
-        #################### INITIALIZER [END] ####################
+        function.add_environment("DOCUMENT_TYPE", document_type)
+        function.add_environment("RAW_DATA_PATH", self.raw_data_path)
+        function.add_environment("PROCESSED_DATA_PATH", self.processed_data_path)
+        function.add_environment("OCR_CACHE_PATH", self.ocr_cache_path)
+        function.add_environment("TEXTRACT_SNS_TOPIC_ARN", completion_topic.topic_arn)
+        function.add_environment("TEXTRACT_ROLE_ARN", textract_role.role_arn)
+        self.add_ocr_jobs_table(function)
+
+    def add_ocr_jobs_table(self, function):
+        self.ocr_jobs_table.grant_read_write_data(function)
+        function.add_environment("OCR_JOBS_TABLE_NAME", self.ocr_jobs_table.table_name)
+        function.add_environment("OCR_JOB_TTL_SECONDS", str(self.properties.get("ocr_job_ttl_hours", 24) * 3600))
 
     def create_lambda_ocr_role(self, func_name):
         role_name = f"{self.component_prefix}-lambda-ocrrole-{func_name}"
@@ -0,0 +1,293 @@
+import functools
+import importlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+import uuid
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+'''
+HANDLER RUNTIME
+Every Lambda handler of the project is written against this module, which
+ships in the shared layer:
+
+ - client(service) returns an AWS client created once per container
+ - lazy_module(name) defers the import of a heavy library to its first use
+ - iter_records(event) flattens S3 notifications, EventBridge S3 events,
+   routed documents and SNS messages, delivered directly or through SQS, into one record stream,
+   and batch_response() builds the partial batch response of SQS sources
+ - instrumented(namespace) wraps a handler, logs its errors as one JSON line
+   and emits the duration and cold start of every invocation in the CloudWatch
+   Embedded Metric Format
+ - new_trace(), trace_metadata() and trace_span() carry a document trace from
+   check-in to the graph and log one span per document and stage
+'''
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(service_name):
+    if service_name not in _clients:
+        with _clients_lock:
+            if service_name not in _clients:
+                import boto3
+                _clients[service_name] = boto3.client(service_name)
+    return _clients[service_name]
+
+
+'''
+PIN THE CLIENT OF A SERVICE (local stand-ins in tests, benchmarks and tools)
+'''
+def register_client(service_name, service_client):
+    with _clients_lock:
+        _clients[service_name] = service_client
+
+
+class LazyModule:
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+'''
+EVENT RECORDS
+source is "s3" for S3 notifications, "eventbridge" for EventBridge S3 events,
+"route" for the Document Routed events of check-in (body is their detail) and
+"sns" for SNS messages (body is the decoded message, bucket and key are
+None). message_id is the SQS message the record came in, None for direct
+invocations.
+'''
+Record = namedtuple('Record', ['message_id', 'source', 'bucket', 'key', 'size', 'etag', 'sequencer', 'body'])
+ROUTED_DETAIL_TYPE = 'Document Routed'
+
+
+def is_sqs_event(event):
+    records = event.get('Records') or []
+    return bool(records) and records[0].get('eventSource') == 'aws:sqs'
+
+
+def _s3_record(message_id, record):
+    s3_object = record['s3']['object']
+    return Record(
+        message_id=message_id,
+        source='s3',
+        bucket=record['s3']['bucket']['name'],
+        key=urllib.parse.unquote_plus(s3_object['key'], encoding='utf-8'),
+        size=s3_object.get('size'),
+        etag=s3_object.get('eTag'),
+        sequencer=s3_object.get('sequencer'),
+        body=record
+    )
+
+
+def _eventbridge_record(message_id, event):
+    detail = event.get('detail') or {}
+    s3_object = detail.get('object') or {}
+    # EventBridge keys are not URL encoded
+    return Record(
+        message_id=message_id,
+        source='eventbridge',
+        bucket=(detail.get('bucket') or {}).get('name'),
+        key=s3_object.get('key'),
+        size=s3_object.get('size'),
+        etag=s3_object.get('etag'),
+        sequencer=s3_object.get('sequencer'),
+        body=event
+    )
+
+
+def _routed_record(message_id, event):
+    detail = event['detail']
+    return Record(message_id, 'route', detail.get('bucket'), detail.get('key'), detail.get('size'), None, None, detail)
+
+
+def _sns_record(message_id, record):
+    message = record['Sns']['Message']
+    try:
+        message = json.loads(message)
+    except ValueError:
+        pass
+    return Record(message_id, 'sns', None, None, None, None, None, message)
+
+
+def _records_of(message_id, payload):
+    if payload.get('source') == 'aws.s3' and 'detail' in payload:
+        yield _eventbridge_record(message_id, payload)
+        return
+    if payload.get('detail-type') == ROUTED_DETAIL_TYPE:
+        yield _routed_record(message_id, payload)
+        return
+    # S3 sends a test message when the notification is first configured
+    if payload.get('Event') == 's3:TestEvent':
+        return
+    for record in payload.get('Records') or []:
+        if 's3' in record:
+            yield _s3_record(message_id, record)
+        elif record.get('EventSource') == 'aws:sns':
+            yield _sns_record(message_id, record)
+
+
+def iter_records(event):
+    if not is_sqs_event(event):
+        yield from _records_of(None, event)
+        return
+
+    for message in event['Records']:
+        yield from _records_of(message['messageId'], json.loads(message['body']))
+
+
+'''
+BUILD THE PARTIAL BATCH RESPONSE EXPECTED BY SQS EVENT SOURCES
+'''
+def batch_response(event, failed_message_ids):
+    if not is_sqs_event(event):
+        return {}
+
+    failures = []
+    for message_id in failed_message_ids:
+        if message_id is not None and {'itemIdentifier': message_id} not in failures:
+            failures.append({'itemIdentifier': message_id})
+    return {'batchItemFailures': failures}
+
+
+'''
+INVOCATION METRICS
+'''
+_cold_start = True
+
+
+def invocation_metrics(namespace, function_name, duration_ms, cold_start, failed, request_id=None):
+    return json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [['FunctionName']],
+                'Metrics': [
+                    {'Name': 'Duration', 'Unit': 'Milliseconds'},
+                    {'Name': 'ColdStart', 'Unit': 'Count'},
+                    {'Name': 'Errors', 'Unit': 'Count'}
+                ]
+            }]
+        },
+        'FunctionName': function_name,
+        'RequestId': request_id,
+        'Duration': round(duration_ms, 3),
+        'ColdStart': int(cold_start),
+        'Errors': int(failed)
+    })
+
+
+def instrumented(namespace):
+    def decorate(handler):
+        @functools.wraps(handler)
+        def invoke(event, context):
+            global _cold_start
+            cold_start, _cold_start = _cold_start, False
+            function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', handler.__module__)
+            request_id = getattr(context, 'aws_request_id', None)
+            failed = False
+            start = time.perf_counter()
+            try:
+                return handler(event, context)
+            except Exception as error:
+                failed = True
+                print(json.dumps({'level': 'error', 'function': function_name, 'request_id': request_id,
+                                  'error': f"{type(error).__name__}: {error}"}))
+                raise
+            finally:
+                print(invocation_metrics(namespace, function_name, (time.perf_counter() - start) * 1000,
+                                         cold_start, failed, request_id))
+        return invoke
+    return decorate
+
+
+'''
+DOCUMENT TRACES
+Check-in gives every document a trace, an id and the epoch milliseconds of its
+upload, stored as the trace-id and trace-start user metadata of the objects it
+writes. Each later stage reads it from its input object and copies it to its
+outputs (the modeling stage into the trace_id and trace_start columns).
+
+trace_span() is the line a stage logs for every document it is done with:
+StageDuration is the time spent in the stage and Elapsed the time since the
+upload, so the Elapsed of the digest stage is the end-to-end latency.
+'''
+TRACE_NAMESPACE = 'Project/DocumentTrace'
+TRACE_ID_METADATA = 'trace-id'
+TRACE_START_METADATA = 'trace-start'
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def epoch_ms(moment):
+    if isinstance(moment, datetime):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp() * 1000)
+    return None if moment is None else int(moment)
+
+
+def new_trace(start_ms=None):
+    return {'trace_id': uuid.uuid4().hex, 'trace_start': now_ms() if start_ms is None else start_ms}
+
+
+def trace_from_metadata(metadata):
+    metadata = metadata or {}
+    if not metadata.get(TRACE_ID_METADATA):
+        return None
+    try:
+        start = int(metadata.get(TRACE_START_METADATA))
+    except (TypeError, ValueError):
+        start = None
+    return {'trace_id': metadata[TRACE_ID_METADATA], 'trace_start': start}
+
+
+def trace_metadata(trace):
+    if not trace:
+        return {}
+    metadata = {TRACE_ID_METADATA: trace['trace_id']}
+    if trace.get('trace_start') is not None:
+        metadata[TRACE_START_METADATA] = str(trace['trace_start'])
+    return metadata
+
+
+def trace_span(trace, stage, key, enter_ms, exit_ms=None):
+    exit_ms = now_ms() if exit_ms is None else exit_ms
+    metrics = [{'Name': 'StageDuration', 'Unit': 'Milliseconds'}]
+    span = {
+        'Stage': stage,
+        'TraceId': trace['trace_id'],
+        'TraceStart': trace.get('trace_start'),
+        'Key': key,
+        'Enter': enter_ms,
+        'Exit': exit_ms,
+        'StageDuration': exit_ms - enter_ms
+    }
+    if trace.get('trace_start') is not None:
+        metrics.append({'Name': 'Elapsed', 'Unit': 'Milliseconds'})
+        span['Elapsed'] = exit_ms - trace['trace_start']
+    return json.dumps({
+        '_aws': {
+            'Timestamp': exit_ms,
+            'CloudWatchMetrics': [{'Namespace': TRACE_NAMESPACE, 'Dimensions': [['Stage']], 'Metrics': metrics}]
+        },
+        **span
+    })
@@ -0,0 +1,123 @@
+import http.client
+import itertools
+import os
+import socket
+import threading
+
+'''
+NEPTUNE CLIENT
+Routes requests to the cluster by kind: writes go to the writer (cluster)
+endpoint, reads are spread round-robin over the reader endpoints, so browsing
+does not compete with ingestion on the primary.
+
+Every thread keeps one keep-alive connection per endpoint. Read connections
+are reopened after recycle_after requests, which lets the DNS round-robin of
+the reader endpoint move them between replicas.
+
+    client = neptune_client.NeptuneClient.from_env()
+    client.write().post('/sparql', body, 'application/x-www-form-urlencoded')
+'''
+
+DEFAULT_PORT = 8182
+DEFAULT_RECYCLE_AFTER = 100
+CONNECTION_ERRORS = (http.client.HTTPException, ConnectionError, socket.timeout)
+
+
+def split_endpoint(endpoint, default_port):
+    host, _, port = endpoint.partition(':')
+    return host, int(port or default_port)
+
+
+class HttpSession:
+
+    def __init__(self, host, port, use_tls=True, timeout=60, recycle_after=None):
+        self.host = host
+        self.port = int(port)
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.recycle_after = recycle_after
+        self.connection = None
+        self.connections_opened = 0
+        self.requests = 0
+
+    def _connect(self):
+        factory = http.client.HTTPSConnection if self.use_tls else http.client.HTTPConnection
+        self.connection = factory(self.host, self.port, timeout=self.timeout)
+        self.connections_opened += 1
+        self.requests = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    '''
+    SEND ONE REQUEST, REOPENING THE CONNECTION ONCE IF THE SERVER CLOSED IT
+    Returns (status, headers, body bytes)
+    '''
+    def request(self, method, path, body=None, headers=None):
+        if self.recycle_after and self.requests >= self.recycle_after:
+            self.close()
+        for attempt in range(2):
+            if self.connection is None:
+                self._connect()
+            try:
+                self.connection.request(method, path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                content = response.read()
+                self.requests += 1
+                return response.status, response.getheaders(), content
+            except CONNECTION_ERRORS:
+                self.close()
+                if attempt:
+                    raise
+
+    def post(self, path, body, content_type):
+        status, _, content = self.request('POST', path, body, {'Content-Type': content_type})
+        return status, content.decode('utf-8', 'replace')
+
+
+class NeptuneClient:
+
+    def __init__(self, writer, readers=None, port=DEFAULT_PORT, use_tls=True, recycle_after=DEFAULT_RECYCLE_AFTER):
+        self.port = int(port)
+        self.use_tls = use_tls
+        self.recycle_after = recycle_after
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.set_endpoints(writer, readers)
+
+    @classmethod
+    def from_env(cls, environ=os.environ, **kwargs):
+        readers = [endpoint for endpoint in environ.get('NEPTUNE_READ_ENDPOINT', '').split(',') if endpoint]
+        return cls(environ['NEPTUNE_ENDPOINT'], readers, environ.get('NEPTUNE_PORT', DEFAULT_PORT), **kwargs)
+
+    '''
+    POINT THE CLIENT AT NEW ENDPOINTS, WITHOUT READERS EVERYTHING GOES TO THE WRITER
+    '''
+    def set_endpoints(self, writer, readers=None):
+        with self._lock:
+            self.writer = writer
+            self.readers = list(readers or []) or [writer]
+            self._next_reader = itertools.cycle(range(len(self.readers)))
+            self.generation = getattr(self, 'generation', 0) + 1
+
+    def _session(self, endpoint, recycle_after=None):
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None or self._local.generation != self.generation:
+            for session in (sessions or {}).values():
+                session.close()
+            sessions = self._local.sessions = {}
+            self._local.generation = self.generation
+        if endpoint not in sessions:
+            host, port = split_endpoint(endpoint, self.port)
+            sessions[endpoint] = HttpSession(host, port, use_tls=self.use_tls, recycle_after=recycle_after)
+        return sessions[endpoint]
+
+    def write(self):
+        return self._session(self.writer)
+
+    def read(self):
+        with self._lock:
+            endpoint = self.readers[next(self._next_reader)]
+        return self._session(endpoint, self.recycle_after)
@@ -0,0 +1,107 @@
+import random
+import time
+
+'''
+PARTITION MANIFEST
+The conformed table reads its Parquet files through one symlink manifest per
+partition (SymlinkTextInputFormat): a text object listing the s3:// URI of
+every live data file.
+
+    <parquet_data_path>_symlink/year=<year>/doctype=<doctype>/manifest
+
+Replacing that single object is atomic, so adding new files (modeling) and
+swapping small files for their compacted version (compaction) is never seen
+half done by Athena. Writers use S3 conditional writes (If-Match on the ETag
+read, If-None-Match for a new manifest) and retry on conflicts.
+
+Every compacted file has a lineage object listing the data files it replaced,
+written before the file itself, so readers that track data files (the digest)
+know its rows are already theirs:
+
+    <parquet_data_path>_compacted/year=<year>/doctype=<doctype>/<compacted file>.json
+'''
+
+MANIFEST_DIR = '_symlink'
+MANIFEST_NAME = 'manifest'
+LINEAGE_DIR = '_compacted'
+COMPACTED_SUFFIX = '-compacted.parquet'
+MAX_ATTEMPTS = 10
+
+
+class ManifestConflict(Exception):
+    pass
+
+
+def manifest_key(parquet_prefix, partition_path):
+    return f"{parquet_prefix.strip('/')}/{MANIFEST_DIR}/{partition_path.strip('/')}/{MANIFEST_NAME}"
+
+
+def lineage_key(parquet_prefix, data_key):
+    prefix = parquet_prefix.strip('/')
+    return f"{prefix}/{LINEAGE_DIR}/{data_key[len(prefix) + 1:]}.json"
+
+
+def data_uri(bucket, key):
+    return f"s3://{bucket}/{key}"
+
+
+def uri_key(uri):
+    return uri.split('/', 3)[3]
+
+
+def _error_code(error):
+    return str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+
+
+def read_manifest(s3, bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except Exception as error:
+        if _error_code(error) in ('NoSuchKey', '404'):
+            return [], None
+        raise
+    body = response['Body'].read().decode('utf-8')
+    return [line for line in body.splitlines() if line], response['ETag']
+
+
+def _write_manifest(s3, bucket, key, entries, etag):
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        s3.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=''.join(entry + '\n' for entry in entries).encode('utf-8'),
+            ContentType='text/plain',
+            **condition
+        )
+    except Exception as error:
+        conflicts = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+        # A manifest deleted since it was read fails its If-Match with a 404
+        if _error_code(error) in conflicts or (etag and _error_code(error) in ('NoSuchKey', '404')):
+            raise ManifestConflict(key)
+        raise
+
+
+'''
+ATOMICALLY ADD AND REMOVE ENTRIES OF A MANIFEST
+remove_required makes the update fail (returns None) when one of the entries
+to remove is no longer listed, which means another compaction got there first.
+'''
+def update_manifest(s3, bucket, key, add=(), remove=(), remove_required=False, sleep=time.sleep):
+    for attempt in range(MAX_ATTEMPTS):
+        entries, etag = read_manifest(s3, bucket, key)
+        listed = set(entries)
+        if remove_required and not set(remove) <= listed:
+            return None
+
+        removed = set(remove)
+        updated = [entry for entry in entries if entry not in removed]
+        updated.extend(entry for entry in add if entry not in listed or entry in removed)
+
+        try:
+            _write_manifest(s3, bucket, key, updated, etag)
+            return updated
+        except ManifestConflict:
+            sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    raise ManifestConflict(f"Gave up updating {key} after {MAX_ATTEMPTS} attempts")
@@ -0,0 +1,71 @@
+'''
+DEPLOYMENT WAVES OF A STAGE
+The graph is read from the dependencies of the stacks of the stage, before
+any synth: it holds the add_dependency calls, so every cross-stack reference of
+the stage is declared with add_dependency as well (the dependencies CDK derives
+from the references only exist once the stage is synthesized). A wave is a set
+of stacks whose dependencies are all deployed by the previous waves, CDK
+Pipelines runs the stacks of a wave side by side.
+
+The critical path is the longest chain of dependent stacks, weighted with the
+estimated minutes of properties.deploy_minutes (DEFAULT_DEPLOY_MINUTES when a
+stack has no estimate). It bounds the wall-clock deploy time of the stage.
+'''
+
+DEFAULT_DEPLOY_MINUTES = 5
+
+
+'''
+STACK NAME -> NAMES OF THE STACKS IT DEPENDS ON
+Dependencies on stacks outside the given ones are left out
+'''
+def stack_dependency_graph(stacks):
+    names = {stack.node.id for stack in stacks}
+    return {
+        stack.node.id: {dependency.node.id for dependency in stack.dependencies if dependency.node.id in names}
+        for stack in stacks
+    }
+
+
+def deployment_waves(graph):
+    remaining = {name: set(dependencies) for name, dependencies in graph.items()}
+    waves = []
+    while remaining:
+        wave = sorted(name for name, dependencies in remaining.items() if not dependencies)
+        if not wave:
+            raise ValueError(f"Dependency cycle between stacks: {', '.join(sorted(remaining))}")
+        waves.append(wave)
+        for name in wave:
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(wave)
+    return waves
+
+
+def critical_path(graph, deploy_minutes=None):
+    deploy_minutes = deploy_minutes or {}
+    finish = {}
+    previous = {}
+    for wave in deployment_waves(graph):
+        for name in wave:
+            start = 0
+            for dependency in sorted(graph[name]):
+                if finish[dependency] > start:
+                    start, previous[name] = finish[dependency], dependency
+            finish[name] = start + deploy_minutes.get(name, DEFAULT_DEPLOY_MINUTES)
+
+    if not finish:
+        return [], 0
+    name = max(finish, key=lambda stack: (finish[stack], stack))
+    total = finish[name]
+    path = [name]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    return path[::-1], total
+
+
+def describe_waves(graph, deploy_minutes=None):
+    lines = [f"Wave {index}: {', '.join(wave)}" for index, wave in enumerate(deployment_waves(graph), 1)]
+    path, total = critical_path(graph, deploy_minutes)
+    lines.append(f"Critical path ({total} min estimated): {' -> '.join(path)}")
+    return lines
@@ -1,5 +1,3 @@
-from repository.util import util as _util
-
 import aws_cdk as cdk
 from constructs import Construct
 
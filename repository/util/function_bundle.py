@@ -0,0 +1,73 @@
+import ast
+import os
+
+'''
+MINIMAL CODE BUNDLE OF A HANDLER
+A functions directory holds the handlers of every function of a stack and
+the modules they share. The bundle of one function is its handler module plus
+the local modules it imports (transitively), everything else in the directory
+is excluded from its asset. The asset hash only covers the bundled files, so a
+function is not redeployed when an unrelated module of its directory changes.
+'''
+
+ALWAYS_EXCLUDED = ["__pycache__", "*.pyc"]
+
+
+def local_module_path(functions_path, module_name):
+    for candidate in (f"{module_name}.py", module_name):
+        path = os.path.join(functions_path, candidate)
+        if os.path.isfile(path) or os.path.isfile(os.path.join(path, "__init__.py")):
+            return candidate
+    return None
+
+
+def imported_names(source_path):
+    with open(source_path, encoding="utf-8") as source:
+        tree = ast.parse(source.read(), filename=source_path)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name.split(".")[0]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            yield node.module.split(".")[0]
+
+
+'''
+FILES AND PACKAGES OF THE FUNCTIONS DIRECTORY THE HANDLER NEEDS (relative names)
+'''
+def handler_closure(functions_path, handler_module):
+    entry = local_module_path(functions_path, handler_module)
+    if entry is None:
+        raise ValueError(f"No handler module '{handler_module}' in {functions_path}")
+
+    closure = set()
+    pending = [entry]
+    while pending:
+        entry = pending.pop()
+        if entry in closure:
+            continue
+        closure.add(entry)
+
+        entry_path = os.path.join(functions_path, entry)
+        sources = [entry_path] if os.path.isfile(entry_path) else [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(entry_path) for name in names if name.endswith(".py")
+        ]
+        for source_path in sources:
+            for name in imported_names(source_path):
+                dependency = local_module_path(functions_path, name)
+                if dependency is not None and dependency not in closure:
+                    pending.append(dependency)
+    return closure
+
+
+'''
+EXCLUDE PATTERNS FOR Code.from_asset(functions_path, exclude=...)
+'''
+def bundle_excludes(functions_path, handler_module):
+    closure = handler_closure(functions_path, handler_module)
+    return ALWAYS_EXCLUDED + sorted(
+        name for name in os.listdir(functions_path)
+        if name not in closure and name not in ALWAYS_EXCLUDED
+    )
@@ -0,0 +1,137 @@
+from aws_cdk import (
+    aws_lambda as _lambda,
+    aws_ec2 as _ec2,
+    aws_logs as _logs,
+    Duration as _Duration,
+    Size as _Size,
+    Stack as _Stack
+)
+
+from constructs import Construct
+
+from repository.util import util as _util
+from repository.util.function_bundle import bundle_excludes
+
+'''
+PERFORMANCE PROFILED LAMBDA FUNCTION
+Every function of the project is sized by a named profile declared in the
+context (properties.lambda_profiles). Profiles inherit from "default":
+
+    "lambda_profiles":{
+        "default":{"memory_mb":256, "architecture":"x86_64", "timeout_seconds":600, ...},
+        "ocr":{"memory_mb":512, "architecture":"arm64"}
+    }
+
+memory_mb, architecture (x86_64 | arm64), ephemeral_storage_mb, timeout_seconds,
+runtime, reserved_concurrency, provisioned_concurrency and log_retention_days
+are supported. With provisioned concurrency a "live" alias is published, and
+triggers should target function.live (the function itself otherwise).
+
+The asset of a function only holds its handler module (handler_module, the
+function name by default, so several functions can share one) and the local
+modules it imports (see function_bundle), not the whole functions directory. The
+shared layer, which holds the handler runtime, is added to every function.
+'''
+
+DEFAULT_PROFILE = "default"
+
+BUILTIN_DEFAULTS = {
+    "memory_mb": 128,
+    "architecture": "x86_64",
+    "ephemeral_storage_mb": 512,
+    "timeout_seconds": 600,
+    "runtime": "PYTHON_3_9",
+    "reserved_concurrency": None,
+    "provisioned_concurrency": 0,
+    "log_retention_days": None
+}
+
+ARCHITECTURES = {
+    "x86_64": _lambda.Architecture.X86_64,
+    "arm64": _lambda.Architecture.ARM_64
+}
+
+LOG_RETENTION = {
+    1: _logs.RetentionDays.ONE_DAY,
+    3: _logs.RetentionDays.THREE_DAYS,
+    7: _logs.RetentionDays.ONE_WEEK,
+    14: _logs.RetentionDays.TWO_WEEKS,
+    30: _logs.RetentionDays.ONE_MONTH,
+    60: _logs.RetentionDays.TWO_MONTHS,
+    90: _logs.RetentionDays.THREE_MONTHS,
+    180: _logs.RetentionDays.SIX_MONTHS,
+    365: _logs.RetentionDays.ONE_YEAR
+}
+
+
+'''
+RESOLVE A PROFILE BY NAME ON TOP OF THE DEFAULT ONE
+'''
+def resolve_profile(properties, profile_name):
+    profiles = properties.get("lambda_profiles", {})
+    if profile_name not in profiles and profile_name != DEFAULT_PROFILE:
+        raise ValueError(f"No lambda profile '{profile_name}' in lambda_profiles ({', '.join(sorted(profiles))})")
+
+    profile = dict(BUILTIN_DEFAULTS)
+    profile.update(profiles.get(DEFAULT_PROFILE, {}))
+    profile.update(profiles.get(profile_name, {}))
+
+    if profile["architecture"] not in ARCHITECTURES:
+        raise ValueError(f"Lambda profile '{profile_name}': architecture must be one of {', '.join(ARCHITECTURES)}")
+    if not 128 <= profile["memory_mb"] <= 10240:
+        raise ValueError(f"Lambda profile '{profile_name}': memory_mb must be between 128 and 10240")
+    if not 512 <= profile["ephemeral_storage_mb"] <= 10240:
+        raise ValueError(f"Lambda profile '{profile_name}': ephemeral_storage_mb must be between 512 and 10240")
+    if not 1 <= profile["timeout_seconds"] <= 900:
+        raise ValueError(f"Lambda profile '{profile_name}': timeout_seconds must be between 1 and 900")
+    if profile["log_retention_days"] is not None and profile["log_retention_days"] not in LOG_RETENTION:
+        raise ValueError(f"Lambda profile '{profile_name}': log_retention_days must be one of {sorted(LOG_RETENTION)}")
+    return profile
+
+
+class ProfiledFunction(_lambda.Function):
+
+    def __init__(self, scope: Construct, function_name, function_path, profile=DEFAULT_PROFILE,
+                 role=None, layers=None, vpc=None, security_groups=None, handler_module=None, **kwargs) -> None:
+        properties = scope.node.try_get_context("properties").get("properties")
+        self.profile_name = profile
+        self.profile = resolve_profile(properties, profile)
+        handler_module = handler_module or function_name
+        print(f"Creating LAMBDA function: {function_name}/{function_path} ({profile})")
+
+        if vpc is not None:
+            kwargs.update(
+                vpc=vpc,
+                vpc_subnets=_ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED),
+                security_groups=security_groups
+            )
+        if self.profile["log_retention_days"] is not None:
+            kwargs["log_retention"] = LOG_RETENTION[self.profile["log_retention_days"]]
+
+        super().__init__(
+            scope,
+            function_name,
+            function_name=function_name,
+            runtime=getattr(_lambda.Runtime, self.profile["runtime"]),
+            code=_lambda.Code.from_asset(function_path, exclude=bundle_excludes(function_path, handler_module)),
+            handler=handler_module + '.handler',
+            role=role,
+            layers=list(layers or []) + [_util.define_shared_layer(_Stack.of(scope))],
+            architecture=ARCHITECTURES[self.profile["architecture"]],
+            memory_size=self.profile["memory_mb"],
+            ephemeral_storage_size=_Size.mebibytes(self.profile["ephemeral_storage_mb"]),
+            timeout=_Duration.seconds(self.profile["timeout_seconds"]),
+            reserved_concurrent_executions=self.profile["reserved_concurrency"],
+            **kwargs
+        )
+
+        #PROVISIONED CONCURRENCY LIVES ON A PUBLISHED VERSION, TRIGGERS USE THE ALIAS
+        self.live = self
+        if self.profile["provisioned_concurrency"]:
+            self.live = _lambda.Alias(
+                self,
+                "live",
+                alias_name="live",
+                version=self.current_version,
+                provisioned_concurrent_executions=self.profile["provisioned_concurrency"]
+            )
@@ -1,80 +1,63 @@
+import os
+
 from aws_cdk import (
     aws_lambda as _lambda,
-    aws_ec2 as _ec2,
-    aws_iam as _iam,
-    Duration as _Duration
+    BundlingOptions as _BundlingOptions
+)
+
+SHARED_LAYER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "stacks", "shared_layer")
+DEPENDENCY_LAYERS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "stacks", "dependency_layers")
+
+#TESTS AND C++ HEADERS ARE NEVER IMPORTED AT RUNTIME
+DEPENDENCY_LAYER_BUILD = (
+    "pip install --no-cache-dir -r requirements.txt -t /asset-output/python"
+    " && find /asset-output/python -depth -type d \\( -name tests -o -name include -o -name __pycache__ \\) -exec rm -rf {} +"
 )
 
 '''
-DEFINE LAMBDA FUNCTION
+DEFINE THE LAYER WITH THE MODULES SHARED BY THE FUNCTIONS OF SEVERAL STACKS (repository/stacks/shared_layer/python)
+One layer per stack, every function of the stack gets it (see ProfiledFunction)
 '''
-def define_lambda_function(self, function_name, function_path):
-    print("Creating LAMBDA function: " + function_name + "/" + function_path)
-    return _lambda.Function(
-        self, 
-        function_name,
-        function_name=function_name,
-        runtime=_lambda.Runtime.PYTHON_3_9,
-        code=_lambda.Code.from_asset(function_path),
-        handler=function_name + '.handler',
-        timeout=_Duration.minutes(10)
-    )
-    
-def define_lambda_function_on_vpc(self, function_name, function_path, _vpc):
-    print("Creating LAMBDA function on VPC: " + function_name + "/" + function_path)
-    return _lambda.Function(
-        self, 
-        function_name,
-        function_name=function_name,
-        runtime=_lambda.Runtime.PYTHON_3_9,
-        code=_lambda.Code.from_asset(function_path),
-        handler=function_name + '.handler',
-        vpc=_vpc,
-        vpc_subnets=_ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED),
-        timeout=_Duration.minutes(10)
+def define_shared_layer(self):
+    existing = self.node.try_find_child("shared_layer")
+    if existing is not None:
+        return existing
+    print("Creating LAMBDA layer: shared_layer/" + SHARED_LAYER_PATH)
+    return _lambda.LayerVersion(
+        self,
+        "shared_layer",
+        code=_lambda.Code.from_asset(SHARED_LAYER_PATH),
+        compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+        compatible_architectures=[_lambda.Architecture.X86_64, _lambda.Architecture.ARM_64]
     )
 
-def define_lambda_function_on_vpc_with_secgroup(self, function_name, function_path, _vpc, sec_group):
-    print("Creating LAMBDA function on VPC: " + function_name + "/" + function_path)
-    return _lambda.Function(
-        self, 
-        function_name,
-        function_name=function_name,
-        runtime=_lambda.Runtime.PYTHON_3_9,
-        code=_lambda.Code.from_asset(function_path),
-        handler=function_name + '.handler',
-        vpc=_vpc,
-        vpc_subnets=_ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED),
-        timeout=_Duration.minutes(10),
-        security_groups=[sec_group]
-    )
-
-def define_lambda_function_with_role(self, function_name, function_path, execRole):
-    print("Creating LAMBDA function: " + function_name + "/" + function_path)
-    
-    return _lambda.Function(
-        self, 
-        function_name,
-        function_name=function_name,
-        runtime=_lambda.Runtime.PYTHON_3_9,
-        code=_lambda.Code.from_asset(function_path),
-        handler=function_name + '.handler',
-        role=execRole,
-        timeout=_Duration.minutes(10)
+'''
+DEFINE A LAYER BUILT FROM THE requirements.txt OF repository/stacks/dependency_layers/<name>
+The packages are installed in the Lambda build image for x86_64. The bundle is
+cached under the hash of the requirements, so pip only runs when they change.
+pure_python layers (no compiled wheels) are offered to arm64 functions as well.
+'''
+def define_dependency_layer(self, name, pure_python=False):
+    layer_path = os.path.join(DEPENDENCY_LAYERS_PATH, name)
+    print("Creating LAMBDA layer: " + name + "/" + layer_path)
+    return _lambda.LayerVersion(
+        self,
+        f"{name}_layer",
+        code=_lambda.Code.from_asset(
+            layer_path,
+            bundling=_BundlingOptions(
+                image=_lambda.Runtime.PYTHON_3_9.bundling_image,
+                platform="linux/amd64",
+                command=["bash", "-c", DEPENDENCY_LAYER_BUILD]
+            )
+        ),
+        compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+        compatible_architectures=[_lambda.Architecture.X86_64] + ([_lambda.Architecture.ARM_64] if pure_python else [])
     )
 
-def define_lambda_function_on_vpc_with_secgroup_and_layer(self, function_name, function_path, _vpc, sec_group, layer):
-    print("Creating LAMBDA function on VPC: " + function_name + "/" + function_path)
-    return _lambda.Function(
-        self, 
-        function_name,
-        function_name=function_name,
-        runtime=_lambda.Runtime.PYTHON_3_9,
-        code=_lambda.Code.from_asset(function_path),
-        handler=function_name + '.handler',
-        vpc=_vpc,
-        vpc_subnets=_ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED),
-        timeout=_Duration.minutes(10),
-        security_groups=[sec_group],
-        layers=layer
-    )
\ No newline at end of file
+'''
+NAME OF THE SSM PARAMETER HOLDING A NEPTUNE ENDPOINT (writer-endpoint, reader-endpoint, port)
+Stacks deployed before the neptune stack look the endpoints up at runtime under these names
+'''
+def neptune_endpoint_parameter_name(component_prefix, name):
+    return f"/{component_prefix}/neptune/{name}"
@@ -0,0 +1,89 @@
+import copy
+import re
+import threading
+
+from tests.fakes.local_s3 import ClientError
+
+'''
+LOCAL DYNAMODB STAND-IN
+Low level client subset (put_item, get_item, update_item, delete_item) for
+tables with a single string partition key. Conditions support
+attribute_exists, attribute_not_exists and the equality of a top level
+attribute; updates support SET of (nested map) attributes only.
+'''
+
+class LocalDynamoDBClient:
+
+    def __init__(self, key_name='pk'):
+        self.key_name = key_name
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def _table(self, name):
+        return self.tables.setdefault(name, {})
+
+    def _name(self, token, names):
+        return names[token] if token.startswith('#') else token
+
+    def _check(self, item, condition, names, values, operation):
+        if condition is None:
+            return
+        match = re.fullmatch(r'(attribute_exists|attribute_not_exists)\((#?\w+)\)', condition)
+        if match:
+            exists = item is not None and self._name(match.group(2), names) in item
+            passed = exists == (match.group(1) == 'attribute_exists')
+        else:
+            match = re.fullmatch(r'(#?\w+) = (:\w+)', condition)
+            if not match:
+                raise NotImplementedError(condition)
+            passed = item is not None and item.get(self._name(match.group(1), names)) == values[match.group(2)]
+        if not passed:
+            raise ClientError('ConditionalCheckFailedException', 'The conditional request failed', operation)
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **kwargs):
+        key = Item[self.key_name]['S']
+        with self._lock:
+            table = self._table(TableName)
+            self._check(table.get(key), ConditionExpression, ExpressionAttributeNames or {},
+                        ExpressionAttributeValues or {}, 'PutItem')
+            table[key] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            item = self._table(TableName).get(Key[self.key_name]['S'])
+        return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        if not UpdateExpression.startswith('SET '):
+            raise NotImplementedError(UpdateExpression)
+        key = Key[self.key_name]['S']
+        with self._lock:
+            table = self._table(TableName)
+            self._check(table.get(key), ConditionExpression, names, values, 'UpdateItem')
+            item = table.setdefault(key, copy.deepcopy(Key))
+            for assignment in UpdateExpression[len('SET '):].split(','):
+                path, value = (part.strip() for part in assignment.split('='))
+                *parents, leaf = [self._name(token, names) for token in path.split('.')]
+                target = item
+                for parent in parents:
+                    if 'M' not in target.get(parent, {}):
+                        raise ClientError('ValidationException', 'The document path provided in the update '
+                                          'expression is invalid for update', 'UpdateItem')
+                    target = target[parent]['M']
+                target[leaf] = copy.deepcopy(values[value])
+            attributes = copy.deepcopy(item)
+        return {'Attributes': attributes} if ReturnValues == 'ALL_NEW' else {}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        key = Key[self.key_name]['S']
+        with self._lock:
+            table = self._table(TableName)
+            self._check(table.get(key), ConditionExpression, ExpressionAttributeNames or {},
+                        ExpressionAttributeValues or {}, 'DeleteItem')
+            item = table.pop(key, None)
+        return {'Attributes': item} if ReturnValues == 'ALL_OLD' and item is not None else {}
@@ -0,0 +1,37 @@
+import itertools
+import json
+
+'''
+LOCAL EVENTBRIDGE STAND-IN
+put_events() turns every entry into the event EventBridge would deliver to
+the targets of a rule, keeps it in `events` and hands it to on_event when
+given. fail_entries makes every entry fail the way a throttled PutEvents does.
+'''
+
+class LocalEventBridgeClient:
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.events = []
+        self.fail_entries = False
+        self._ids = itertools.count(1)
+
+    def put_events(self, Entries):
+        if self.fail_entries:
+            return {'FailedEntryCount': len(Entries),
+                    'Entries': [{'ErrorCode': 'ThrottlingException', 'ErrorMessage': 'Rate exceeded'} for _ in Entries]}
+
+        results = []
+        for entry in Entries:
+            event = {
+                'version': '0',
+                'id': f"event-{next(self._ids)}",
+                'detail-type': entry['DetailType'],
+                'source': entry['Source'],
+                'detail': json.loads(entry['Detail'])
+            }
+            self.events.append(event)
+            if self.on_event is not None:
+                self.on_event(event)
+            results.append({'EventId': event['id']})
+        return {'FailedEntryCount': 0, 'Entries': results}
@@ -0,0 +1,301 @@
+import base64
+import hashlib
+import io
+import itertools
+import threading
+import time
+import zlib
+
+from datetime import datetime, timezone
+
+'''
+LOCAL S3 STAND-IN
+Implements the subset of the boto3 S3 client used by the lambda functions,
+with an optional per-call latency so benchmarks behave like a network client.
+With ChecksumMode="ENABLED" heads report a full-object ChecksumCRC64NVME
+computed from the body; the value is a CRC-32 stand-in, only meant to be
+compared. Multipart uploads created with a ChecksumAlgorithm return the part
+checksum from UploadPartCopy and, like S3, reject a completion whose parts do
+not carry it.
+'''
+
+
+def _checksum(body):
+    return base64.b64encode(zlib.crc32(body).to_bytes(8, 'big')).decode('ascii')
+
+
+def _precondition_failed(operation):
+    return ClientError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold', operation)
+
+class ClientError(Exception):
+
+    def __init__(self, code, message, operation):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+        self.operation_name = operation
+
+
+class StreamingBody:
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read() if amt is None else self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class LocalS3Client:
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.buckets = {}
+        self.fail_keys = set()
+        self.calls = {}
+        self.uploads = {}
+        self._upload_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, operation, key=None):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if key is not None and key in self.fail_keys:
+            raise ClientError('InternalError', f"injected failure for {key}", operation)
+
+    def _objects(self, bucket):
+        with self._lock:
+            return self.buckets.setdefault(bucket, {})
+
+    def _get(self, bucket, key, operation):
+        obj = self._objects(bucket).get(key)
+        if obj is None:
+            raise ClientError('NoSuchKey', 'The specified key does not exist.', operation)
+        return obj
+
+    def create_bucket(self, Bucket, **kwargs):
+        self._objects(Bucket)
+        return {}
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        self._call('PutObject', Key)
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        obj = {
+            'Body': bytes(Body),
+            'Metadata': dict(Metadata or {}),
+            'ContentType': kwargs.get('ContentType', 'binary/octet-stream'),
+            'ETag': '"' + hashlib.md5(Body).hexdigest() + '"',
+            'LastModified': datetime.now(timezone.utc)
+        }
+        with self._lock:
+            objects = self.buckets.setdefault(Bucket, {})
+            current = objects.get(Key)
+            if IfNoneMatch == '*' and current is not None:
+                raise ClientError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold', 'PutObject')
+            if IfMatch is not None and (current is None or current['ETag'] != IfMatch):
+                code = 'NoSuchKey' if current is None else 'PreconditionFailed'
+                raise ClientError(code, 'At least one of the pre-conditions you specified did not hold', 'PutObject')
+            objects[Key] = obj
+        return {'ETag': obj['ETag']}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call('GetObject', Key)
+        obj = self._get(Bucket, Key, 'GetObject')
+        body = obj['Body']
+        if 'Range' in kwargs:
+            start, end = kwargs['Range'].replace('bytes=', '').split('-')
+            body = body[int(start):int(end) + 1]
+        return {
+            'Body': StreamingBody(body),
+            'ContentLength': len(body),
+            'ETag': obj['ETag'],
+            'Metadata': dict(obj['Metadata']),
+            'ContentType': obj['ContentType'],
+            'LastModified': obj['LastModified']
+        }
+
+    def head_object(self, Bucket, Key, ChecksumMode=None, **kwargs):
+        self._call('HeadObject', Key)
+        obj = self._get(Bucket, Key, 'HeadObject')
+        response = {
+            'ContentLength': len(obj['Body']),
+            'ETag': obj['ETag'],
+            'Metadata': dict(obj['Metadata']),
+            'ContentType': obj['ContentType'],
+            'LastModified': obj['LastModified']
+        }
+        if ChecksumMode == 'ENABLED':
+            response.update(ChecksumCRC64NVME=_checksum(obj['Body']), ChecksumType='FULL_OBJECT')
+        return response
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, MetadataDirective='COPY', CopySourceIfMatch=None,
+                    **kwargs):
+        self._call('CopyObject', CopySource['Key'])
+        source = self._get(CopySource['Bucket'], CopySource['Key'], 'CopyObject')
+        if CopySourceIfMatch is not None and source['ETag'] != CopySourceIfMatch:
+            raise _precondition_failed('CopyObject')
+        metadata = Metadata if MetadataDirective == 'REPLACE' else source['Metadata']
+        obj = dict(source, Metadata=dict(metadata or {}), LastModified=datetime.now(timezone.utc))
+        if MetadataDirective == 'REPLACE' and 'ContentType' in kwargs:
+            obj['ContentType'] = kwargs['ContentType']
+        with self._lock:
+            self.buckets.setdefault(Bucket, {})[Key] = obj
+        return {'CopyObjectResult': {'ETag': obj['ETag'], 'LastModified': obj['LastModified']}}
+
+    def delete_object(self, Bucket, Key, IfMatch=None, **kwargs):
+        self._call('DeleteObject', Key)
+        with self._lock:
+            objects = self.buckets.setdefault(Bucket, {})
+            if IfMatch is not None and Key in objects and objects[Key]['ETag'] != IfMatch:
+                raise _precondition_failed('DeleteObject')
+            objects.pop(Key, None)
+        return {}
+
+    '''
+    MULTIPART UPLOADS (parts are copied from other objects, UploadPartCopy)
+    '''
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, ChecksumAlgorithm=None, **kwargs):
+        self._call('CreateMultipartUpload', Key)
+        with self._lock:
+            upload_id = f"upload-{next(self._upload_ids)}"
+            self.uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'Metadata': dict(Metadata or {}),
+                                       'ContentType': kwargs.get('ContentType', 'binary/octet-stream'), 'Parts': {},
+                                       'ChecksumField': f"Checksum{ChecksumAlgorithm}" if ChecksumAlgorithm else None}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, upload_id, operation):
+        if upload_id not in self.uploads:
+            raise ClientError('NoSuchUpload', 'The specified upload does not exist.', operation)
+        return self.uploads[upload_id]
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange=None,
+                         CopySourceIfMatch=None, **kwargs):
+        self._call('UploadPartCopy', CopySource['Key'])
+        source = self._get(CopySource['Bucket'], CopySource['Key'], 'UploadPartCopy')
+        if CopySourceIfMatch is not None and source['ETag'] != CopySourceIfMatch:
+            raise _precondition_failed('UploadPartCopy')
+        body = source['Body']
+        if CopySourceRange:
+            start, end = CopySourceRange.replace('bytes=', '').split('-')
+            body = body[int(start):int(end) + 1]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        with self._lock:
+            upload = self._upload(UploadId, 'UploadPartCopy')
+            upload['Parts'][PartNumber] = (etag, body)
+        result = {'ETag': etag, 'LastModified': datetime.now(timezone.utc)}
+        if upload['ChecksumField']:
+            result[upload['ChecksumField']] = _checksum(body)
+        return {'CopyPartResult': result}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call('CompleteMultipartUpload', Key)
+        with self._lock:
+            upload = self._upload(UploadId, 'CompleteMultipartUpload')
+            parts = MultipartUpload['Parts']
+            numbers = [part['PartNumber'] for part in parts]
+            if numbers != sorted(set(numbers)) or any(upload['Parts'].get(part['PartNumber'], (None,))[0] != part['ETag']
+                                                      for part in parts):
+                raise ClientError('InvalidPart', 'One or more of the specified parts could not be found.',
+                                  'CompleteMultipartUpload')
+            field = upload['ChecksumField']
+            if field and any(part.get(field) != _checksum(upload['Parts'][part['PartNumber']][1]) for part in parts):
+                raise ClientError('InvalidRequest', f"The upload was created using a checksum algorithm, every part "
+                                  f"must carry its {field}.", 'CompleteMultipartUpload')
+            bodies = [upload['Parts'][number][1] for number in numbers]
+            digest = hashlib.md5(b''.join(hashlib.md5(body).digest() for body in bodies)).hexdigest()
+            obj = {
+                'Body': b''.join(bodies),
+                'Metadata': upload['Metadata'],
+                'ContentType': upload['ContentType'],
+                'ETag': f'"{digest}-{len(bodies)}"',
+                'LastModified': datetime.now(timezone.utc)
+            }
+            self.buckets.setdefault(Bucket, {})[Key] = obj
+            del self.uploads[UploadId]
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': obj['ETag']}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload', Key)
+        with self._lock:
+            self._upload(UploadId, 'AbortMultipartUpload')
+            del self.uploads[UploadId]
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        deleted = []
+        with self._lock:
+            objects = self.buckets.setdefault(Bucket, {})
+            for item in Delete['Objects']:
+                objects.pop(item['Key'], None)
+                deleted.append({'Key': item['Key']})
+        return {'Deleted': deleted}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', ContinuationToken=None, MaxKeys=1000, **kwargs):
+        self._call('ListObjectsV2')
+        with self._lock:
+            keys = sorted(key for key in self.buckets.get(Bucket, {}) if key.startswith(Prefix))
+            objects = self.buckets.get(Bucket, {})
+            after = ContinuationToken or StartAfter
+            if after:
+                keys = [key for key in keys if key > after]
+            page = keys[:MaxKeys]
+            contents = [{
+                'Key': key,
+                'Size': len(objects[key]['Body']),
+                'ETag': objects[key]['ETag'],
+                'LastModified': objects[key]['LastModified']
+            } for key in page]
+
+        response = {'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys, 'Prefix': Prefix}
+        if contents:
+            response['Contents'] = contents
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return _ListObjectsV2Paginator(self)
+
+    def keys(self, bucket, prefix=''):
+        with self._lock:
+            return sorted(key for key in self.buckets.get(bucket, {}) if key.startswith(prefix))
+
+    def metadata(self, bucket, key):
+        with self._lock:
+            obj = self.buckets.get(bucket, {}).get(key)
+            return dict(obj['Metadata']) if obj is not None else {}
+
+
+class _ListObjectsV2Paginator:
+
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Bucket, Prefix='', StartAfter='', PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize', 1000)
+        token = None
+        while True:
+            response = self._client.list_objects_v2(
+                Bucket=Bucket, Prefix=Prefix, StartAfter=StartAfter,
+                ContinuationToken=token, MaxKeys=page_size
+            )
+            yield response
+            if not response.get('IsTruncated'):
+                break
+            token = response['NextContinuationToken']
@@ -0,0 +1,131 @@
+import json
+import re
+import threading
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''
+LOCAL SPARQL ENDPOINT STAND-IN
+A plain HTTP/1.1 server with Neptune's /sparql and /gremlin interfaces.
+INSERT DATA triples are kept in a set. Read queries are answered with the
+number of stored triples and counted. The number of TCP connections is
+counted to check keep-alive, and the next requests can be made to fail the
+way Neptune does under write contention or throttling.
+
+    with LocalSparqlServer() as server:
+        session = sparql_writer.SparqlSession('127.0.0.1', server.port, use_tls=False)
+'''
+
+TRIPLE_LINE = re.compile(r'^(<[^>]*>) (<[^>]*>) (.+) \.$')
+FAILURES = {
+    'ConcurrentModificationException': 500,
+    'ThrottlingException': 429,
+    'MalformedQueryException': 400
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this every reply waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _query(self, text):
+        with self.server.lock:
+            self.server.queries.append(text)
+            count = len(self.server.triples)
+        self._reply(200, json.dumps({'results': {'bindings': [{'count': {'value': str(count)}}]}, 'query': text}))
+
+    def do_GET(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(parsed.query)
+        with self.server.lock:
+            self.server.requests += 1
+        if parsed.path == '/sparql' and 'query' in params:
+            return self._query(params['query'][0])
+        if parsed.path == '/gremlin' and 'gremlin' in params:
+            return self._query(params['gremlin'][0])
+        self._reply(400, '{"code": "MissingParameterException"}')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        with self.server.lock:
+            self.server.requests += 1
+            failure = self.server.failures.pop(0) if self.server.failures else None
+        if failure:
+            return self._reply(FAILURES[failure], f'{{"code": "{failure}", "detailedMessage": "injected"}}')
+        if self.path == '/gremlin':
+            return self._query(json.loads(body)['gremlin'])
+        form = urllib.parse.parse_qs(body)
+        if self.path == '/sparql' and 'query' in form:
+            return self._query(form['query'][0])
+        if self.path != '/sparql' or 'update' not in form:
+            return self._reply(400, '{"code": "MissingParameterException"}')
+
+        update = form['update'][0]
+        if not update.startswith('INSERT DATA {'):
+            return self._reply(400, '{"code": "MalformedQueryException"}')
+        triples = [TRIPLE_LINE.match(line).groups() for line in update.splitlines()[1:-1]]
+        with self.server.lock:
+            self.server.triples.update(triples)
+        self._reply(200, '{"head": {}, "results": {"bindings": []}}')
+
+
+class LocalSparqlServer:
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.failures = []
+        self.server.triples = set()
+        self.server.queries = []
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, *codes):
+        with self.server.lock:
+            self.server.failures.extend(codes)
+
+    @property
+    def triples(self):
+        return self.server.triples
+
+    @property
+    def queries(self):
+        return self.server.queries
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def requests(self):
+        return self.server.requests
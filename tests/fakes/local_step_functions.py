@@ -0,0 +1,56 @@
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+LOCAL STEP FUNCTIONS STAND-IN
+Runs the ocr-pages state machine of the reception stack against a step
+handler (the page_fanout.handle of an engine): split, then every chunk on a
+pool of max_concurrency workers, each retried up to `retries` times like the
+Retry of the Map state, then merge, or fail with the error of the chunk that
+ran out of retries. start_execution() only queues the execution;
+run_executions() runs the queued ones and returns their outputs.
+
+The pool is a thread pool: the S3 and Textract stand-ins live in the memory
+of the test process.
+'''
+
+class LocalStepFunctionsClient:
+
+    def __init__(self, handler, max_concurrency=10, retries=2):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.executions = []
+        self.attempts = {}
+
+    def start_execution(self, stateMachineArn, name, input):
+        if any(execution['name'] == name for execution in self.executions):
+            raise RuntimeError(f"ExecutionAlreadyExists: {name}")
+        self.executions.append({'name': name, 'input': json.loads(input), 'status': 'RUNNING'})
+        return {'executionArn': f"{stateMachineArn}:{name}"}
+
+    def _analyze(self, job, chunk):
+        for attempt in range(self.retries + 1):
+            self.attempts[chunk['index']] = attempt + 1
+            try:
+                return self.handler({'action': 'chunk', 'job': job, 'chunk': chunk})
+            except Exception as error:
+                if attempt == self.retries:
+                    raise error
+
+    def _run(self, execution):
+        job = execution['input']['job']
+        try:
+            split = self.handler({'action': 'split', 'job': job})
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                results = list(pool.map(lambda chunk: self._analyze(job, chunk), split['chunks']))
+            execution['status'] = 'SUCCEEDED'
+            return self.handler({'action': 'merge', 'job': job, 'results': results})
+        except Exception as error:
+            execution['status'] = 'FAILED'
+            return self.handler({'action': 'fail', 'job': job,
+                                 'error': {'Error': type(error).__name__, 'Cause': str(error)}})
+
+    def run_executions(self):
+        return [self._run(execution) for execution in self.executions if execution['status'] == 'RUNNING']
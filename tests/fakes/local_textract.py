@@ -0,0 +1,70 @@
+import itertools
+import json
+import time
+
+'''
+LOCAL TEXTRACT STAND-IN
+Implements the TextractBackend interface of the OCR engine on top of the local
+S3 stand-in. A document is plain text: pages are separated by form feeds and
+every line becomes a LINE block. Asynchronous jobs finish when finish_jobs()
+is called (for the jobs started before started_before when given, a
+time.monotonic() value), which returns the SNS events Textract would have
+published.
+'''
+
+class LocalTextract:
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.calls = {'analyze_document': 0, 'start_document_analysis': 0, 'get_document_analysis': 0}
+        self.jobs = {}
+        self.fail_jobs = False
+        self._ids = itertools.count(1)
+
+    def _blocks(self, bucket, key):
+        text = self.s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+        blocks = []
+        for page_number, page in enumerate(text.split('\f'), start=1):
+            blocks.append({'BlockType': 'PAGE', 'Id': f"page-{page_number}", 'Page': page_number})
+            for line_number, line in enumerate(page.splitlines(), start=1):
+                blocks.append({'BlockType': 'LINE', 'Id': f"line-{page_number}-{line_number}",
+                               'Page': page_number, 'Text': line, 'Confidence': 99.0})
+        return blocks
+
+    def analyze_document(self, bucket, key):
+        self.calls['analyze_document'] += 1
+        return self._blocks(bucket, key)
+
+    def start_document_analysis(self, bucket, key, job_tag):
+        self.calls['start_document_analysis'] += 1
+        job_id = f"job-{next(self._ids)}"
+        self.jobs[job_id] = {'bucket': bucket, 'key': key, 'tag': job_tag, 'status': 'IN_PROGRESS',
+                             'started': time.monotonic()}
+        return job_id
+
+    def get_document_analysis(self, job_id):
+        self.calls['get_document_analysis'] += 1
+        job = self.jobs[job_id]
+        if job['status'] != 'SUCCEEDED':
+            return job['status'], []
+        return 'SUCCEEDED', self._blocks(job['bucket'], job['key'])
+
+    def running_jobs(self):
+        return sum(1 for job in list(self.jobs.values()) if job['status'] == 'IN_PROGRESS')
+
+    def finish_jobs(self, started_before=None):
+        records = []
+        for job_id, job in list(self.jobs.items()):
+            if job['status'] != 'IN_PROGRESS':
+                continue
+            if started_before is not None and job['started'] > started_before:
+                continue
+            job['status'] = 'FAILED' if self.fail_jobs else 'SUCCEEDED'
+            records.append({'EventSource': 'aws:sns', 'Sns': {'Message': json.dumps({
+                'JobId': job_id,
+                'Status': job['status'],
+                'API': 'StartDocumentAnalysis',
+                'JobTag': job['tag'],
+                'DocumentLocation': {'S3ObjectName': job['key'], 'S3Bucket': job['bucket']}
+            })}})
+        return {'Records': records}
@@ -0,0 +1,35 @@
+import importlib
+import os
+import sys
+
+'''
+LOAD A LAMBDA HANDLER MODULE THE WAY THE LAMBDA RUNTIME DOES
+Handlers import their sibling modules by top-level name, so the functions
+directory of the stack (and the shared layer) is put on sys.path before
+importing. Modules cached from another stack's functions directory are
+evicted first.
+'''
+
+STACKS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'repository', 'stacks')
+# Contents of the shared lambda layer, found under /opt/python in AWS
+SHARED_LAYER_PATH = os.path.join(STACKS_PATH, 'shared_layer', 'python')
+
+
+def functions_path(stack_name, directory='functions'):
+    return os.path.join(STACKS_PATH, stack_name, directory)
+
+
+def load_function_module(stack_name, module_name, directory='functions'):
+    path = functions_path(stack_name, directory)
+
+    for name, module in list(sys.modules.items()):
+        module_dir = os.path.dirname(getattr(module, '__file__', None) or '')
+        if module_dir.startswith(STACKS_PATH) and module_dir not in (path, SHARED_LAYER_PATH) and '.' not in name:
+            del sys.modules[name]
+
+    for search_path in (SHARED_LAYER_PATH, path):
+        if search_path in sys.path:
+            sys.path.remove(search_path)
+        sys.path.insert(0, search_path)
+
+    return importlib.import_module(module_name)
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+BUCKET = 'project-dev-s3-receptionzone'
+
+
+def s3_event(*keys):
+    return {'Records': [
+        {'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key, 'size': 3}}}
+        for key in keys
+    ]}
+
+
+def test_destination_key():
+    engine = load_function_module('reception_modeling_zone_stack', 'checkin_engine')
+
+    assert engine.destination_key('input_data/2023/itd/a.pdf', 'input_data', 'raw_data') == 'raw_data/2023/itd/a.pdf'
+    assert engine.destination_key('input_data/2023/input_data/a.pdf', 'input_data', 'raw_data') == 'raw_data/2023/input_data/a.pdf'
+    assert engine.destination_key('other/a.pdf', 'input_data', 'raw_data') is None
+    assert engine.destination_key('input_data/', 'input_data', 'raw_data') is None
+
+
+def test_handler_copies_batch_and_isolates_failures(capsys):
+    checkin = load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+    s3 = LocalS3Client()
+    keys = [f"input_data/2023/form4e/scan+{i}.pdf" for i in range(20)]
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key.replace('+', ' '), Body=b'pdf')
+    s3.fail_keys.add('input_data/2023/form4e/scan 7.pdf')
+    checkin.handler_runtime.register_client('s3', s3)
+
+    # A direct invocation with a failed record fails as a whole so Lambda retries it, the other records are copied
+    with pytest.raises(checkin.checkin_engine.CheckinFailed):
+        checkin.handler(s3_event(*keys, 'processed_data/x.json'), None)
+
+    logged = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert {'copied': 19, 'duplicate': 0, 'skipped': 1, 'failed': 1} in logged
+    assert [line['key'] for line in logged if line.get('status') == 'failed'] == ['input_data/2023/form4e/scan 7.pdf']
+    assert 'raw_data/2023/form4e/scan 3.pdf' in s3.keys(BUCKET, 'raw_data/')
+    assert 'raw_data/2023/form4e/scan 7.pdf' not in s3.keys(BUCKET, 'raw_data/')
+
+
+def test_handler_reports_partial_batch_failures_for_sqs_events():
+    checkin = load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/2022/ebcd/ok.pdf', Body=b'pdf')
+    checkin.handler_runtime.register_client('s3', s3)
+
+    event = {'Records': [
+        {'eventSource': 'aws:sqs', 'messageId': 'm-1', 'body': json.dumps(s3_event('input_data/2022/ebcd/ok.pdf'))},
+        {'eventSource': 'aws:sqs', 'messageId': 'm-2', 'body': json.dumps(s3_event('input_data/2022/ebcd/missing.pdf'))},
+        {'eventSource': 'aws:sqs', 'messageId': 'm-3', 'body': json.dumps({'Event': 's3:TestEvent'})}
+    ]}
+
+    response = checkin.handler(event, None)
+
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm-2'}]
+    assert s3.keys(BUCKET, 'raw_data/') == ['raw_data/2022/ebcd/ok.pdf']
+
+
+def test_dedup_index_drops_redelivered_events_and_reuploaded_content(monkeypatch):
+    checkin = load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+    s3 = LocalS3Client()
+    checkin.handler_runtime.register_client('s3', s3)
+    checkin.handler_runtime.register_client('dynamodb', LocalDynamoDBClient())
+    monkeypatch.setenv('DEDUP_TABLE_NAME', 'dedup')
+
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a.pdf', Body=b'same scan')
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a-again.pdf', Body=b'same scan')
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/b.pdf', Body=b'other scan')
+    s3.fail_keys.add('input_data/2023/itd/b.pdf')
+
+    def event(key, sequencer):
+        return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key, 'sequencer': sequencer}}}]}
+
+    first = checkin.handler(event('input_data/2023/itd/a.pdf', '01'), None)
+    redelivered = checkin.handler(event('input_data/2023/itd/a.pdf', '01'), None)
+    reuploaded = checkin.handler(event('input_data/2023/itd/a-again.pdf', '02'), None)
+    with pytest.raises(checkin.checkin_engine.CheckinFailed):
+        checkin.handler(event('input_data/2023/itd/b.pdf', '03'), None)
+    s3.fail_keys.clear()
+    retried = checkin.handler(event('input_data/2023/itd/b.pdf', '03'), None)
+
+    assert first['summary']['copied'] == 1
+    assert redelivered['results'][0]['reason'] == 'event'
+    assert reuploaded['results'][0]['reason'] == 'content'
+    assert retried['summary']['copied'] == 1
+    assert s3.keys(BUCKET, 'raw_data/') == ['raw_data/2023/itd/a.pdf', 'raw_data/2023/itd/b.pdf']
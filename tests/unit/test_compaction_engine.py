@@ -0,0 +1,85 @@
+import io
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+BUCKET = 'conformed'
+MANIFEST = 'test/_symlink/year=2023/doctype=itd/manifest'
+
+
+def put_parquet(s3, key, names):
+    sink = io.BytesIO()
+    pq.write_table(pa.table({'document_name': names}), sink)
+    s3.put_object(Bucket=BUCKET, Key=key, Body=sink.getvalue())
+    return sink.tell()
+
+
+def populate(engine, s3, count):
+    manifest = engine.partition_manifest
+    for i in range(count):
+        key = f"test/year=2023/doctype=itd/part-{i:03d}.parquet"
+        put_parquet(s3, key, [f"doc-{i}-{j}" for j in range(3)])
+        manifest.update_manifest(s3, BUCKET, MANIFEST, add=[manifest.data_uri(BUCKET, key)])
+
+
+def test_plan_groups():
+    engine = load_function_module('comformed_zone_stack', 'compaction_engine')
+
+    groups = engine.plan_groups([('a', 10), ('b', 10), ('c', 500), ('d', 10), ('e', 10), ('f', 10)], 30, 100)
+
+    assert groups == [['a', 'b', 'd'], ['e', 'f']]
+    assert engine.plan_groups([('a', 10), ('b', 500)], 30, 100) == []
+
+
+def test_compaction_swaps_small_files_atomically():
+    engine = load_function_module('comformed_zone_stack', 'compaction_engine')
+    s3 = LocalS3Client()
+    populate(engine, s3, 6)
+
+    report = engine.compact_partition(s3, BUCKET, '/test/', MANIFEST, target_bytes=10 ** 9, small_bytes=10 ** 6,
+                                      orphan_grace_seconds=3600)
+
+    entries, _ = engine.partition_manifest.read_manifest(s3, BUCKET, MANIFEST)
+    assert report['before']['files'] == 6
+    assert report['after']['files'] == 1
+    assert report['orphans_deleted'] == 0
+    assert len(entries) == 1 and entries[0].endswith('-compacted.parquet')
+
+    merged = pq.read_table(io.BytesIO(s3.get_object(Bucket=BUCKET, Key=entries[0].split('/', 3)[3])['Body'].read()))
+    assert sorted(merged.column('document_name').to_pylist()) == sorted(f"doc-{i}-{j}" for i in range(6) for j in range(3))
+
+    later = datetime.now(timezone.utc) + timedelta(hours=2)
+    report = engine.compact_partition(s3, BUCKET, '/test/', MANIFEST, target_bytes=10 ** 9, small_bytes=10 ** 6,
+                                      orphan_grace_seconds=3600, now=later)
+    assert report['orphans_deleted'] == 6
+    assert s3.keys(BUCKET, 'test/year=2023/') == [entries[0].split('/', 3)[3]]
+
+
+def test_compaction_backs_off_when_the_files_were_already_swapped():
+    engine = load_function_module('comformed_zone_stack', 'compaction_engine')
+    s3 = LocalS3Client()
+    populate(engine, s3, 2)
+    manifest = engine.partition_manifest
+    original_update = manifest.update_manifest
+
+    def concurrent_update(s3_client, bucket, key, add=(), remove=(), remove_required=False, **kwargs):
+        original_update(s3_client, bucket, key, remove=[manifest.data_uri(BUCKET, 'test/year=2023/doctype=itd/part-000.parquet')])
+        return original_update(s3_client, bucket, key, add=add, remove=remove, remove_required=remove_required, **kwargs)
+
+    manifest.update_manifest = concurrent_update
+    try:
+        report = engine.compact_partition(s3, BUCKET, '/test/', MANIFEST, target_bytes=10 ** 9, small_bytes=10 ** 6,
+                                          orphan_grace_seconds=3600)
+    finally:
+        manifest.update_manifest = original_update
+
+    assert report['conflicts'] == 1
+    assert report['groups'] == 0
+    assert not [key for key in s3.keys(BUCKET, 'test/') if key.endswith('-compacted.parquet')]
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+from repository.stages.deployment_waves import critical_path, deployment_waves, stack_dependency_graph
+
+GRAPH = {
+    'NetworkLayer': set(),
+    'ReceptionAndModelingZoneStack': set(),
+    'ComformedZoneStack': set(),
+    'FargateStack': {'NetworkLayer'},
+    'NeptuneStack': {'NetworkLayer', 'ComformedZoneStack', 'FargateStack'},
+    'AnalyticsStack': {'ComformedZoneStack'}
+}
+
+
+def stack(stack_id, dependencies=()):
+    return SimpleNamespace(node=SimpleNamespace(id=stack_id), dependencies=list(dependencies))
+
+
+def test_graph_comes_from_the_stack_dependencies():
+    other_stage = stack('SharedNetwork')
+    network = stack('NetworkLayer', [other_stage])
+    fargate = stack('FargateStack', [network])
+
+    assert stack_dependency_graph([network, fargate]) == {
+        'NetworkLayer': set(), 'FargateStack': {'NetworkLayer'}
+    }
+
+
+def test_independent_stacks_share_a_wave():
+    assert deployment_waves(GRAPH) == [
+        ['ComformedZoneStack', 'NetworkLayer', 'ReceptionAndModelingZoneStack'],
+        ['AnalyticsStack', 'FargateStack'],
+        ['NeptuneStack']
+    ]
+
+
+def test_critical_path_follows_the_estimates():
+    assert critical_path(GRAPH) == (['NetworkLayer', 'FargateStack', 'NeptuneStack'], 15)
+    assert critical_path(GRAPH, {'ComformedZoneStack': 30}) == (['ComformedZoneStack', 'NeptuneStack'], 35)
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError):
+        deployment_waves({'A': {'B'}, 'B': {'A'}})
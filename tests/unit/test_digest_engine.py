@@ -0,0 +1,119 @@
+import io
+import urllib.error
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+CONFORMED = 'project-dev-s3-conformedzone'
+NEPTUNE = 'project-dev-s3-neptunezone'
+
+
+class RecordingSparql:
+
+    def __init__(self):
+        self.batches = []
+
+    def insert(self, triples):
+        self.batches.append(triples)
+        return {'triples': len(triples), 'requests': 1, 'retries': 0}
+
+
+class FakeLoaderTransport:
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def __call__(self, method, url, body=None):
+        self.requests.append((method, url, body))
+        if method == 'POST':
+            return 200, {'status': '200 OK', 'payload': {'loadId': 'load-1'}}
+        return 200, {'payload': {'overallStatus': {'status': self.statuses.pop(0), 'totalRecords': 42}}}
+
+
+def put_parquet(s3, key, count):
+    sink = io.BytesIO()
+    pq.write_table(pa.table({
+        'document_name': [f"doc \"{i}\"" for i in range(count)],
+        'content_sha256': [f"{i:064x}" for i in range(count)],
+        'page_count': pa.array([1] * count, pa.int32())
+    }), sink)
+    s3.put_object(Bucket=CONFORMED, Key=key, Body=sink.getvalue())
+
+
+def test_rdf_mapping_escapes_literals():
+    rdf_mapping = load_function_module('neptune_stack', 'rdf_mapping')
+
+    triples = rdf_mapping.document_triples({'content_sha256': 'ab', 'document_name': 'a "b"\nc', 'year': 2023})
+
+    assert triples[0] == ('<urn:project:document/ab>', rdf_mapping.RDF_TYPE, '<urn:project:Document>')
+    assert ('<urn:project:document/ab>', '<urn:project:documentName>', '"a \\"b\\"\\nc"') in triples
+    assert ('<urn:project:document/ab>', '<urn:project:year>',
+            '"2023"^^<http://www.w3.org/2001/XMLSchema#integer>') in triples
+
+
+def test_small_batch_uses_sparql():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    s3 = LocalS3Client()
+    key = 'test/year=2023/doctype=itd/part-0.parquet'
+    put_parquet(s3, key, 2)
+    sparql = RecordingSparql()
+
+    report = engine.digest(s3, [(CONFORMED, key)], sparql, None, NEPTUNE, 'main', bulk_threshold=100)
+
+    assert report == {'path': 'sparql', 'files': 1, 'rows': 2, 'triples': 10,
+                      'sparql': {'triples': 10, 'requests': 1, 'retries': 0}, 'traces': []}
+    assert ('<urn:project:document/' + f"{0:064x}>", '<urn:project:documentType>', '"itd"') in sparql.batches[0]
+    assert s3.keys(NEPTUNE) == []
+
+
+def test_large_batch_is_staged_and_bulk_loaded():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    loader_module = load_function_module('neptune_stack', 'neptune_loader')
+    s3 = LocalS3Client()
+    key = 'test/year=2023/doctype=itd/part-0.parquet'
+    put_parquet(s3, key, 30)
+    transport = FakeLoaderTransport(['LOAD_IN_PROGRESS', 'LOAD_COMPLETED'])
+    loader = loader_module.NeptuneLoader('cluster', 8182, 'arn:role', 'eu-west-1', transport=transport, sleep=lambda s: None)
+
+    report = engine.digest(s3, [(CONFORMED, key)], RecordingSparql(), loader, NEPTUNE, '/main/',
+                           bulk_threshold=100, file_triples=60, run_id='run')
+
+    assert report['path'] == 'bulk'
+    assert report['source'] == f"s3://{NEPTUNE}/main/run/"
+    assert s3.keys(NEPTUNE) == [f"main/run/part-{i:05d}.nt" for i in range(3)]
+    assert report['load']['status'] == 'LOAD_COMPLETED'
+    method, url, body = transport.requests[0]
+    assert (method, url) == ('POST', 'https://cluster:8182/loader')
+    assert body['source'] == report['source'] and body['format'] == 'ntriples' and body['iamRoleArn'] == 'arn:role'
+
+
+def test_failed_load_raises():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    loader_module = load_function_module('neptune_stack', 'neptune_loader')
+    s3 = LocalS3Client()
+    key = 'test/year=2023/doctype=itd/part-0.parquet'
+    put_parquet(s3, key, 30)
+    loader = loader_module.NeptuneLoader('cluster', 8182, 'arn:role', 'eu-west-1',
+                                         transport=FakeLoaderTransport(['LOAD_FAILED']))
+
+    with pytest.raises(engine.LoadFailed):
+        engine.digest(s3, [(CONFORMED, key)], RecordingSparql(), loader, NEPTUNE, 'main', bulk_threshold=100)
+
+
+def test_rejected_load_request_raises_with_the_loader_error():
+    loader_module = load_function_module('neptune_stack', 'neptune_loader')
+
+    def rejecting_transport(method, url, body=None):
+        raise urllib.error.HTTPError(url, 400, 'Bad Request', {}, io.BytesIO(
+            b'{"code": "BadRequestException", "detailedMessage": "Failed to start new load from the source"}'))
+
+    loader = loader_module.NeptuneLoader('cluster', 8182, 'arn:role', 'eu-west-1', transport=rejecting_transport)
+
+    with pytest.raises(RuntimeError, match='failed with 400: .*BadRequestException'):
+        loader.start('s3://neptune/main/run/')
@@ -0,0 +1,195 @@
+import io
+import time
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+CONFORMED = 'project-dev-s3-conformedzone'
+NEPTUNE = 'project-dev-s3-neptunezone'
+PARTITION = 'test/year=2023/doctype=itd/'
+NOW = time.mktime((2023, 10, 17, 12, 0, 0, 0, 0, 0)) - time.timezone
+
+
+class ReadTrackingS3(LocalS3Client):
+
+    def __init__(self):
+        super().__init__()
+        self.read_keys = []
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key.endswith('.parquet'):
+            self.read_keys.append(Key)
+        return super().get_object(Bucket=Bucket, Key=Key, **kwargs)
+
+
+class RecordingSparql:
+
+    def insert(self, triples):
+        return {'triples': len(triples), 'requests': 1, 'retries': 0}
+
+
+class FakeLoader:
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.started = []
+
+    def start(self, source):
+        self.started.append(source)
+        return f"load-{len(self.started)}"
+
+    def wait(self, load_id, budget_seconds=0):
+        return self.status(load_id)
+
+    def status(self, load_id):
+        return {'load_id': load_id, 'status': self.statuses.pop(0)}
+
+
+def put_part(s3, epoch, name, partition=PARTITION):
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(epoch))
+    key = f"{partition}part-{stamp}-{name}.parquet"
+    sink = io.BytesIO()
+    pq.write_table(pa.table({'document_name': [name], 'content_sha256': [name * 8]}), sink)
+    s3.put_object(Bucket=CONFORMED, Key=key, Body=sink.getvalue())
+    s3.put_object(Bucket=CONFORMED, Key=f"test/_symlink/{partition[len('test/'):]}manifest", Body=b'')
+    return key
+
+
+def run(engine, s3, now, loader=None, **options):
+    return engine.digest_incremental(s3, CONFORMED, '/test/', NEPTUNE, 'digest_state', RecordingSparql(),
+                                     loader, 'main', now=now, settle_seconds=600, **options)
+
+
+def test_only_the_delta_is_read():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    s3 = ReadTrackingS3()
+    first = [put_part(s3, NOW - 3600, 'a'), put_part(s3, NOW - 60, 'b'),
+             put_part(s3, NOW - 30, 'c', partition='test/year=2022/doctype=ebcd/')]
+
+    report = run(engine, s3, NOW)
+    assert report['path'] == 'sparql' and report['files'] == 3
+    assert sorted(s3.read_keys) == sorted(first)
+
+    s3.read_keys.clear()
+    assert run(engine, s3, NOW + 60)['files'] == 0
+    assert s3.read_keys == []
+
+    # Stamped before the previous run but written after it: still inside the settle interval
+    late = put_part(s3, NOW - 10, 'd')
+    run(engine, s3, NOW + 120)
+    assert s3.read_keys == [late]
+
+
+def test_watermark_trails_by_the_settle_interval():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    digest_state = load_function_module('neptune_stack', 'digest_state')
+    s3 = ReadTrackingS3()
+    old = put_part(s3, NOW - 3600, 'a')
+    recent = put_part(s3, NOW - 60, 'b')
+
+    run(engine, s3, NOW)
+
+    state, _ = digest_state.load_state(s3, NEPTUNE, 'digest_state/state.json')
+    entry = state['partitions'][PARTITION]
+    assert entry['watermark'] == digest_state.watermark_at(PARTITION, NOW - 600)
+    assert old < entry['watermark'] < recent
+    assert entry['loaded'] == {recent: s3.head_object(Bucket=CONFORMED, Key=recent)['ETag']}
+
+
+def test_max_files_leaves_the_rest_for_the_next_run():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    s3 = ReadTrackingS3()
+    keys = [put_part(s3, NOW - 3600 + i, f"doc{i}") for i in range(5)]
+
+    assert run(engine, s3, NOW, max_files=3)['remaining'] is True
+    report = run(engine, s3, NOW, max_files=3)
+
+    assert report['files'] == 2 and report['remaining'] is False
+    assert sorted(s3.read_keys) == keys
+
+
+def test_running_bulk_load_is_resumed_by_the_next_run():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    s3 = ReadTrackingS3()
+    put_part(s3, NOW - 3600, 'a')
+    loader = FakeLoader(['LOAD_IN_PROGRESS', 'LOAD_IN_PROGRESS', 'LOAD_COMPLETED'])
+
+    assert run(engine, s3, NOW, loader=loader, bulk_threshold=1)['load']['status'] == 'LOAD_IN_PROGRESS'
+    assert run(engine, s3, NOW, loader=loader, bulk_threshold=1)['waiting']['status'] == 'LOAD_IN_PROGRESS'
+    report = run(engine, s3, NOW, loader=loader, bulk_threshold=1)
+
+    assert report['files'] == 0
+    assert len(loader.started) == 1 and len(s3.read_keys) == 1
+
+
+def test_queued_micro_batch_runs_one_incremental_digest(monkeypatch):
+    from tests.fakes.local_sparql import LocalSparqlServer
+
+    function = load_function_module('neptune_stack', 'digest_function')
+    neptune_client = load_function_module('neptune_stack', 'neptune_client')
+    s3 = ReadTrackingS3()
+    keys = [put_part(s3, time.time() - 60, name) for name in ('a', 'b', 'c')]
+    for name, value in {'NEPTUNE_ENDPOINT': '127.0.0.1', 'NEPTUNE_LOADER_ROLE_ARN': 'arn:role', 'AWS_REGION': 'eu-west-1',
+                        'NEPTUNE_BUCKET_NAME': NEPTUNE, 'CONFORMED_BUCKET_NAME': CONFORMED}.items():
+        monkeypatch.setenv(name, value)
+    function.handler_runtime.register_client('s3', s3)
+
+    with LocalSparqlServer() as server:
+        monkeypatch.setattr(function, '_neptune_client', neptune_client.NeptuneClient(f"127.0.0.1:{server.port}", use_tls=False))
+        event = {'Records': [{'eventSource': 'aws:sqs', 'messageId': str(i), 'body': '{"detail-type": "Object Created"}'}
+                             for i in range(3)]}
+
+        report = function.handler(event, None)
+
+        assert report['events'] == 3 and report['files'] == 3
+        assert sorted(s3.read_keys) == sorted(keys)
+        assert server.requests == 1
+        assert s3.keys(NEPTUNE) == ['digest_state/generation.json', 'digest_state/state.json']
+
+
+def test_non_parquet_notifications_are_ignored():
+    function = load_function_module('neptune_stack', 'digest_function')
+
+    event = {'Records': [{'s3': {'bucket': {'name': NEPTUNE}, 'object': {'key': 'staging/run/part-00000.nt'}}}]}
+
+    assert function.handler(event, None) == {'path': None, 'files': 0}
+
+
+def test_compacted_files_are_not_loaded_again():
+    engine = load_function_module('neptune_stack', 'digest_engine')
+    compaction = load_function_module('comformed_zone_stack', 'compaction_engine')
+    manifest = compaction.partition_manifest
+    manifest_key = manifest.manifest_key('/test/', 'year=2023/doctype=itd')
+    s3 = ReadTrackingS3()
+
+    listed = []
+
+    # put_part starts a new, empty manifest
+    def put_listed_part(epoch, name):
+        listed.append(manifest.data_uri(CONFORMED, put_part(s3, epoch, name)))
+        manifest.update_manifest(s3, CONFORMED, manifest_key, add=listed)
+        return manifest.uri_key(listed[-1])
+
+    put_listed_part(NOW - 3600, 'a')
+    put_listed_part(NOW - 60, 'b')
+    run(engine, s3, NOW)
+    # c is compacted with the loaded files before the digest sees it
+    c = put_listed_part(NOW + 30, 'c')
+    compaction.compact_partition(s3, CONFORMED, '/test/', manifest_key, target_bytes=10 ** 9, small_bytes=10 ** 6,
+                                 orphan_grace_seconds=3600)
+    [compacted] = [manifest.uri_key(entry) for entry in manifest.read_manifest(s3, CONFORMED, manifest_key)[0]]
+    s3.read_keys.clear()
+
+    report = run(engine, s3, NOW + 60)
+
+    assert (report['files'], report['covered']) == (1, 1)
+    assert s3.read_keys == [c]
+    assert s3.keys(CONFORMED, 'test/_compacted/') == [manifest.lineage_key('/test/', compacted)]
+
+    s3.read_keys.clear()
+    assert run(engine, s3, NOW + 120)['files'] == 0 and s3.read_keys == []
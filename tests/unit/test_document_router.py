@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from datetime import datetime, timezone
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_events import LocalEventBridgeClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_textract import LocalTextract
+from tests.lambda_loader import load_function_module
+
+BUCKET = 'project-dev-s3-receptionzone'
+ROUTING_TABLE = {
+    'form4e': {'key_pattern': '(^|/)form-?4e(/|$)'},
+    'itd': {'content_markers': ['transhipment']}
+}
+
+
+def event(key, sequencer):
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key, 'sequencer': sequencer}}}]}
+
+
+def test_documents_are_classified_by_key_then_by_content():
+    router_module = load_function_module('reception_modeling_zone_stack', 'document_router')
+    router = router_module.DocumentRouter(ROUTING_TABLE, signature_bytes=64)
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/scans/x.pdf', Body=b'%PDF-1.7 TRANSHIPMENT DECLARATION')
+    s3.put_object(Bucket=BUCKET, Key='input_data/scans/late.pdf', Body=b'%PDF-1.7 ' + b' ' * 64 + b'TRANSHIPMENT')
+    uploaded = {'LastModified': datetime(2024, 3, 1, tzinfo=timezone.utc)}
+
+    by_key = router.classify(s3, BUCKET, 'input_data/Form-4E/2022/a.png', 'Form-4E/2022/a.png', uploaded)
+    by_content = router.classify(s3, BUCKET, 'input_data/scans/x.pdf', 'scans/x.pdf', uploaded)
+
+    assert by_key == router_module.Route('form4e', '2022', 'key')
+    assert router.raw_key('raw_data', 'Form-4E/2022/a.png', by_key) == 'raw_data/2022/form4e/Form-4E/2022/a.png'
+    assert router.raw_key('raw_data', '2022/form4e/a.png', by_key) == 'raw_data/2022/form4e/a.png'
+    assert by_content == router_module.Route('itd', '2024', 'content')
+    assert router.raw_key('raw_data', 'scans/x.pdf', by_content) == 'raw_data/2024/itd/scans/x.pdf'
+    # Markers past the signature are not read
+    assert router.classify(s3, BUCKET, 'input_data/scans/late.pdf', 'scans/late.pdf', uploaded) is None
+
+
+def test_checkin_routes_documents_and_leaves_the_unknown_ones_in_the_input(monkeypatch):
+    checkin = load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+    s3 = LocalS3Client()
+    events = LocalEventBridgeClient()
+    checkin.handler_runtime.register_client('s3', s3)
+    checkin.handler_runtime.register_client('dynamodb', LocalDynamoDBClient())
+    checkin.handler_runtime.register_client('events', events)
+    monkeypatch.setenv('DEDUP_TABLE_NAME', 'dedup')
+    monkeypatch.setenv('ROUTING_TABLE', json.dumps(ROUTING_TABLE))
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/scans/t.pdf', Body=b'TRANSHIPMENT')
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/scans/e.pdf', Body=b'CATCH DOCUMENT')
+
+    routed = checkin.handler(event('input_data/2023/scans/t.pdf', '01'), None)
+    unknown = checkin.handler(event('input_data/2023/scans/e.pdf', '02'), None)
+
+    assert routed['results'][0]['destination_key'] == 'raw_data/2023/itd/scans/t.pdf'
+    [announced] = events.events
+    assert (announced['source'], announced['detail-type']) == ('project.reception', 'Document Routed')
+    assert announced['detail']['key'] == 'raw_data/2023/itd/scans/t.pdf'
+    assert announced['detail']['trace_id'] == routed['results'][0]['trace_id']
+    assert unknown['summary'] == {'copied': 0, 'duplicate': 0, 'skipped': 0, 'failed': 0, 'unclassified': 1}
+    assert s3.keys(BUCKET, 'raw_data/') == ['raw_data/2023/itd/scans/t.pdf']
+
+    # The claims of unclassified and unannounced documents are released, they go through on the next try
+    monkeypatch.setenv('ROUTING_TABLE', json.dumps(dict(ROUTING_TABLE, ebcd={'content_markers': ['CATCH DOCUMENT']})))
+    events.fail_entries = True
+    with pytest.raises(checkin.checkin_engine.CheckinFailed):
+        checkin.handler(event('input_data/2023/scans/e.pdf', '02'), None)
+    events.fail_entries = False
+    retried = checkin.handler(event('input_data/2023/scans/e.pdf', '02'), None)
+    assert retried['results'][0]['document_type'] == 'ebcd'
+    assert [routed_event['detail']['document_type'] for routed_event in events.events] == ['itd', 'ebcd']
+
+
+def test_ocr_takes_the_document_type_of_the_routed_event():
+    ocr_engine = load_function_module('reception_modeling_zone_stack', 'ocr_engine')
+    content_hash = load_function_module('reception_modeling_zone_stack', 'content_hash')
+    pending_jobs = load_function_module('reception_modeling_zone_stack', 'pending_jobs')
+    s3 = LocalS3Client()
+    engine = ocr_engine.OcrEngine(s3, LocalTextract(s3), None, 'raw_data', 'processed_data', 'ocr_cache',
+                                  content_hash.content_sha256, pending_jobs.PendingJobs(LocalDynamoDBClient(), 'ocr-jobs'))
+    events = LocalEventBridgeClient()
+    router_module = load_function_module('reception_modeling_zone_stack', 'document_router')
+    router = router_module.DocumentRouter(ROUTING_TABLE)
+    for key, body in (('raw_data/2023/itd/a.png', b'ITD'), ('raw_data/2023/itd/b.pdf', b'PAGE 1\fPAGE 2')):
+        s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+        router.publish(events, router.event(BUCKET, key, router_module.Route('itd', '2023', 'key')))
+    sqs_event = {'Records': [{'eventSource': 'aws:sqs', 'messageId': f"m-{index}", 'body': json.dumps(routed_event)}
+                             for index, routed_event in enumerate(events.events)]}
+
+    response = ocr_engine.handle(sqs_event, engine)
+    ocr_engine.handle(engine.textract.finish_jobs(), engine)
+
+    assert [result['status'] for result in response['results']] == ['analyzed', 'started']
+    assert response['batchItemFailures'] == []
+    for key in ('processed_data/2023/itd/a.png.json', 'processed_data/2023/itd/b.pdf.json'):
+        assert json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())['document_type'] == 'itd'
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_textract import LocalTextract
+from tests.lambda_loader import load_function_module
+from tools import trace_report
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+BUCKET = 'project-dev-s3-receptionzone'
+CONFORMED = 'project-dev-s3-conformedzone'
+
+
+class RecordingSparql:
+
+    def insert(self, triples):
+        return {'triples': len(triples), 'requests': 1, 'retries': 0}
+
+
+def s3_event(bucket, *keys):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}} for key in keys]}
+
+
+def ocr_engine_for(s3):
+    ocr_engine = load_function_module('reception_modeling_zone_stack', 'ocr_engine')
+    content_hash = load_function_module('reception_modeling_zone_stack', 'content_hash')
+    pending_jobs = load_function_module('reception_modeling_zone_stack', 'pending_jobs')
+    return ocr_engine, ocr_engine.OcrEngine(s3, LocalTextract(s3), 'itd', 'raw_data', 'processed_data', 'ocr_cache',
+                                            content_hash.content_sha256,
+                                            pending_jobs.PendingJobs(LocalDynamoDBClient(), 'ocr-jobs'))
+
+
+def test_trace_follows_the_document_into_the_graph(monkeypatch, capsys):
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a.png', Body=b'VESSEL ALPHA', Metadata={'uploader': 'u1'},
+                  ContentType='image/png')
+
+    checkin = load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+    checkin.handler_runtime.register_client('s3', s3)
+    trace_id = checkin.handler(s3_event(BUCKET, 'input_data/2023/itd/a.png'), None)['results'][0]['trace_id']
+    raw = s3.head_object(Bucket=BUCKET, Key='raw_data/2023/itd/a.png')
+    assert raw['Metadata']['trace-id'] == trace_id
+    assert raw['Metadata']['uploader'] == 'u1' and raw['ContentType'] == 'image/png'
+
+    ocr_engine, engine = ocr_engine_for(s3)
+    ocr_engine.handle(s3_event(BUCKET, 'raw_data/2023/itd/a.png'), engine)
+    assert s3.head_object(Bucket=BUCKET, Key='processed_data/2023/itd/a.png.json')['Metadata']['trace-id'] == trace_id
+
+    modeling = load_function_module('reception_modeling_zone_stack', 'lambda_modeling_function')
+    monkeypatch.setenv('CONFORMED_BUCKET_NAME', CONFORMED)
+    monkeypatch.setenv('PARQUET_DATA_PATH', '/test/')
+    written = modeling.handler(s3_event(BUCKET, 'processed_data/2023/itd/a.png.json'), None)['files']
+    table = pq.read_table(io.BytesIO(s3.get_object(Bucket=CONFORMED, Key=written[0]['key'])['Body'].read()))
+    assert table.column('trace_id').to_pylist() == [trace_id]
+
+    digest_engine = load_function_module('neptune_stack', 'digest_engine')
+    entered = digest_engine.handler_runtime.now_ms()
+    report = digest_engine.digest(s3, [(CONFORMED, written[0]['key'])], RecordingSparql(), None, 'neptune', 'main')
+    [trace] = report['traces']
+    assert trace['trace_id'] == trace_id and trace['trace_start'] == int(raw['Metadata']['trace-start'])
+    print(digest_engine.handler_runtime.trace_span(trace, 'digest', trace['key'], entered))
+
+    spans = trace_report.parse_spans(capsys.readouterr().out.splitlines())
+    timeline = trace_report.timelines(spans)[trace_id]
+    assert [span['Stage'] for span in timeline] == ['checkin', 'ocr', 'modeling', 'digest']
+    assert all(span['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'Project/DocumentTrace' for span in timeline)
+    assert list(trace_report.stage_summary(spans)) == ['checkin', 'ocr', 'modeling', 'digest', 'end-to-end']
+
+
+def test_async_ocr_keeps_the_trace_of_every_waiting_output(capsys):
+    s3 = LocalS3Client()
+    for name, trace_id in (('a', 't-a'), ('b', 't-b')):
+        s3.put_object(Bucket=BUCKET, Key=f"raw_data/2023/itd/{name}.pdf", Body=b'PAGE 1\fPAGE 2',
+                      Metadata={'trace-id': trace_id, 'trace-start': '1000'})
+    ocr_engine, engine = ocr_engine_for(s3)
+
+    ocr_engine.handle(s3_event(BUCKET, 'raw_data/2023/itd/a.pdf', 'raw_data/2023/itd/b.pdf'), engine)
+    ocr_engine.handle(engine.textract.finish_jobs(), engine)
+
+    for name, trace_id in (('a', 't-a'), ('b', 't-b')):
+        metadata = s3.head_object(Bucket=BUCKET, Key=f"processed_data/2023/itd/{name}.pdf.json")['Metadata']
+        assert metadata == {'trace-id': trace_id, 'trace-start': '1000'}
+    spans = trace_report.parse_spans(capsys.readouterr().out.splitlines())
+    assert sorted(span['TraceId'] for span in spans) == ['t-a', 't-b']
+
+
+def test_compaction_merges_files_written_before_tracing():
+    engine = load_function_module('comformed_zone_stack', 'compaction_engine')
+    s3 = LocalS3Client()
+    for key, table in (
+        ('old.parquet', pa.table({'document_name': ['a']})),
+        ('new.parquet', pa.table({'document_name': ['b'], 'trace_id': ['t-b']}))
+    ):
+        sink = io.BytesIO()
+        pq.write_table(table, sink)
+        s3.put_object(Bucket=CONFORMED, Key=key, Body=sink.getvalue())
+
+    body, rows = engine.merge_files(s3, CONFORMED, ['old.parquet', 'new.parquet'])
+
+    assert rows == 2
+    assert pq.read_table(io.BytesIO(body)).to_pydict() == {'document_name': ['a', 'b'], 'trace_id': [None, 't-b']}
@@ -1,15 +0,0 @@
-import aws_cdk as core
-import aws_cdk.assertions as assertions
-
-from efca_bft_repo.efca_bft_repo_stack import EfcaBftRepoStack
-
-# example tests. To run these tests, uncomment this file along with the example
-# resource in efca_bft_repo/efca_bft_repo_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = EfcaBftRepoStack(app, "efca-bft-repo")
-    template = assertions.Template.from_stack(stack)
-
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
@@ -0,0 +1,27 @@
+import pytest
+
+from repository.util.function_bundle import bundle_excludes, handler_closure
+from tests.lambda_loader import functions_path
+
+
+def test_closure_follows_local_imports_only():
+    closure = handler_closure(functions_path('reception_modeling_zone_stack'), 'lambda_ocr_function')
+
+    assert closure == {'lambda_ocr_function.py', 'ocr_engine.py', 'content_hash.py', 'pending_jobs.py'}
+
+
+def test_packages_and_nested_imports_are_bundled(tmp_path):
+    (tmp_path / 'handler.py').write_text('import json\n\ndef handler(event, context):\n    from helpers import util\n')
+    (tmp_path / 'helpers').mkdir()
+    (tmp_path / 'helpers' / '__init__.py').write_text('')
+    (tmp_path / 'helpers' / 'util.py').write_text('import shared\n')
+    (tmp_path / 'shared.py').write_text('')
+    (tmp_path / 'lambdaSample.py').write_text('')
+
+    assert handler_closure(str(tmp_path), 'handler') == {'handler.py', 'helpers', 'shared.py'}
+    assert 'lambdaSample.py' in bundle_excludes(str(tmp_path), 'handler')
+
+
+def test_unknown_handler_fails_the_synth(tmp_path):
+    with pytest.raises(ValueError):
+        handler_closure(str(tmp_path), 'handler')
@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from tests.lambda_loader import load_function_module
+
+S3_EVENT = {'Records': [{'s3': {'bucket': {'name': 'zone'}, 'object': {'key': 'raw_data/scan+1.pdf', 'size': 3, 'eTag': 'e1'}}}]}
+EVENTBRIDGE_EVENT = {'source': 'aws.s3', 'detail-type': 'Object Created',
+                     'detail': {'bucket': {'name': 'conformed'}, 'object': {'key': 'test/year=2023/a b.parquet', 'size': 9}}}
+SNS_EVENT = {'Records': [{'EventSource': 'aws:sns', 'Sns': {'Message': json.dumps({'JobId': 'j-1', 'Status': 'SUCCEEDED'})}}]}
+
+
+def sqs_event(*bodies):
+    return {'Records': [{'eventSource': 'aws:sqs', 'messageId': f"m-{i}", 'body': json.dumps(body)}
+                        for i, body in enumerate(bodies)]}
+
+
+def test_records_are_normalized_across_event_shapes():
+    runtime = load_function_module('neptune_stack', 'handler_runtime')
+
+    direct, = runtime.iter_records(S3_EVENT)
+    assert (direct.message_id, direct.source, direct.bucket, direct.key, direct.etag) == (None, 's3', 'zone', 'raw_data/scan 1.pdf', 'e1')
+
+    queued = list(runtime.iter_records(sqs_event(S3_EVENT, {'Event': 's3:TestEvent'}, EVENTBRIDGE_EVENT)))
+    assert [(r.message_id, r.source, r.key) for r in queued] == [
+        ('m-0', 's3', 'raw_data/scan 1.pdf'),
+        ('m-2', 'eventbridge', 'test/year=2023/a b.parquet')
+    ]
+
+    notification, = runtime.iter_records(SNS_EVENT)
+    assert (notification.source, notification.body['JobId']) == ('sns', 'j-1')
+    assert list(runtime.iter_records({'source': 'aws.events', 'detail-type': 'Scheduled Event'})) == []
+
+
+def test_batch_response_only_for_sqs_events():
+    runtime = load_function_module('neptune_stack', 'handler_runtime')
+
+    assert runtime.batch_response(S3_EVENT, [None]) == {}
+    assert runtime.batch_response(sqs_event(S3_EVENT), ['m-0', 'm-0', None]) == {'batchItemFailures': [{'itemIdentifier': 'm-0'}]}
+
+
+def test_invocations_emit_embedded_metrics(monkeypatch, capsys):
+    runtime = load_function_module('neptune_stack', 'handler_runtime')
+    monkeypatch.setattr(runtime, '_cold_start', True)
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'fn')
+
+    @runtime.instrumented('Test/Zone')
+    def handler(event, context):
+        if event.get('fail'):
+            raise RuntimeError('boom')
+        return 'ok'
+
+    context = SimpleNamespace(aws_request_id='r-1')
+    assert handler({}, context) == 'ok'
+    with pytest.raises(RuntimeError):
+        handler({'fail': True}, context)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    metrics = [line for line in lines if '_aws' in line]
+    assert [(m['ColdStart'], m['Errors'], m['RequestId']) for m in metrics] == [(1, 0, 'r-1'), (0, 1, 'r-1')]
+    assert metrics[0]['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'Test/Zone'
+    assert {'level': 'error', 'function': 'fn', 'request_id': 'r-1', 'error': 'RuntimeError: boom'} in lines
+
+
+def test_clients_and_modules_load_once():
+    runtime = load_function_module('neptune_stack', 'handler_runtime')
+    stand_in = object()
+    runtime.register_client('textract', stand_in)
+    assert runtime.client('textract') is stand_in
+
+    lazy = runtime.lazy_module('json')
+    assert lazy._module is None
+    assert lazy.dumps([1]) == '[1]' and lazy._module is json
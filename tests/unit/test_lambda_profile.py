@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip('aws_cdk')
+
+from repository.util.profiled_function import resolve_profile
+
+PROPERTIES = {
+    'lambda_profiles': {
+        'default': {'memory_mb': 256, 'log_retention_days': 30},
+        'ocr': {'memory_mb': 512, 'architecture': 'arm64'}
+    }
+}
+
+
+def test_profiles_inherit_from_default():
+    ocr = resolve_profile(PROPERTIES, 'ocr')
+
+    assert (ocr['memory_mb'], ocr['architecture'], ocr['log_retention_days']) == (512, 'arm64', 30)
+    assert resolve_profile(PROPERTIES, 'default')['memory_mb'] == 256
+    assert resolve_profile({}, 'default')['timeout_seconds'] == 600
+
+
+def test_invalid_profiles_fail_the_synth():
+    with pytest.raises(ValueError):
+        resolve_profile(PROPERTIES, 'modeling')
+    with pytest.raises(ValueError):
+        resolve_profile({'lambda_profiles': {'ocr': {'architecture': 'arm'}}}, 'ocr')
+    with pytest.raises(ValueError):
+        resolve_profile({'lambda_profiles': {'ocr': {'memory_mb': 64}}}, 'ocr')
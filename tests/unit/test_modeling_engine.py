@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+
+def ocr_document(lines, pages=1):
+    return {
+        'document_type': 'itd',
+        'source': {'bucket': 'reception', 'key': 'raw_data/2023/itd/a.pdf'},
+        'content_sha256': 'ab' * 32,
+        'pages': pages,
+        'blocks': [{'BlockType': 'PAGE', 'Page': 1}] + [
+            {'BlockType': 'LINE', 'Text': text, 'Confidence': 90.0 + i, 'Page': 1} for i, text in enumerate(lines)
+        ]
+    }
+
+
+def test_parse_processed_key():
+    engine = load_function_module('reception_modeling_zone_stack', 'modeling_engine')
+
+    assert engine.parse_processed_key('processed_data/2023/itd/a.pdf.json', 'processed_data') == (2023, 'itd', 'a.pdf')
+    assert engine.parse_processed_key('processed_data/2023/itd/rejected_data/.keep', 'processed_data') is None
+    assert engine.parse_processed_key('processed_data/itd/a.json', 'processed_data') is None
+
+
+def test_document_columns():
+    engine = load_function_module('reception_modeling_zone_stack', 'modeling_engine')
+
+    columns = engine.document_columns([
+        ('processed_data/2023/itd/a.pdf.json', ocr_document(['VESSEL', 'CATCH'], pages=2)),
+        ('processed_data/2022/ebcd/b.png.json', ocr_document([])),
+    ], 'processed_data')
+
+    assert columns['year'] == [2023, 2022]
+    assert columns['doctype'] == ['itd', 'ebcd']
+    assert columns['document_name'] == ['a.pdf', 'b.png']
+    assert columns['document_flag'] == ['ok', 'empty']
+    assert columns['page_count'] == [2, 1]
+    assert columns['line_count'] == [2, 0]
+    assert columns['mean_confidence'] == [90.5, None]
+    assert columns['text'] == ['VESSEL\nCATCH', '']
+
+
+def test_handler_writes_one_file_per_partition(monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    modeling = load_function_module('reception_modeling_zone_stack', 'lambda_modeling_function')
+    s3 = LocalS3Client()
+    modeling.handler_runtime.register_client('s3', s3)
+    monkeypatch.setenv('CONFORMED_BUCKET_NAME', 'conformed')
+    monkeypatch.setenv('PARQUET_DATA_PATH', '/test/')
+
+    keys = ['processed_data/2023/itd/a.pdf.json', 'processed_data/2023/itd/b.pdf.json',
+            'processed_data/2023/form4e/c.pdf.json']
+    for key in keys:
+        s3.put_object(Bucket='reception', Key=key, Body=modeling.json.dumps(ocr_document(['LINE'])))
+
+    response = modeling.handler({'Records': [
+        {'s3': {'bucket': {'name': 'reception'}, 'object': {'key': key}}} for key in keys
+    ]}, None)
+
+    written = s3.keys('conformed', 'test/year=')
+    assert response['documents'] == 3
+    assert [key.rsplit('/', 1)[0] for key in written] == ['test/year=2023/doctype=form4e', 'test/year=2023/doctype=itd']
+    table = pq.read_table(io.BytesIO(s3.get_object(Bucket='conformed', Key=written[1])['Body'].read()))
+    assert table.column('document_name').to_pylist() == ['a.pdf', 'b.pdf']
+    assert 'year' not in table.column_names
+
+    manifest = s3.get_object(Bucket='conformed', Key='test/_symlink/year=2023/doctype=itd/manifest')['Body'].read()
+    assert manifest.decode('utf-8') == f"s3://conformed/{written[1]}\n"
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+
+BUCKET = 'project-dev-s3-receptionzone'
+MIB = 1024 * 1024
+SCAN = bytes(range(256)) * (12 * MIB // 256)
+
+
+def s3_event(*keys):
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}} for key in keys]}
+
+
+# Queued delivery, the failed records are reported instead of failing the invocation
+def sqs_event(*keys):
+    return {'Records': [{'eventSource': 'aws:sqs', 'messageId': f"m-{index}", 'body': json.dumps(s3_event(key))}
+                        for index, key in enumerate(keys)]}
+
+
+@pytest.fixture
+def checkin(monkeypatch):
+    monkeypatch.setenv('MOVE_MULTIPART_THRESHOLD_MB', '8')
+    monkeypatch.setenv('MOVE_PART_WORKERS', '4')
+    monkeypatch.setenv('MOVE_DELETE_SOURCE', 'true')
+    return load_function_module('reception_modeling_zone_stack', 'lambda_checkin_function')
+
+
+def test_parts_cover_the_object_within_the_s3_limits():
+    engine = load_function_module('reception_modeling_zone_stack', 'move_engine')
+
+    def sizes(parts):
+        assert [part[0] for part in parts] == list(range(1, len(parts) + 1))
+        assert all(first == previous[2] + 1 for previous, (_, first, _) in zip(parts, parts[1:]))
+        return [last - first + 1 for _, first, last in parts]
+
+    assert sizes(engine.plan_parts(1024 * MIB, 64 * MIB, 8)) == [64 * MIB] * 16
+    # Small objects are split so every worker gets a part
+    assert sizes(engine.plan_parts(200 * MIB, 64 * MIB, 8)) == [25 * MIB] * 8
+    assert sizes(engine.plan_parts(12 * MIB, 64 * MIB, 8)) == [5 * MIB, 5 * MIB, 2 * MIB]
+    assert len(engine.plan_parts(1024 * 1024 * MIB, 64 * MIB, 8)) <= engine.MAX_PARTS
+
+
+def test_large_documents_are_moved_with_parallel_part_copies(checkin):
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/batch.pdf', Body=SCAN, ContentType='application/pdf')
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/small.pdf', Body=b'small scan')
+    checkin.handler_runtime.register_client('s3', s3)
+
+    large, small = checkin.handler(s3_event('input_data/2023/itd/batch.pdf', 'input_data/2023/itd/small.pdf'),
+                                   None)['results']
+
+    assert (large['method'], large['verified'], large['source_deleted']) == ('multipart', 'checksum', True)
+    assert (small['method'], small['source_deleted']) == ('copy', True)
+    assert s3.calls['UploadPartCopy'] == 3 and s3.uploads == {}
+    moved = s3.get_object(Bucket=BUCKET, Key='raw_data/2023/itd/batch.pdf')
+    assert moved['Body'].read() == SCAN and moved['ETag'].endswith('-3"')
+    assert moved['ContentType'] == 'application/pdf' and moved['Metadata']['trace-id'] == large['trace_id']
+    assert s3.keys(BUCKET, 'input_data/') == []
+
+
+def test_a_failed_or_corrupt_copy_keeps_the_source(checkin, monkeypatch):
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a.pdf', Body=SCAN)
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/b.pdf', Body=SCAN)
+    checkin.handler_runtime.register_client('s3', s3)
+    upload_part_copy = s3.upload_part_copy
+
+    def failing_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise RuntimeError('part copy failed')
+        return upload_part_copy(**kwargs)
+
+    def short_part(**kwargs):
+        first_byte_dropped = kwargs['CopySourceRange'].replace('bytes=0-', 'bytes=1-')
+        return upload_part_copy(**dict(kwargs, CopySourceRange=first_byte_dropped))
+
+    monkeypatch.setattr(s3, 'upload_part_copy', failing_part)
+    failed = checkin.handler(sqs_event('input_data/2023/itd/a.pdf'), None)['results'][0]
+    monkeypatch.setattr(s3, 'upload_part_copy', short_part)
+    corrupt = checkin.handler(sqs_event('input_data/2023/itd/b.pdf'), None)['results'][0]
+
+    assert failed['status'] == 'failed' and s3.calls['AbortMultipartUpload'] == 1 and s3.uploads == {}
+    assert corrupt['status'] == 'failed' and 'MoveError' in corrupt['error']
+    assert s3.keys(BUCKET, 'input_data/') == ['input_data/2023/itd/a.pdf', 'input_data/2023/itd/b.pdf']
+    assert s3.keys(BUCKET, 'raw_data/') == []
+
+
+def test_a_source_overwritten_during_the_move_is_kept(checkin, monkeypatch):
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a.pdf', Body=b'first version')
+    checkin.handler_runtime.register_client('s3', s3)
+    copy_object = s3.copy_object
+
+    def copy_then_overwrite(**kwargs):
+        response = copy_object(**kwargs)
+        s3.put_object(Bucket=BUCKET, Key='input_data/2023/itd/a.pdf', Body=b'second version')
+        return response
+
+    monkeypatch.setattr(s3, 'copy_object', copy_then_overwrite)
+    result = checkin.handler(s3_event('input_data/2023/itd/a.pdf'), None)['results'][0]
+
+    assert (result['status'], result['source_deleted']) == ('copied', False)
+    assert s3.get_object(Bucket=BUCKET, Key='input_data/2023/itd/a.pdf')['Body'].read() == b'second version'
+
+
+def test_reuploaded_content_is_removed_from_the_input(checkin, monkeypatch):
+    s3 = LocalS3Client()
+    checkin.handler_runtime.register_client('s3', s3)
+    checkin.handler_runtime.register_client('dynamodb', LocalDynamoDBClient())
+    monkeypatch.setenv('DEDUP_TABLE_NAME', 'dedup')
+    for key in ('a.pdf', 'a-again.pdf', 'a-later.pdf'):
+        s3.put_object(Bucket=BUCKET, Key=f"input_data/2023/itd/{key}", Body=b'same scan')
+    hasher = checkin.content_hash.content_sha256
+
+    def overwritten_while_hashed(s3_client, bucket, key):
+        digest = hasher(s3_client, bucket, key)
+        if key.endswith('a-later.pdf'):
+            s3.put_object(Bucket=BUCKET, Key=key, Body=b'new scan')
+        return digest
+
+    monkeypatch.setattr(checkin.content_hash, 'content_sha256', overwritten_while_hashed)
+    results = [checkin.handler(s3_event(f"input_data/2023/itd/{key}"), None)['results'][0]
+               for key in ('a.pdf', 'a-again.pdf', 'a-later.pdf')]
+
+    assert [(result['status'], result['source_deleted']) for result in results] == \
+        [('copied', True), ('duplicate', True), ('duplicate', False)]
+    assert s3.keys(BUCKET, 'raw_data/') == ['raw_data/2023/itd/a.pdf']
+    # A duplicate overwritten since it was hashed is a new upload, it stays for its own event
+    assert s3.keys(BUCKET, 'input_data/') == ['input_data/2023/itd/a-later.pdf']
@@ -0,0 +1,117 @@
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_textract import LocalTextract
+from tests.lambda_loader import load_function_module
+
+BUCKET = 'project-dev-s3-receptionzone'
+
+
+def s3_event(*keys):
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}} for key in keys]}
+
+
+def new_engine():
+    ocr_engine = load_function_module('reception_modeling_zone_stack', 'ocr_engine')
+    content_hash = load_function_module('reception_modeling_zone_stack', 'content_hash')
+    pending_jobs = load_function_module('reception_modeling_zone_stack', 'pending_jobs')
+    s3 = LocalS3Client()
+    textract = LocalTextract(s3)
+    engine = ocr_engine.OcrEngine(s3, textract, 'itd', 'raw_data', 'processed_data', 'ocr_cache',
+                                  content_hash.content_sha256, pending_jobs.PendingJobs(LocalDynamoDBClient(), 'ocr-jobs'))
+    return ocr_engine, engine, s3, textract
+
+
+def read_json(s3, key):
+    return json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())
+
+
+def test_images_are_analyzed_synchronously():
+    ocr_engine, engine, s3, textract = new_engine()
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/a.png', Body=b'VESSEL ALPHA\nCATCH 12')
+
+    response = ocr_engine.handle(s3_event('raw_data/2023/itd/a.png'), engine)
+
+    assert response['results'][0]['status'] == 'analyzed'
+    document = read_json(s3, 'processed_data/2023/itd/a.png.json')
+    assert document['pages'] == 1
+    assert [b['Text'] for b in document['blocks'] if b['BlockType'] == 'LINE'] == ['VESSEL ALPHA', 'CATCH 12']
+
+
+def test_multipage_documents_use_async_jobs_and_share_them():
+    ocr_engine, engine, s3, textract = new_engine()
+    body = b'page one\fpage two\fpage three'
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/a.pdf', Body=body)
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/copy of a.pdf', Body=body)
+
+    response = ocr_engine.handle(s3_event('raw_data/2023/itd/a.pdf', 'raw_data/2023/itd/copy+of+a.pdf'), engine)
+
+    assert [r['status'] for r in response['results']] == ['started', 'joined']
+    assert s3.keys(BUCKET, 'processed_data/') == []
+
+    completion = ocr_engine.handle(textract.finish_jobs(), engine)
+
+    assert completion['results'][0]['status'] == 'completed'
+    assert s3.keys(BUCKET, 'processed_data/') == ['processed_data/2023/itd/a.pdf.json',
+                                                 'processed_data/2023/itd/copy of a.pdf.json']
+    assert read_json(s3, 'processed_data/2023/itd/a.pdf.json')['pages'] == 3
+    assert engine.jobs.dynamodb.tables['ocr-jobs'] == {}
+    assert textract.calls['start_document_analysis'] == 1
+
+
+def test_concurrent_deliveries_all_join_the_running_job():
+    ocr_engine, engine, s3, textract = new_engine()
+    keys = [f"raw_data/2023/itd/copy {index:02d}.pdf" for index in range(24)]
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'page one\fpage two')
+    ocr_engine.handle(s3_event(keys[0].replace(' ', '+')), engine)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(lambda key: engine.process_object(BUCKET, key)['status'], keys[1:]))
+    ocr_engine.handle(textract.finish_jobs(), engine)
+
+    assert set(statuses) == {'joined'} and textract.calls['start_document_analysis'] == 1
+    assert s3.keys(BUCKET, 'processed_data/') == [f"processed_data/{key[len('raw_data/'):]}.json" for key in keys]
+
+
+def test_cached_content_never_reaches_textract_again():
+    ocr_engine, engine, s3, textract = new_engine()
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2022/itd/a.pdf', Body=b'page one')
+    ocr_engine.handle(s3_event('raw_data/2022/itd/a.pdf'), engine)
+    ocr_engine.handle(textract.finish_jobs(), engine)
+
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/reuploaded.pdf', Body=b'page one')
+    response = ocr_engine.handle(s3_event('raw_data/2023/itd/reuploaded.pdf'), engine)
+
+    assert response['results'][0]['status'] == 'cached'
+    assert read_json(s3, 'processed_data/2023/itd/reuploaded.pdf.json')['source']['key'] == 'raw_data/2022/itd/a.pdf'
+    assert textract.calls['start_document_analysis'] == 1
+
+
+def test_failed_job_releases_the_pending_record():
+    ocr_engine, engine, s3, textract = new_engine()
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/a.pdf', Body=b'page one')
+    ocr_engine.handle(s3_event('raw_data/2023/itd/a.pdf'), engine)
+    textract.fail_jobs = True
+
+    response = ocr_engine.handle(textract.finish_jobs(), engine)
+
+    assert response['results'][0]['status'] == 'failed'
+    assert s3.keys(BUCKET, 'ocr_cache/') == [] and engine.jobs.dynamodb.tables['ocr-jobs'] == {}
+    assert s3.keys(BUCKET, 'processed_data/') == []
+
+
+def test_a_partial_textract_backend_fails_at_construction():
+    ocr_engine = load_function_module('reception_modeling_zone_stack', 'ocr_engine')
+
+    class SyncOnly(ocr_engine.TextractBackend):
+        def analyze_document(self, bucket, key):
+            return []
+
+    with pytest.raises(TypeError):
+        SyncOnly()
@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+
+from tests.fakes.local_dynamodb import LocalDynamoDBClient
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_step_functions import LocalStepFunctionsClient
+from tests.fakes.local_textract import LocalTextract
+from tests.lambda_loader import load_function_module
+
+BUCKET = 'project-dev-s3-receptionzone'
+PAGES = [f"ITD PAGE {page}\nQUANTITY KG: {page * 100}" for page in range(1, 8)]
+
+
+def s3_event(*keys):
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}} for key in keys]}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    ocr_engine = load_function_module('reception_modeling_zone_stack', 'ocr_engine')
+    page_fanout = load_function_module('reception_modeling_zone_stack', 'page_fanout')
+    content_hash = load_function_module('reception_modeling_zone_stack', 'content_hash')
+    pending_jobs = load_function_module('reception_modeling_zone_stack', 'pending_jobs')
+    # The local Textract reads text documents, pages separated by form feeds
+    monkeypatch.setitem(page_fanout.SPLITTERS, '.pdf', lambda body: iter(body.split(b'\f')))
+
+    s3 = LocalS3Client()
+    engine = ocr_engine.OcrEngine(s3, LocalTextract(s3), 'itd', 'raw_data', 'processed_data', 'ocr_cache',
+                                  content_hash.content_sha256, pending_jobs.PendingJobs(LocalDynamoDBClient(), 'ocr-jobs'))
+    step_functions = LocalStepFunctionsClient(lambda event: page_fanout.handle(event, engine, pages_per_chunk=2),
+                                              max_concurrency=4)
+    engine.pages = ocr_engine.StepFunctionsPages(step_functions, 'arn:aws:states:::stateMachine:ocr-pages')
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/a.pdf', Body='\f'.join(PAGES).encode())
+    return ocr_engine, page_fanout, engine, s3, step_functions
+
+
+def test_chunks_cover_every_page():
+    page_fanout = load_function_module('reception_modeling_zone_stack', 'page_fanout')
+
+    assert page_fanout.plan_chunks(7, 2) == [[1, 2], [3, 4], [5, 6], [7]]
+    assert page_fanout.plan_chunks(1, 4) == [[1]]
+    assert page_fanout.plan_chunks(0, 4) == []
+
+
+def test_pages_are_analyzed_in_parallel_and_merged_in_page_order(pipeline, monkeypatch):
+    ocr_engine, _, engine, s3, step_functions = pipeline
+    analyze_document = engine.textract.analyze_document
+
+    # Later pages finish first, the merge still follows the page order
+    def slower_first_pages(bucket, key):
+        time.sleep(0.01 * (8 - int(key[-9:-4])))
+        return analyze_document(bucket, key)
+
+    monkeypatch.setattr(engine.textract, 'analyze_document', slower_first_pages)
+
+    response = ocr_engine.handle(s3_event('raw_data/2023/itd/a.pdf'), engine)
+    [completed] = step_functions.run_executions()
+
+    assert response['results'][0]['status'] == 'fanned_out'
+    assert completed['status'] == 'completed' and engine.textract.calls['start_document_analysis'] == 0
+    document = json.loads(s3.get_object(Bucket=BUCKET, Key='processed_data/2023/itd/a.pdf.json')['Body'].read())
+    assert document['pages'] == 7
+    assert [block['Text'] for block in document['blocks'] if block['BlockType'] == 'LINE'] == \
+        [line for page in PAGES for line in page.splitlines()]
+    assert [block['Page'] for block in document['blocks'] if block['BlockType'] == 'PAGE'] == list(range(1, 8))
+    assert s3.keys(BUCKET, 'ocr_cache/pages/') == [] and engine.jobs.dynamodb.tables['ocr-jobs'] == {}
+
+
+def test_failed_chunks_are_retried_then_fail_the_job(pipeline, monkeypatch):
+    ocr_engine, _, engine, s3, step_functions = pipeline
+    analyze_document = engine.textract.analyze_document
+    failures = {'page-00003.pdf': 1}
+
+    def flaky(bucket, key):
+        page = key.rsplit('/', 1)[-1]
+        if failures.get(page):
+            failures[page] -= 1
+            raise RuntimeError(f"ThrottlingException on {page}")
+        return analyze_document(bucket, key)
+
+    monkeypatch.setattr(engine.textract, 'analyze_document', flaky)
+    ocr_engine.handle(s3_event('raw_data/2023/itd/a.pdf'), engine)
+    [recovered] = step_functions.run_executions()
+
+    assert recovered['status'] == 'completed' and step_functions.attempts[1] == 2
+
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/b.pdf', Body=b'ANOTHER\f' + '\f'.join(PAGES).encode())
+    failures['page-00006.pdf'] = 5
+    ocr_engine.handle(s3_event('raw_data/2023/itd/b.pdf'), engine)
+    [failed] = step_functions.run_executions()
+
+    assert failed['status'] == 'failed' and 'ThrottlingException' in failed['cause']['Cause']
+    assert step_functions.attempts[2] == 3
+    assert s3.keys(BUCKET, 'processed_data/') == ['processed_data/2023/itd/a.pdf.json']
+    # The job is dropped, the next delivery of the document starts over
+    assert s3.keys(BUCKET, 'ocr_cache/pages/') == [] and engine.jobs.dynamodb.tables['ocr-jobs'] == {}
+    failures['page-00006.pdf'] = 0
+    assert ocr_engine.handle(s3_event('raw_data/2023/itd/b.pdf'), engine)['results'][0]['status'] == 'fanned_out'
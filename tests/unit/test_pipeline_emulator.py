@@ -0,0 +1,100 @@
+import pytest
+
+from benchmarks import bench_pipeline
+from benchmarks.load_generator import synthetic_load
+
+BUCKET = 'project-dev-s3-receptionzone'
+
+TEMPLATE = {'Resources': {
+    'ReceptionBucket': {'Type': 'AWS::S3::Bucket', 'Properties': {'BucketName': BUCKET}},
+    'DedupTable': {'Type': 'AWS::DynamoDB::Table', 'Properties': {'TableName': 'project-dev-dynamodb-checkin-dedup'}},
+    'OcrJobsTable': {'Type': 'AWS::DynamoDB::Table', 'Properties': {'TableName': 'project-dev-dynamodb-ocr-jobs'}},
+    'CompletionTopic': {'Type': 'AWS::SNS::Topic', 'Properties': {}},
+    'CheckinFunction': {'Type': 'AWS::Lambda::Function', 'Properties': {
+        'Handler': 'lambda_checkin_function.handler',
+        'Environment': {'Variables': {'INPUT_DATA_PATH': 'input_data', 'RAW_DATA_PATH': 'raw_data',
+                                      'DEDUP_TABLE_NAME': {'Ref': 'DedupTable'},
+                                      'ROUTING_TABLE': '{"itd":{"content_markers":["TRANSHIPMENT"]}}'}}
+    }},
+    'CheckinQueue': {'Type': 'AWS::SQS::Queue', 'Properties': {'RedrivePolicy': {'maxReceiveCount': 2}}},
+    'CheckinEventSource': {'Type': 'AWS::Lambda::EventSourceMapping', 'Properties': {
+        'EventSourceArn': {'Fn::GetAtt': ['CheckinQueue', 'Arn']}, 'FunctionName': {'Ref': 'CheckinFunction'},
+        'BatchSize': 5, 'MaximumBatchingWindowInSeconds': 5
+    }},
+    'OcrItdFunction': {'Type': 'AWS::Lambda::Function', 'Properties': {
+        'FunctionName': 'lambda_ocr_itd',
+        'Handler': 'lambda_ocr_function.handler',
+        'Environment': {'Variables': {'DOCUMENT_TYPE': 'itd', 'RAW_DATA_PATH': 'raw_data',
+                                      'PROCESSED_DATA_PATH': 'processed_data',
+                                      'OCR_JOBS_TABLE_NAME': {'Ref': 'OcrJobsTable'},
+                                      'TEXTRACT_SNS_TOPIC_ARN': {'Ref': 'CompletionTopic'}}}
+    }},
+    'OcrItdAlias': {'Type': 'AWS::Lambda::Alias', 'Properties': {'FunctionName': {'Ref': 'OcrItdFunction'}}},
+    'OcrItdQueue': {'Type': 'AWS::SQS::Queue', 'Properties': {}},
+    'OcrItdEventSource': {'Type': 'AWS::Lambda::EventSourceMapping', 'Properties': {
+        'EventSourceArn': {'Fn::GetAtt': ['OcrItdQueue', 'Arn']}, 'FunctionName': {'Ref': 'OcrItdAlias'},
+        'BatchSize': 4, 'MaximumBatchingWindowInSeconds': 5, 'ScalingConfig': {'MaximumConcurrency': 2}
+    }},
+    'RouteItd': {'Type': 'AWS::Events::Rule', 'Properties': {
+        'EventPattern': {'source': ['project.reception'], 'detail-type': ['Document Routed'],
+                         'detail': {'document_type': ['itd']}},
+        'Targets': [{'Arn': {'Fn::GetAtt': ['OcrItdQueue', 'Arn']}, 'Id': 'Target0'}]
+    }},
+    'ModelingFunction': {'Type': 'AWS::Lambda::Function', 'Properties': {
+        'Handler': 'lambda_modeling_function.handler',
+        'ReservedConcurrentExecutions': 2,
+        'Environment': {'Variables': {'CONFORMED_BUCKET_NAME': 'project-dev-s3-conformedzone',
+                                      'PARQUET_DATA_PATH': '/test/'}}
+    }},
+    'Notifications': {'Type': 'Custom::S3BucketNotifications', 'Properties': {
+        'BucketName': {'Ref': 'ReceptionBucket'},
+        'NotificationConfiguration': {
+            'QueueConfigurations': [{
+                'Events': ['s3:ObjectCreated:*'], 'QueueArn': {'Fn::GetAtt': ['CheckinQueue', 'Arn']},
+                'Filter': {'Key': {'FilterRules': [{'Name': 'prefix', 'Value': 'input_data/'}]}}
+            }],
+            'LambdaFunctionConfigurations': [{
+                'Events': ['s3:ObjectCreated:*'], 'LambdaFunctionArn': {'Fn::GetAtt': ['ModelingFunction', 'Arn']},
+                'Filter': {'Key': {'FilterRules': [{'Name': 'prefix', 'Value': 'processed_data'}]}}
+            }]
+        }
+    }}
+}}
+
+
+def test_rules_follow_the_template():
+    rules, functions = bench_pipeline.notification_rules(TEMPLATE)
+
+    assert [(rule.prefix, rule.function, rule.queued, rule.batch_size, rule.max_receives) for rule in rules] == [
+        ('processed_data', 'ModelingFunction', False, 1, 3),
+        ('input_data/', 'CheckinFunction', True, 5, 2),
+        ('', 'OcrItdFunction', True, 4, 3)
+    ]
+    assert rules[0].bucket == BUCKET
+    assert rules[2].pattern['detail'] == {'document_type': ['itd']}
+    assert functions['CheckinFunction'].environment['DEDUP_TABLE_NAME'] == 'project-dev-dynamodb-checkin-dedup'
+    assert 'TEXTRACT_SNS_TOPIC_ARN' not in functions['OcrItdFunction'].environment
+    assert functions['ModelingFunction'].concurrency == 2
+    assert (functions['OcrItdFunction'].name, functions['OcrItdFunction'].concurrency) == ('lambda_ocr_itd', 2)
+
+
+def test_emulator_runs_every_document_through_the_stack(monkeypatch):
+    pytest.importorskip('pyarrow')
+    rules, functions = bench_pipeline.notification_rules(TEMPLATE)
+    for name, value in bench_pipeline.merged_environment(functions).items():
+        monkeypatch.setenv(name, value)
+    emulator = bench_pipeline.PipelineEmulator(rules, functions, concurrency=4, window_scale=0.01)
+
+    # Keys without the document type, check-in classifies them by their content
+    uploads = synthetic_load(8, mix={'itd': 1}, years=(2023,), multipage_ratio=0.5, seed=3)
+    result = emulator.run(upload._replace(key=upload.key.replace('/itd/', '/scans/')) for upload in uploads)
+
+    assert (result['documents'], result['completed']) == (8, 8)
+    assert result['stages']['lambda_checkin_function']['records'] == 8
+    assert result['stages']['lambda_ocr_itd']['records'] == 8
+    assert len(emulator.s3.keys(BUCKET, 'raw_data/2023/itd/scans/')) == 8
+    assert result['stages']['lambda_modeling_function']['records'] == 8
+    assert result['stages']['lambda_ocr_itd (textract)']['invocations'] > 0
+    assert len(emulator.s3.keys('project-dev-s3-conformedzone', 'test/year=2023/doctype=itd/')) == 8
+    assert bench_pipeline.regressions(result) == []
+    assert bench_pipeline.regressions(result, baseline={'docs_per_sec': result['docs_per_sec'] * 2})
@@ -0,0 +1,137 @@
+import json
+import threading
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.fakes.local_sparql import LocalSparqlServer
+from tests.lambda_loader import load_function_module
+
+query_proxy = load_function_module('fargate_stack', 'query_proxy', directory='query_proxy')
+
+
+def start_proxy(client):
+    proxy = query_proxy.QueryProxy(client, port=0, host='127.0.0.1')
+    threading.Thread(target=proxy.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return proxy
+
+
+@pytest.fixture
+def stack():
+    with LocalSparqlServer() as upstream:
+        proxy = start_proxy(query_proxy.client_from_url(f"http://127.0.0.1:{upstream.port}"))
+        yield proxy, upstream
+        proxy.shutdown()
+
+
+def post(proxy, path, data, content_type='application/x-www-form-urlencoded'):
+    request = urllib.request.Request(f"http://127.0.0.1:{proxy.port}{path}", data=data, method='POST',
+                                     headers={'Content-Type': content_type})
+    with urllib.request.urlopen(request) as response:
+        return response.headers.get('X-Cache'), json.loads(response.read())
+
+
+def sparql(proxy, query):
+    return post(proxy, '/sparql', urllib.parse.urlencode({'query': query}).encode('utf-8'))
+
+
+def test_normalize_ignores_layout_but_not_literals():
+    first, read_only = query_proxy.normalize('sparql', 'SELECT ?s  WHERE {\n ?s ?p "a  b" . # popular\n}')
+    second, _ = query_proxy.normalize('sparql', 'SELECT ?s WHERE { ?s ?p "a  b" . }')
+
+    assert first == second and read_only
+    assert query_proxy.normalize('sparql', 'SELECT ?s WHERE { ?s ?p "a b" }')[0] != first
+    assert not query_proxy.normalize('sparql', 'DELETE WHERE { ?s ?p ?o }')[1]
+    assert query_proxy.normalize('gremlin', "g.V().has('name', 'drop(').limit(10)")[1]
+    assert not query_proxy.normalize('gremlin', "g.V('1').property('name', 'x')")[1]
+
+
+def test_repeated_reads_are_served_from_cache(stack):
+    proxy, upstream = stack
+
+    assert sparql(proxy, 'SELECT * WHERE { ?s ?p ?o } LIMIT 10')[0] == 'MISS'
+    cache_status, body = sparql(proxy, 'SELECT *  WHERE {?s ?p ?o}   LIMIT 10')
+
+    assert cache_status == 'HIT' and body['query'] == 'SELECT * WHERE { ?s ?p ?o } LIMIT 10'  # the first response
+    assert len(upstream.queries) == 1
+    assert post(proxy, '/gremlin', json.dumps({'gremlin': 'g.V().limit(1)'}).encode(), 'application/json')[0] == 'MISS'
+    assert post(proxy, '/gremlin', json.dumps({'gremlin': 'g.V().limit(1) '}).encode(), 'application/json')[0] == 'HIT'
+
+
+def test_updates_pass_through_and_generation_change_invalidates(stack):
+    proxy, upstream = stack
+    s3 = LocalS3Client()
+    watcher = query_proxy.GenerationWatcher(proxy.cache, s3, 'neptune', 'digest_state/generation.json')
+    # No generation published yet
+    assert watcher.check() is False
+    s3.put_object(Bucket='neptune', Key='digest_state/generation.json', Body=b'1')
+    watcher.check()
+    sparql(proxy, 'SELECT (COUNT(*) AS ?count) WHERE { ?s ?p ?o }')
+
+    update = urllib.parse.urlencode({'update': 'INSERT DATA {\n<urn:a> <urn:b> "c" .\n}'}).encode('utf-8')
+    assert post(proxy, '/sparql', update)[0] is None
+    assert sparql(proxy, 'SELECT (COUNT(*) AS ?count) WHERE { ?s ?p ?o }')[1]['results']['bindings'][0]['count']['value'] == '0'
+
+    s3.put_object(Bucket='neptune', Key='digest_state/generation.json', Body=b'2')
+    assert watcher.check() is True
+    cache_status, body = sparql(proxy, 'SELECT (COUNT(*) AS ?count) WHERE { ?s ?p ?o }')
+    assert cache_status == 'MISS' and body['results']['bindings'][0]['count']['value'] == '1'
+
+
+def test_cache_is_bounded_and_expires():
+    now = [0.0]
+    cache = query_proxy.QueryCache(max_bytes=1000, ttl_seconds=10, clock=lambda: now[0])
+    response = (200, [], b'x' * 200)
+
+    for i in range(5):
+        cache.put(('sparql', f"q{i}", ''), response)
+    assert cache.bytes <= 1000 and cache.get(('sparql', 'q0', '')) is None
+    assert cache.get(('sparql', 'q4', '')) == response
+
+    now[0] = 11
+    assert cache.get(('sparql', 'q4', '')) is None
+    stats = cache.snapshot()
+    assert stats['evictions'] == 3 and stats['expirations'] == 1 and stats['hits'] == 1
+
+
+def test_metrics_report_hit_rate_and_latency(stack):
+    proxy, _ = stack
+    for _ in range(4):
+        sparql(proxy, 'SELECT ?s WHERE { ?s ?p ?o }')
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{proxy.port}/proxy/metrics") as response:
+        metrics = json.loads(response.read())
+
+    assert metrics['hit_rate'] == 0.75
+    assert metrics['hit_p50_ms'] > 0 and metrics['miss_p99_ms'] >= metrics['hit_p50_ms']
+    assert metrics['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'GraphExplorer/QueryProxy'
+
+
+class FakeSSM:
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_parameters(self, Names):
+        return {'Parameters': [{'Name': name, 'Value': self.values[name]} for name in Names if name in self.values]}
+
+
+def test_reads_go_to_readers_and_writes_to_the_writer():
+    with LocalSparqlServer() as writer, LocalSparqlServer() as reader_a, LocalSparqlServer() as reader_b:
+        client = query_proxy.neptune_client.NeptuneClient('127.0.0.1:1', use_tls=False)
+        ssm = FakeSSM({'/w': f"127.0.0.1:{writer.port}", '/r': f"127.0.0.1:{reader_a.port},127.0.0.1:{reader_b.port}",
+                       '/p': '8182'})
+        resolver = query_proxy.EndpointResolver(ssm, '/w', '/r', '/p')
+        assert resolver.refresh(client) is True and resolver.refresh(client) is False
+        proxy = start_proxy(client)
+        try:
+            for i in range(4):
+                sparql(proxy, f"SELECT ?s WHERE {{ ?s ?p {i} }}")
+            post(proxy, '/sparql', urllib.parse.urlencode({'update': 'INSERT DATA {\n<urn:a> <urn:b> "c" .\n}'}).encode())
+        finally:
+            proxy.shutdown()
+
+        assert len(reader_a.queries) == 2 and len(reader_b.queries) == 2
+        assert writer.queries == [] and len(writer.triples) == 1
@@ -0,0 +1,59 @@
+import pytest
+
+core = pytest.importorskip('aws_cdk')
+assertions = pytest.importorskip('aws_cdk.assertions')
+
+from benchmarks.bench_pipeline import notification_rules
+from repository.stacks.reception_modeling_zone_stack.reception_modeling_zone_stack import ReceptionAndModelingZoneStack
+from tools.synth_profile import ROOT_PATH, synth_context
+
+
+# The pipeline emulator routes objects and documents with the rules of the synthesized stack
+def test_notification_rules_of_the_reception_stack():
+    app = core.App(context=synth_context(ROOT_PATH))
+    stack = ReceptionAndModelingZoneStack(app, 'ReceptionAndModelingZoneStack')
+
+    rules, functions = notification_rules(assertions.Template.from_stack(stack).to_json())
+
+    routes = {rule.prefix: functions[rule.function].module for rule in rules if rule.pattern is None}
+    assert routes == {'input_data': 'lambda_checkin_function', 'processed_data': 'lambda_modeling_function'}
+    assert all(rule.bucket == 'project-dev-s3-receptionzone' for rule in rules if rule.pattern is None)
+
+    # One EventBridge route and OCR function per document type of the routing table
+    document_routes = {rule.pattern['detail']['document_type'][0]: functions[rule.function]
+                       for rule in rules if rule.pattern is not None}
+    assert sorted(document_routes) == ['ebcd', 'form4e', 'itd']
+    itd = document_routes['itd']
+    assert (itd.name, itd.module, itd.concurrency) == ('lambda_ocr_itd', 'lambda_ocr_function', 5)
+    assert itd.environment['DOCUMENT_TYPE'] == 'itd'
+
+
+def role_statements(template, function_name):
+    resources = template['Resources']
+    function = next(resource for resource in resources.values() if resource['Type'] == 'AWS::Lambda::Function'
+                    and resource['Properties'].get('FunctionName') == function_name)
+    role = function['Properties']['Role']['Fn::GetAtt'][0]
+    return [statement for resource in resources.values() if resource['Type'] == 'AWS::IAM::Policy'
+            and {'Ref': role} in resource['Properties']['Roles']
+            for statement in resource['Properties']['PolicyDocument']['Statement']]
+
+
+def object_patterns(statements, action):
+    patterns = set()
+    for statement in statements:
+        actions = statement['Action'] if isinstance(statement['Action'], list) else [statement['Action']]
+        resources = statement['Resource'] if isinstance(statement['Resource'], list) else [statement['Resource']]
+        if action in actions:
+            patterns.update(resource['Fn::Join'][1][-1] for resource in resources if 'Fn::Join' in resource)
+    return patterns
+
+
+# The move verifies the copy with HeadObject, which needs s3:GetObject on the raw prefix
+def test_checkin_can_read_back_the_documents_it_moves():
+    app = core.App(context=synth_context(ROOT_PATH))
+    stack = ReceptionAndModelingZoneStack(app, 'ReceptionAndModelingZoneStack')
+
+    statements = role_statements(assertions.Template.from_stack(stack).to_json(), 'lambda_checkin_function')
+
+    assert {'/input_data/*', '/raw_data/*'} <= object_patterns(statements, 's3:GetObject*')
+    assert '/input_data/*' in object_patterns(statements, 's3:DeleteObject*')
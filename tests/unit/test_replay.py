@@ -0,0 +1,107 @@
+import json
+import urllib.parse
+
+import pytest
+
+from tests.fakes.local_s3 import LocalS3Client
+from tests.lambda_loader import load_function_module
+from tools import replay
+
+BUCKET = 'project-dev-s3-receptionzone'
+
+
+class RecordingHandler:
+
+    def __init__(self, failing_keys=()):
+        self.keys = []
+        self.failing_keys = set(failing_keys)
+
+    def __call__(self, event, context):
+        failures = []
+        for message in event['Records']:
+            [record] = json.loads(message['body'])['Records']
+            key = urllib.parse.unquote_plus(record['s3']['object']['key'])
+            self.keys.append(key)
+            if key in self.failing_keys:
+                failures.append({'itemIdentifier': message['messageId']})
+        return {'batchItemFailures': failures}
+
+
+def populate(s3, count):
+    keys = [f"raw_data/2023/itd/doc {i:04d}.pdf" for i in range(count)]
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'pdf')
+    s3.put_object(Bucket=BUCKET, Key='raw_data/2023/itd/', Body=b'')
+    return keys
+
+
+def test_replay_resumes_from_checkpoint(tmp_path):
+    s3 = LocalS3Client()
+    keys = populate(s3, 95)
+    checkpoint = str(tmp_path / 'replay.json')
+    handler = RecordingHandler(failing_keys=['raw_data/2023/itd/doc 0042.pdf'])
+
+    def new_replay():
+        return replay.Replay(s3, replay.LocalDispatcher(handler), BUCKET, 'raw_data/2023/itd/', 'ocr-itd',
+                             checkpoint_path=checkpoint, workers=4, batch_size=10, page_size=7)
+
+    interrupted = new_replay().run(max_batches=3)
+    assert interrupted['done'] is False
+    assert interrupted['watermark'] == keys[29]
+    assert sorted(handler.keys) == keys[:30]
+
+    finished = new_replay().run()
+    assert finished['done'] is True
+    assert finished['processed'] == 95
+    assert finished['failed_keys'] == ['raw_data/2023/itd/doc 0042.pdf']
+    assert sorted(handler.keys) == keys
+
+
+def test_checkpoint_rejects_other_replay(tmp_path):
+    s3 = LocalS3Client()
+    populate(s3, 3)
+    checkpoint = str(tmp_path / 'replay.json')
+    replay.Replay(s3, replay.LocalDispatcher(RecordingHandler()), BUCKET, 'raw_data/', 'checkin',
+                  checkpoint_path=checkpoint).run()
+
+    try:
+        replay.Checkpoint(checkpoint, BUCKET, 'raw_data/', 'modeling')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('checkpoint of another stage was accepted')
+
+
+def test_failed_documents_of_the_modeling_handler_are_recorded(monkeypatch):
+    pytest.importorskip('pyarrow')
+    modeling = load_function_module('reception_modeling_zone_stack', 'lambda_modeling_function')
+    s3 = LocalS3Client()
+    modeling.handler_runtime.register_client('s3', s3)
+    monkeypatch.setenv('CONFORMED_BUCKET_NAME', 'conformed')
+    monkeypatch.setenv('PARQUET_DATA_PATH', '/test/')
+
+    document = {'document_type': 'itd', 'pages': 1, 'blocks': [{'BlockType': 'LINE', 'Text': 'CATCH', 'Page': 1}]}
+    for name in ('a', 'b', 'c'):
+        s3.put_object(Bucket=BUCKET, Key=f"processed_data/2023/itd/{name}.pdf.json", Body=json.dumps(document))
+    s3.put_object(Bucket=BUCKET, Key='processed_data/2023/itd/b.pdf.json', Body=b'{truncated')
+
+    state = replay.Replay(s3, replay.LocalDispatcher(modeling.handler), BUCKET, 'processed_data/', 'modeling',
+                          batch_size=10).run()
+
+    assert state['processed'] == 3 and state['failed_keys'] == ['processed_data/2023/itd/b.pdf.json']
+    assert len(s3.keys('conformed', 'test/year=2023/doctype=itd/')) == 1
+
+
+def test_a_failed_digest_fails_every_key_of_the_batch():
+    def digest(event, context):
+        assert 'eventSource' not in event['Records'][0]  # the digest only loads the objects of direct notifications
+        raise RuntimeError('Neptune bulk load failed')
+
+    s3 = LocalS3Client()
+    s3.put_object(Bucket=BUCKET, Key='test/year=2023/doctype=itd/part-1.parquet', Body=b'PAR1')
+    s3.put_object(Bucket=BUCKET, Key='test/year=2023/doctype=itd/part-2.parquet', Body=b'PAR1')
+
+    state = replay.Replay(s3, replay.LocalDispatcher(digest), BUCKET, 'test/', 'digest').run()
+
+    assert state['failed_keys'] == ['test/year=2023/doctype=itd/part-1.parquet',
+                                    'test/year=2023/doctype=itd/part-2.parquet']
@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip('aws_cdk')
+
+from repository.stacks.neptune_stack.neptune_stack import sizing_profile
+
+PROFILES = {
+    'dev': {'writer_instance_class': 'db.t3.medium', 'min_replicas': 1},
+    'prod': {'writer_instance_class': 'db.r5.large', 'reader_instance_class': 'db.r5.xlarge', 'min_replicas': 1, 'max_replicas': 5}
+}
+
+
+def test_profile_follows_the_environment_prefix():
+    dev = sizing_profile({'sizing_profiles': PROFILES}, 'dev')
+
+    assert dev['reader_instance_class'] == 'db.t3.medium'
+    assert (dev['min_replicas'], dev['max_replicas']) == (1, 1)
+    assert sizing_profile({'sizing_profiles': PROFILES, 'sizing_profile': 'prod'}, 'dev')['max_replicas'] == 5
+
+
+def test_invalid_profiles_fail_the_synth():
+    with pytest.raises(ValueError):
+        sizing_profile({'sizing_profiles': PROFILES}, 'staging')
+    with pytest.raises(ValueError):
+        sizing_profile({'sizing_profiles': {'dev': {'min_replicas': 3, 'max_replicas': 2}}}, 'dev')
@@ -0,0 +1,72 @@
+import pytest
+
+from tests.fakes.local_sparql import LocalSparqlServer
+from tests.lambda_loader import load_function_module
+
+
+def triples(count):
+    return [(f"<urn:project:document/{i}>", '<urn:project:documentName>', f'"doc {i}"') for i in range(count)]
+
+
+def writer_for(server, **kwargs):
+    writer_module = load_function_module('neptune_stack', 'sparql_writer')
+    neptune_client = load_function_module('neptune_stack', 'neptune_client')
+    session = neptune_client.HttpSession('127.0.0.1', server.port, use_tls=False)
+    return writer_module, writer_module.SparqlWriter(session, sleep=lambda s: None, **kwargs)
+
+
+def test_batches_are_size_bounded():
+    writer_module = load_function_module('neptune_stack', 'sparql_writer')
+    line = len('<urn:project:document/0> <urn:project:documentName> "doc 0" .\n')
+
+    sizes = [len(batch) for batch in writer_module.batches(triples(10), max_bytes=line * 4)]
+
+    assert sizes == [4, 4, 2]
+    assert [len(b) for b in writer_module.batches(triples(10), max_triples=3)] == [3, 3, 3, 1]
+
+
+def test_insert_reuses_one_connection():
+    with LocalSparqlServer() as server:
+        _, writer = writer_for(server, max_triples=100)
+
+        first = writer.insert(triples(250))
+        second = writer.insert(triples(300)[250:])
+
+        assert first == {'triples': 250, 'requests': 3, 'retries': 0}
+        assert second['requests'] == 1
+        assert len(server.triples) == 300
+        assert server.connections == 1
+
+
+def test_contention_and_throttling_are_retried():
+    with LocalSparqlServer() as server:
+        server.fail_next('ConcurrentModificationException', 'ThrottlingException')
+        _, writer = writer_for(server)
+
+        stats = writer.insert(triples(5))
+
+        assert stats['retries'] == 2
+        assert len(server.triples) == 5
+
+
+def test_other_errors_are_not_retried():
+    with LocalSparqlServer() as server:
+        server.fail_next('MalformedQueryException')
+        writer_module, writer = writer_for(server)
+
+        with pytest.raises(writer_module.SparqlUpdateError) as error:
+            writer.insert(triples(5))
+
+        assert error.value.status == 400
+        assert server.requests == 1
+
+
+def test_retries_are_bounded():
+    with LocalSparqlServer() as server:
+        server.fail_next(*['ConcurrentModificationException'] * 3)
+        writer_module, writer = writer_for(server, max_retries=2)
+
+        with pytest.raises(writer_module.SparqlUpdateError):
+            writer.insert(triples(5))
+
+        assert server.requests == 3
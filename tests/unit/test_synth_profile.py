@@ -0,0 +1,38 @@
+import pytest
+
+from tools import synth_profile
+
+REPORT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     jsii._embedded
+import time:       300 |       2420 |   jsii
+import time:      5000 |      90000 | aws_cdk
+import time:       800 |        800 | constructs
+"""
+
+
+def test_importtime_report_is_parsed_with_nesting():
+    rows = synth_profile.parse_importtime(REPORT)
+
+    assert rows[0] == ('jsii._embedded', 2, 120, 120)
+    assert [(module, depth) for module, depth, _, _ in rows[1:]] == [('jsii', 1), ('aws_cdk', 0), ('constructs', 0)]
+
+
+def test_synth_context_merges_the_lookups():
+    context = synth_profile.synth_context(synth_profile.ROOT_PATH)
+
+    assert context['properties']['env_prefix'] == 'dev'
+    assert 'availability-zones:account=123456789012:region=eu-west-1' in context
+
+
+def test_the_report_of_a_finished_synth_is_checked_against_the_budget(tmp_path, monkeypatch, capsys):
+    report = tmp_path / 'synth-importtime.log'
+    report.write_text('Synthesizing the app\n' + REPORT)
+    monkeypatch.setattr(synth_profile, 'run_synth', lambda root_path: pytest.fail('the app ran again'))
+
+    monkeypatch.setattr('sys.argv', ['synth_profile', '--report', str(report), '--budget-seconds', '0.05'])
+    with pytest.raises(SystemExit):
+        synth_profile.main()
+    monkeypatch.setattr('sys.argv', ['synth_profile', '--report', str(report), '--budget-seconds', '1'])
+    synth_profile.main()
+
+    assert 'imports 0.09s\n' in capsys.readouterr().out
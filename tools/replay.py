@@ -0,0 +1,312 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+BULK REPLAY / BACKFILL
+Lists every object under a bucket prefix (paginated ListObjectsV2) and pushes
+the keys through the handler of one pipeline stage as synthetic events, with
+bounded parallelism and a rate limit. Progress is checkpointed to a local
+JSON file so an interrupted backfill resumes after the last fully processed key.
+
+    python -m tools.replay --bucket project-dev-s3-receptionzone \
+        --prefix raw_data/2023/itd/ --stage ocr-itd --workers 8 --rate 50 \
+        --checkpoint replay-itd-2023.json
+'''
+
+STAGE_FUNCTIONS = {
+    "checkin": "lambda_checkin_function",
+    "modeling": "lambda_modeling_function",
+    "digest": "digest_function"
+}
+# One OCR stage per document type of the routing table: ocr-<document type> runs lambda_ocr_<document type>
+OCR_STAGE_PREFIX = "ocr-"
+# The digest only loads the objects named by direct S3 notifications (a queued event starts an incremental run)
+DIRECT_STAGES = {"digest"}
+
+
+def stage_function(stage):
+    if stage.startswith(OCR_STAGE_PREFIX) and len(stage) > len(OCR_STAGE_PREFIX):
+        return "lambda_ocr_" + stage[len(OCR_STAGE_PREFIX):]
+    if stage not in STAGE_FUNCTIONS:
+        raise argparse.ArgumentTypeError(f"unknown stage {stage} ({', '.join(sorted(STAGE_FUNCTIONS))} or ocr-<document type>)")
+    return STAGE_FUNCTIONS[stage]
+
+
+def stage_name(value):
+    stage_function(value)
+    return value
+
+
+def s3_event(bucket, objects):
+    return {"Records": [{
+        "eventVersion": "2.1",
+        "eventSource": "aws:s3",
+        "eventName": "ObjectCreated:Replay",
+        "s3": {
+            "bucket": {"name": bucket},
+            "object": {
+                "key": urllib.parse.quote_plus(obj["Key"], safe="/"),
+                "size": obj.get("Size"),
+                "eTag": (obj.get("ETag") or "").strip('"')
+            }
+        }
+    } for obj in objects]}
+
+
+'''
+ONE SQS MESSAGE PER OBJECT, AS THE QUEUE OF THE STAGE DELIVERS THEM
+Every message is named after its key, so the batchItemFailures of the
+response are the failed keys
+'''
+def queued_event(bucket, objects):
+    return {"Records": [{
+        "eventSource": "aws:sqs",
+        "messageId": obj["Key"],
+        "body": json.dumps(s3_event(bucket, [obj]))
+    } for obj in objects]}
+
+
+def stage_event(stage, bucket, objects):
+    if stage in DIRECT_STAGES:
+        return s3_event(bucket, objects)
+    return queued_event(bucket, objects)
+
+
+def event_keys(event):
+    return [record["messageId"] if record.get("eventSource") == "aws:sqs"
+            else urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+            for record in event["Records"]]
+
+
+'''
+KEYS THE STAGE REPORTED FAILED
+Queued check-in, OCR and modeling report the messages they failed as
+batchItemFailures; direct events, the digest's, fail as a whole by raising
+'''
+def failed_keys_from_result(event, result):
+    if not isinstance(result, dict):
+        return []
+    failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+    return [key for key in event_keys(event) if key in failed]
+
+
+'''
+DISPATCHERS
+A dispatcher sends one event to a stage and returns the keys that failed
+'''
+class LambdaDispatcher:
+
+    def __init__(self, lambda_client, function_name):
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def __call__(self, event):
+        response = self.lambda_client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="RequestResponse",
+            Payload=json.dumps(event).encode("utf-8")
+        )
+        payload = response["Payload"].read()
+        if response.get("FunctionError"):
+            return event_keys(event)
+        return failed_keys_from_result(event, json.loads(payload or b"null"))
+
+
+class LocalDispatcher:
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def __call__(self, event):
+        try:
+            result = self.handler(event, None)
+        except Exception as error:
+            print(f"Handler failed: {error}")
+            return event_keys(event)
+        return failed_keys_from_result(event, result)
+
+
+class RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval * count
+        if wait > 0:
+            time.sleep(wait)
+
+
+'''
+CHECKPOINT
+The watermark is the last key such that it and every key before it has been
+dispatched; batches complete out of order so it only advances over a
+contiguous run of finished batches.
+'''
+class Checkpoint:
+
+    def __init__(self, path, bucket, prefix, stage):
+        self.path = path
+        self.state = {"bucket": bucket, "prefix": prefix, "stage": stage,
+                      "watermark": "", "processed": 0, "failed_keys": [], "done": False}
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            for field in ("bucket", "prefix", "stage"):
+                if saved.get(field) != self.state[field]:
+                    raise ValueError(f"Checkpoint {path} belongs to another replay ({field}={saved.get(field)})")
+            self.state.update(saved)
+
+    @property
+    def watermark(self):
+        return self.state["watermark"]
+
+    def advance(self, last_key, processed, failed_keys):
+        self.state["watermark"] = last_key
+        self.state["processed"] += processed
+        self.state["failed_keys"].extend(failed_keys)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Replay:
+
+    def __init__(self, s3, dispatcher, bucket, prefix, stage, checkpoint_path=None,
+                 workers=4, rate=0.0, batch_size=10, page_size=1000, checkpoint_every=10):
+        self.s3 = s3
+        self.dispatcher = dispatcher
+        self.bucket = bucket
+        self.prefix = prefix
+        self.stage = stage
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.page_size = page_size
+        self.checkpoint_every = checkpoint_every
+        self.rate_limiter = RateLimiter(rate)
+        self.checkpoint = Checkpoint(checkpoint_path, bucket, prefix, stage)
+
+        self._lock = threading.Lock()
+        self._results = {}
+        self._next_to_commit = 0
+        self._commits = 0
+
+    def iter_batches(self):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        batch = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix,
+                                       StartAfter=self.checkpoint.watermark,
+                                       PaginationConfig={"PageSize": self.page_size}):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith("/"):
+                    continue
+                batch.append(obj)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _dispatch(self, index, batch):
+        self.rate_limiter.acquire(len(batch))
+        try:
+            failed = self.dispatcher(stage_event(self.stage, self.bucket, batch))
+        except Exception as error:
+            print(f"Dispatch of batch {index} failed: {error}")
+            failed = [obj["Key"] for obj in batch]
+        self._complete(index, batch, failed)
+
+    def _complete(self, index, batch, failed):
+        with self._lock:
+            self._results[index] = (batch[-1]["Key"], len(batch), failed)
+            while self._next_to_commit in self._results:
+                last_key, processed, failed_keys = self._results.pop(self._next_to_commit)
+                self.checkpoint.advance(last_key, processed, failed_keys)
+                self._next_to_commit += 1
+                self._commits += 1
+                if self._commits % self.checkpoint_every == 0:
+                    self.checkpoint.save()
+
+    def run(self, max_batches=None):
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        started = time.perf_counter()
+        listed_everything = True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for index, batch in enumerate(self.iter_batches()):
+                if max_batches is not None and index >= max_batches:
+                    listed_everything = False
+                    break
+                in_flight.acquire()
+                future = pool.submit(self._dispatch, index, batch)
+                future.add_done_callback(lambda _: in_flight.release())
+
+        with self._lock:
+            self.checkpoint.state["done"] = listed_everything
+            self.checkpoint.save()
+
+        elapsed = time.perf_counter() - started
+        state = self.checkpoint.state
+        print(json.dumps({
+            "processed": state["processed"],
+            "failed": len(state["failed_keys"]),
+            "watermark": state["watermark"],
+            "done": state["done"],
+            "seconds": round(elapsed, 3)
+        }))
+        return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay objects under a prefix through a pipeline stage")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--prefix", required=True)
+    parser.add_argument("--stage", required=True, type=stage_name,
+                        help=f"{', '.join(sorted(STAGE_FUNCTIONS))} or ocr-<document type>")
+    parser.add_argument("--function-name", help="override the deployed function name of the stage")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="max objects per second, 0 for unlimited")
+    parser.add_argument("--batch-size", type=int, default=10, help="objects per invocation")
+    parser.add_argument("--checkpoint", help="checkpoint file, resumed when it exists")
+    args = parser.parse_args()
+
+    import boto3
+    from botocore.config import Config
+
+    # Stage functions run for up to 10 minutes, keep the synchronous invoke open for that long
+    lambda_client = boto3.client("lambda", config=Config(read_timeout=900, retries={"max_attempts": 0}))
+    dispatcher = LambdaDispatcher(lambda_client, args.function_name or stage_function(args.stage))
+
+    Replay(
+        boto3.client("s3"),
+        dispatcher,
+        bucket=args.bucket,
+        prefix=args.prefix,
+        stage=args.stage,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        rate=args.rate,
+        batch_size=args.batch_size
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
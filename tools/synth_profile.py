@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+'''
+SYNTH IMPORT-TIME PROFILE
+Runs app.py under `python -X importtime` with the context of cdk.json (and
+cdk.context.json), the way `cdk synth` does but without bundling assets, and prints the modules that took
+longest to load with their cumulative time. With --budget-seconds the exit
+code is 1 when the imports alone go over the budget, so the Synth step can
+fail on a regression. With --report the app is not run again: the report is
+read from the stderr of a synth that ran with PYTHONPROFILEIMPORTTIME=1.
+
+    python -m tools.synth_profile --top 25 --budget-seconds 20
+    PYTHONPROFILEIMPORTTIME=1 cdk synth 2> importtime.log
+    python -m tools.synth_profile --report importtime.log --budget-seconds 20
+'''
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synth_context(root_path):
+    context = {}
+    with open(os.path.join(root_path, "cdk.json")) as cdk_json:
+        context.update(json.load(cdk_json).get("context", {}))
+    context_path = os.path.join(root_path, "cdk.context.json")
+    if os.path.exists(context_path):
+        with open(context_path) as cdk_context:
+            context.update(json.load(cdk_context))
+    #ASSET BUNDLING (DOCKER) IS SKIPPED, ONLY THE APP ITSELF IS PROFILED
+    context["aws:cdk:bundling-stacks"] = []
+    return context
+
+
+'''
+PARSE THE -X importtime REPORT INTO (module, depth, self_us, cumulative_us) ROWS
+Lines look like "import time:       201 |       3521 |   aws_cdk.aws_ec2", nesting
+is given by two spaces of indentation per level.
+'''
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((module, depth, self_us, cumulative_us))
+    return rows
+
+
+def run_synth(root_path):
+    with tempfile.TemporaryDirectory() as outdir:
+        env = {
+            **os.environ,
+            "CDK_CONTEXT_JSON": json.dumps(synth_context(root_path)),
+            "CDK_OUTDIR": outdir
+        }
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "app.py"],
+                                cwd=root_path, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+    if result.returncode:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f"app.py exited with {result.returncode}")
+    return parse_importtime(result.stderr), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--prefix", nargs="*", default=[], help="only report modules starting with these prefixes")
+    parser.add_argument("--budget-seconds", type=float)
+    parser.add_argument("--report", help="importtime report of a synth that already ran")
+    args = parser.parse_args()
+
+    if args.report:
+        with open(args.report) as report:
+            rows, elapsed = parse_importtime(report.read()), None
+    else:
+        rows, elapsed = run_synth(ROOT_PATH)
+    imports_seconds = sum(cumulative for _, depth, _, cumulative in rows if depth == 0) / 1e6
+
+    selected = [row for row in rows if not args.prefix or row[0].startswith(tuple(args.prefix))]
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for module, _, self_us, cumulative_us in sorted(selected, key=lambda row: -row[3])[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {module}")
+    print(f"imports {imports_seconds:.2f}s" + (f", synth {elapsed:.2f}s" if elapsed is not None else ""))
+
+    if args.budget_seconds is not None and imports_seconds > args.budget_seconds:
+        print(f"imports took {imports_seconds:.2f}s, over the {args.budget_seconds:.2f}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import json
+import math
+import sys
+
+'''
+DOCUMENT TRACE REPORT
+Rebuilds the timeline of every document from the span lines the stages log
+(see handler_runtime.trace_span) and prints the p50/p99 of each stage and of
+the end-to-end latency, the numbers of the DocumentTrace dashboard. Reads log
+files, or stdin, as written by `aws logs tail` (one event per line) or by
+`aws logs filter-log-events` (JSON).
+
+    aws logs tail /aws/lambda/<function> --since 1h > checkin.log
+    python -m tools.trace_report checkin.log ocr.log modeling.log digest.log --slowest 5
+'''
+
+STAGES = ('checkin', 'ocr', 'modeling', 'digest')
+END_TO_END = 'end-to-end'
+
+
+def log_messages(text):
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return text.splitlines()
+    if isinstance(payload, dict) and 'events' in payload:
+        return [event.get('message', '') for event in payload['events']]
+    return text.splitlines()
+
+
+'''
+KEEP THE SPAN LINES, WHATEVER PREFIX (TIMESTAMP, LOG STREAM) THE EXPORT ADDED
+'''
+def parse_spans(messages):
+    spans = []
+    for message in messages:
+        start = message.find('{')
+        if start < 0:
+            continue
+        try:
+            payload = json.loads(message[start:])
+        except ValueError:
+            continue
+        if isinstance(payload, dict) and payload.get('TraceId') and payload.get('Stage'):
+            spans.append(payload)
+    return spans
+
+
+def timelines(spans):
+    traces = {}
+    for span in spans:
+        traces.setdefault(span['TraceId'], []).append(span)
+    for trace_spans in traces.values():
+        trace_spans.sort(key=lambda span: span['Enter'])
+    return traces
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+'''
+STAGE -> (count, p50, p99) OF StageDuration, AND THE END-TO-END LATENCY
+(Elapsed at the digest stage)
+'''
+def stage_summary(spans):
+    durations = {}
+    for span in spans:
+        durations.setdefault(span['Stage'], []).append(span['StageDuration'])
+    end_to_end = [span['Elapsed'] for span in spans if span['Stage'] == STAGES[-1] and span.get('Elapsed') is not None]
+
+    stages = [stage for stage in STAGES if stage in durations] + sorted(set(durations) - set(STAGES))
+    summary = {stage: (len(durations[stage]), percentile(durations[stage], 50), percentile(durations[stage], 99))
+               for stage in stages}
+    if end_to_end:
+        summary[END_TO_END] = (len(end_to_end), percentile(end_to_end, 50), percentile(end_to_end, 99))
+    return summary
+
+
+'''
+ONE LINE PER STAGE: START SINCE THE UPLOAD, WAIT SINCE THE PREVIOUS STAGE, DURATION
+'''
+def describe_timeline(trace_id, trace_spans):
+    start = next((span['TraceStart'] for span in trace_spans if span.get('TraceStart') is not None),
+                 trace_spans[0]['Enter'])
+    lines = [f"trace {trace_id}"]
+    previous_exit = start
+    for span in trace_spans:
+        lines.append(f"  {span['Stage']:<10} +{(span['Enter'] - start) / 1000:>9.3f}s "
+                     f"wait {(span['Enter'] - previous_exit) / 1000:>8.3f}s "
+                     f"took {span['StageDuration'] / 1000:>8.3f}s  {span.get('Key')}")
+        previous_exit = max(previous_exit, span['Exit'])
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('logs', nargs='*', help='log files, stdin when omitted')
+    parser.add_argument('--slowest', type=int, default=0, help='print the timelines of the N slowest documents')
+    parser.add_argument('--trace', action='append', default=[], help='print the timeline of this trace id')
+    args = parser.parse_args()
+
+    messages = []
+    if args.logs:
+        for path in args.logs:
+            with open(path) as log:
+                messages.extend(log_messages(log.read()))
+    else:
+        messages.extend(log_messages(sys.stdin.read()))
+
+    spans = parse_spans(messages)
+    traces = timelines(spans)
+
+    print(f"{'stage':<12} {'count':>7} {'p50 ms':>10} {'p99 ms':>10}")
+    for stage, (count, p50, p99) in stage_summary(spans).items():
+        print(f"{stage:<12} {count:>7} {p50:>10} {p99:>10}")
+
+    slowest = sorted(
+        (trace_id for trace_id, trace_spans in traces.items()
+         if trace_spans[-1]['Stage'] == STAGES[-1] and trace_spans[-1].get('Elapsed') is not None),
+        key=lambda trace_id: -traces[trace_id][-1]['Elapsed']
+    )[:args.slowest]
+    for trace_id in slowest + [trace_id for trace_id in args.trace if trace_id in traces]:
+        print('\n'.join(describe_timeline(trace_id, traces[trace_id])))
+
+
+if __name__ == '__main__':
+    main()